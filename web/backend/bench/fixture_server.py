@@ -0,0 +1,121 @@
+"""
+离线基准测试用的本地替身服务器：按路径返回 bench/fixtures 中保存的 Property Guru / 99.co 页面，图片请求返回占位 PNG。
+用法（单独启动，配合 SCRAPE_UPSTREAM_OVERRIDES 手动调试）：
+  python bench/fixture_server.py --port 8765 --latency-ms 50
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 替身服务器代替的上游站点（页面 + 图片 CDN）
+UPSTREAM_HOSTS = ["www.propertyguru.com.sg", "sg1-cdn.pgimgs.com", "www.99.co", "pic2.99.co"]
+
+# 1x1 透明 PNG
+_PLACEHOLDER_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c63000100000500010d0a2db40000000049454e44ae426082"
+)
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    latency = 0.0  # 每个请求的模拟网络延迟（秒）
+
+    def do_GET(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        path = urlsplit(self.path).path
+        if path.lower().endswith(_IMAGE_EXTS):
+            self._send(200, "image/png", _PLACEHOLDER_PNG)
+            return
+        parts = [p for p in path.split("/") if p]
+        file_path = None
+        if len(parts) == 2 and parts[0] == "listing":
+            file_path = os.path.join(FIXTURES_DIR, "propertyguru", parts[1] + ".html")
+        elif len(parts) == 3 and parts[:2] == ["singapore", "condos-apartments"]:
+            file_path = os.path.join(FIXTURES_DIR, "99co", parts[2] + ".html")
+        if file_path and os.path.isfile(file_path):
+            self._send_page(file_path)
+        else:
+            self._send(404, "text/html; charset=utf-8", b"<html><body><h1>Not Found</h1></body></html>")
+
+    def _send_page(self, file_path: str) -> None:
+        """页面带 ETag / Last-Modified，并像真实站点一样对条件请求返回 304（增量刷新用）"""
+        with open(file_path, "rb") as f:
+            body = f.read()
+        mtime = int(os.path.getmtime(file_path))
+        validators = {
+            "ETag": f'"{hashlib.sha1(body).hexdigest()[:16]}"',
+            "Last-Modified": formatdate(mtime, usegmt=True),
+        }
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_none_match is not None:
+            not_modified = validators["ETag"] in [t.strip() for t in if_none_match.split(",")]
+        elif if_modified_since:
+            try:
+                not_modified = mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                not_modified = False
+        else:
+            not_modified = False
+        if not_modified:
+            self._send(304, None, b"", validators)
+        else:
+            self._send(200, "text/html; charset=utf-8", body, validators)
+
+    def _send(self, status: int, content_type: Optional[str], body: bytes, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def start_fixture_server(port: int = 0, latency_ms: float = 0) -> tuple[ThreadingHTTPServer, str]:
+    """在后台线程启动替身服务器，返回 (server, origin)；port 为 0 时自动选择空闲端口"""
+    handler = type("Handler", (FixtureHandler,), {"latency": latency_ms / 1000})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def upstream_overrides(origin: str) -> str:
+    """SCRAPE_UPSTREAM_OVERRIDES 的取值：把所有上游站点指向替身服务器"""
+    return ",".join(f"{host}={origin}" for host in UPSTREAM_HOSTS)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Property Guru / 99.co 本地替身服务器")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的模拟网络延迟（毫秒）")
+    args = parser.parse_args()
+    server, origin = start_fixture_server(args.port, args.latency_ms)
+    print(f"替身服务器已启动: {origin}", file=sys.stderr)
+    print(f"SCRAPE_UPSTREAM_OVERRIDES={upstream_overrides(origin)}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+抓取服务压测：用 uvicorn 在子进程中启动服务（上游指向本地替身服务器），按泊松到达以逐级提高的请求速率
+混合调用单个抓取、批量抓取与 site plan 接口，统计每一级的吞吐、尾延迟、错误率，并轮询 /metrics
+记录峰值 RSS 与 Chromium 进程数，最后给出容量报告（可支撑的请求速率与所需内存），用于选择 Render 实例规格。
+
+用法（在 web/backend 目录下）：
+  python bench/load_test.py                                   # 速率 0.5,1,2,4,8 req/s，每级 30 秒
+  python bench/load_test.py --rates 1,2,4 --duration 60 --latency-ms 300
+  python bench/load_test.py --mix single=6,batch=1,site_plan=3
+  SCRAPE_MAX_CONCURRENCY=4 python bench/load_test.py           # 服务端配置通过环境变量透传
+  python bench/load_test.py --target http://127.0.0.1:8000    # 压测已启动的服务（需自行配置 SCRAPE_UPSTREAM_OVERRIDES）
+
+结果写入 bench/results/load.json 与 bench/results/capacity.md。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_server import start_fixture_server, upstream_overrides  # noqa: E402
+from run_bench import percentile  # noqa: E402
+
+MANIFEST_PATH = os.path.join(BENCH_DIR, "fixtures", "manifest.json")
+
+# 从 /metrics 采样的指标 → 报告中的字段名
+SAMPLED_METRICS = {
+    "process_resident_memory_bytes": "rss_bytes",
+    "scrape_chromium_processes": "chromium_processes",
+    "scrape_chromium_resident_memory_bytes": "chromium_rss_bytes",
+    "scrape_queue_depth": "queue_depth",
+    "scrape_in_flight": "in_flight",
+}
+_METRIC_LINE_RE = re.compile(r"^([a-z_]+)(?:\{[^}]*\})? (\S+)$")
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ("single", "batch", "site_plan"):
+            raise SystemExit(f"未知的请求类型: {name}（可选 single / batch / site_plan）")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Stage:
+    """一个速率等级内的请求结果与资源采样"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.latencies: dict[str, list[float]] = {}
+        self.outcomes: dict[str, dict[str, int]] = {}  # kind → { ok / 429 / 500 / timeout / ... : 次数 }
+        self.pages = 0  # 成功抓取的房源数（批量按行计）
+        self.peak: dict[str, float] = {}
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def record(self, kind: str, outcome: str, latency: float, pages: int = 0) -> None:
+        self.outcomes.setdefault(kind, {}).setdefault(outcome, 0)
+        self.outcomes[kind][outcome] += 1
+        if outcome == "ok":
+            self.latencies.setdefault(kind, []).append(latency)
+            self.pages += pages
+
+    def sample(self, values: dict[str, float]) -> None:
+        for key, value in values.items():
+            self.peak[key] = max(self.peak.get(key, 0), value)
+
+    def summary(self) -> dict:
+        requests = sum(sum(o.values()) for o in self.outcomes.values())
+        failed = sum(n for o in self.outcomes.values() for outcome, n in o.items() if outcome != "ok")
+        all_latencies = [x for values in self.latencies.values() for x in values]
+        kinds = {}
+        for kind, outcomes in self.outcomes.items():
+            values = self.latencies.get(kind, [])
+            kinds[kind] = {
+                "outcomes": outcomes,
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+        return {
+            "target_rate": self.rate,
+            "requests": requests,
+            "achieved_rps": round(requests / self.elapsed, 2) if self.elapsed else 0.0,
+            "pages_per_sec": round(self.pages / self.elapsed, 2) if self.elapsed else 0.0,
+            "error_rate": round(failed / requests, 4) if requests else 0.0,
+            "p50_ms": round(percentile(all_latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(all_latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(all_latencies, 99) * 1000, 1),
+            "peak_rss_mb": round(self.peak.get("rss_bytes", 0) / 1024 / 1024, 1),
+            "peak_chromium_rss_mb": round(self.peak.get("chromium_rss_bytes", 0) / 1024 / 1024, 1),
+            "peak_chromium_processes": int(self.peak.get("chromium_processes", 0)),
+            "peak_queue_depth": int(self.peak.get("queue_depth", 0)),
+            "peak_in_flight": int(self.peak.get("in_flight", 0)),
+            "by_kind": kinds,
+        }
+
+
+async def send(client: httpx.AsyncClient, kind: str, manifest: dict, args: argparse.Namespace, stage: Stage) -> None:
+    listings = [c["url"] for c in manifest["listings"]]
+    started = time.perf_counter()
+    pages = 0
+    try:
+        if kind == "single":
+            resp = await client.post(
+                "/api/scrape-property", json={"url": random.choice(listings), "force_refresh": not args.cache}
+            )
+            pages = 1
+        elif kind == "site_plan":
+            name = random.choice(manifest["site_plans"])["apartment_name"]
+            resp = await client.post("/api/scrape-site-plan", json={"apartment_name": name})
+        else:
+            urls = random.sample(listings, min(args.batch_size, len(listings)))
+            resp = await client.post("/api/scrape-properties", json={"urls": urls, "force_refresh": not args.cache})
+            if resp.status_code == 200:
+                lines = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+                pages = sum(1 for line in lines if line.get("ok"))
+                if pages < len(urls):
+                    # 批量接口总是 200，逐行失败时取第一个失败状态码
+                    status = next(line.get("status", 500) for line in lines if not line.get("ok"))
+                    stage.record(kind, str(status), time.perf_counter() - started)
+                    return
+    except httpx.TimeoutException:
+        stage.record(kind, "timeout", time.perf_counter() - started)
+        return
+    except httpx.HTTPError as e:
+        stage.record(kind, type(e).__name__, time.perf_counter() - started)
+        return
+    # site plan 未收录（404）属正常业务结果
+    ok = resp.status_code == 200 or (kind == "site_plan" and resp.status_code == 404)
+    stage.record(kind, "ok" if ok else str(resp.status_code), time.perf_counter() - started, pages)
+
+
+async def sample_metrics(client: httpx.AsyncClient) -> dict[str, float]:
+    try:
+        resp = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    values = {}
+    for line in resp.text.splitlines():
+        match = _METRIC_LINE_RE.match(line)
+        if match and match.group(1) in SAMPLED_METRICS:
+            values[SAMPLED_METRICS[match.group(1)]] = float(match.group(2))
+    return values
+
+
+async def run_stage(client: httpx.AsyncClient, rate: float, manifest: dict, args: argparse.Namespace) -> Stage:
+    """以 rate req/s 的泊松到达持续发送 duration 秒，等待在途请求完成（最多 drain_timeout 秒）"""
+    stage = Stage(rate)
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    tasks: set[asyncio.Task] = set()
+    stop_sampling = asyncio.Event()
+
+    async def sampler() -> None:
+        while not stop_sampling.is_set():
+            stage.sample(await sample_metrics(client))
+            try:
+                await asyncio.wait_for(stop_sampling.wait(), timeout=args.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    sampler_task = asyncio.create_task(sampler())
+    deadline = stage.started + args.duration
+    while time.monotonic() < deadline:
+        kind = random.choices(kinds, weights)[0]
+        task = asyncio.create_task(send(client, kind, manifest, args, stage))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        await asyncio.sleep(random.expovariate(rate))
+    if tasks:
+        done, pending = await asyncio.wait(set(tasks), timeout=args.drain_timeout)
+        for task in pending:
+            task.cancel()
+            stage.record("unfinished", "timeout", 0.0)
+    stage.elapsed = time.monotonic() - stage.started
+    stop_sampling.set()
+    await sampler_task
+    stage.sample(await sample_metrics(client))
+    return stage
+
+
+def capacity(stages: list[dict], args: argparse.Namespace) -> dict:
+    """满足错误率与 p95 目标的最高速率等级，以及该等级下的内存需求"""
+    passing = [s for s in stages if s["error_rate"] <= args.max_error_rate and s["p95_ms"] <= args.slo_p95 * 1000]
+    peak_memory_mb = max((s["peak_rss_mb"] + s["peak_chromium_rss_mb"] for s in stages), default=0)
+    best = max(passing, key=lambda s: s["target_rate"], default=None)
+    first_failing = next((s for s in stages if s not in passing), None)
+    return {
+        "slo": {"p95_ms": args.slo_p95 * 1000, "max_error_rate": args.max_error_rate},
+        "sustainable_rps": best["achieved_rps"] if best else 0.0,
+        "sustainable_pages_per_sec": best["pages_per_sec"] if best else 0.0,
+        "limit_rate": first_failing["target_rate"] if first_failing else None,
+        "peak_memory_mb": round(peak_memory_mb, 1),
+        # 留 30% 余量给 Chromium 页面峰值与 Python 堆碎片
+        "recommended_memory_mb": round(peak_memory_mb * 1.3),
+    }
+
+
+def render_report(report: dict) -> str:
+    cap = report["capacity"]
+    lines = [
+        "# 抓取服务容量报告",
+        "",
+        f"- 服务配置: {', '.join(f'{k}={v}' for k, v in report['meta']['server_env'].items()) or '默认'}",
+        f"- 请求构成: {report['meta']['mix']}，每级 {report['meta']['duration']} 秒，替身服务器延迟 {report['meta']['latency_ms']}ms",
+        f"- 目标: p95 ≤ {cap['slo']['p95_ms']:.0f}ms，错误率 ≤ {cap['slo']['max_error_rate']:.1%}",
+        "",
+        "| 目标速率 (req/s) | 实际吞吐 (req/s) | pages/s | p50 (ms) | p95 (ms) | p99 (ms) | 错误率 | 峰值 RSS (MB) | Chromium 进程 | Chromium RSS (MB) | 峰值排队 |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for s in report["stages"]:
+        lines.append(
+            f"| {s['target_rate']} | {s['achieved_rps']} | {s['pages_per_sec']} | {s['p50_ms']} | {s['p95_ms']} | {s['p99_ms']} "
+            f"| {s['error_rate']:.1%} | {s['peak_rss_mb']} | {s['peak_chromium_processes']} | {s['peak_chromium_rss_mb']} | {s['peak_queue_depth']} |"
+        )
+    lines += [
+        "",
+        f"**可持续吞吐**: {cap['sustainable_rps']} req/s（{cap['sustainable_pages_per_sec']} pages/s）"
+        + (f"，{cap['limit_rate']} req/s 时超出目标" if cap["limit_rate"] is not None else "，所有等级均满足目标"),
+        "",
+        f"**内存**: 峰值 {cap['peak_memory_mb']} MB（API 进程 + Chromium），建议实例内存 ≥ {cap['recommended_memory_mb']} MB",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_healthy(base_url: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise SystemExit(f"服务启动失败，退出码 {proc.returncode}")
+            try:
+                if (await client.get("/api/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit("服务启动超时")
+
+
+async def run(args: argparse.Namespace) -> None:
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        manifest = json.load(f)
+    server_env = {k: v for k, v in os.environ.items() if k.startswith("SCRAPE_") and k != "SCRAPE_UPSTREAM_OVERRIDES"}
+
+    fixture_server, proc = None, None
+    base_url = args.target
+    if not base_url:
+        fixture_server, origin = start_fixture_server(latency_ms=args.latency_ms)
+        port = free_port()
+        env = {
+            **os.environ,
+            "SCRAPE_UPSTREAM_OVERRIDES": upstream_overrides(origin),
+            "SCRAPE_CACHE_DB": "",
+            "SCRAPE_SELECTOR_STATS_PATH": "",
+        }
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+
+    stages = []
+    try:
+        if proc is not None:
+            await wait_healthy(base_url, proc)
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+            for rate in [float(x) for x in args.rates.split(",") if x.strip()]:
+                summary = (await run_stage(client, rate, manifest, args)).summary()
+                stages.append(summary)
+                print(
+                    f"rate={rate:<5} achieved={summary['achieved_rps']:<6} p95={summary['p95_ms']:>8.1f}ms "
+                    f"errors={summary['error_rate']:.1%} rss={summary['peak_rss_mb']}MB "
+                    f"chromium={summary['peak_chromium_processes']}",
+                    file=sys.stderr,
+                )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if fixture_server is not None:
+            fixture_server.shutdown()
+
+    report = {
+        "meta": {
+            "target": args.target or "local",
+            "server_env": server_env,
+            "mix": args.mix,
+            "duration": args.duration,
+            "latency_ms": args.latency_ms,
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": stages,
+        "capacity": capacity(stages, args),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    markdown = render_report(report)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write(markdown)
+    print(markdown)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="抓取服务压测与容量评估")
+    parser.add_argument("--rates", default="0.5,1,2,4,8", help="逗号分隔的请求到达速率（req/s），逐级执行")
+    parser.add_argument("--duration", type=float, default=30, help="每个速率等级持续的秒数")
+    parser.add_argument("--mix", default="single=8,batch=1,site_plan=1", help="请求类型权重")
+    parser.add_argument("--batch-size", type=int, default=5, help="批量请求中的链接数")
+    parser.add_argument("--cache", action="store_true", help="允许命中缓存（默认带 force_refresh）")
+    parser.add_argument("--latency-ms", type=float, default=0, help="替身服务器的模拟网络延迟（毫秒）")
+    parser.add_argument("--target", help="压测已启动的服务地址，不再自行启动服务与替身服务器")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--drain-timeout", type=float, default=120, help="每级结束后等待在途请求的最长秒数")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="/metrics 采样间隔（秒）")
+    parser.add_argument("--slo-p95", type=float, default=15, help="p95 目标（秒）")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="可接受的错误率")
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "results", "load.json"))
+    parser.add_argument("--report", default=os.path.join(BENCH_DIR, "results", "capacity.md"))
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
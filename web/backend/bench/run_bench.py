@@ -0,0 +1,313 @@
+"""
+离线端到端基准测试：启动本地替身服务器（bench/fixture_server.py），通过 SCRAPE_UPSTREAM_OVERRIDES
+把 Property Guru / 99.co 请求指向它，在进程内调用 /api/scrape-property 与 /api/scrape-site-plan，
+按不同并发度统计单次抓取耗时、p50/p95/p99、每秒页面数和字段校验错误数。
+
+用法（在 web/backend 目录下）：
+  python bench/run_bench.py                                 # HTTP 直取层，并发 1,2,4,8
+  python bench/run_bench.py --tier both --latency-ms 80     # 同时跑浏览器层，模拟 80ms 网络延迟
+  python bench/run_bench.py --against origin/main          # 在本机先跑一遍基准提交作为对照，再跑当前代码
+  python bench/run_bench.py --save-baseline                 # 更新 bench/baseline.json（随 PR 提交）
+
+p95 相比对照变慢超过 --max-regression（默认 25%，且超过 --min-delta-ms）或出现校验错误时退出码为 1。
+耗时只有在同一台机器上比较才有意义：--against 在临时 git worktree 中用相同参数跑基准提交作为对照；
+不加 --against 时与仓库中的 bench/baseline.json（只含 HTTP 直取层）比较，记录它的机器与本机不同时回归只作提示、不影响退出码。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_server import start_fixture_server, upstream_overrides  # noqa: E402
+
+MANIFEST_PATH = os.path.join(BENCH_DIR, "fixtures", "manifest.json")
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    count = len(latencies) + errors
+    return {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+        "pages_per_sec": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def check_listing(data: dict, expect: dict) -> list[str]:
+    """与 manifest 中的期望字段比对，返回不一致的字段说明"""
+    return [
+        f"{field}: 期望 {want!r}，实际 {data.get(field)!r}"
+        for field, want in expect.items()
+        if data.get(field) != want
+    ]
+
+
+async def run_level(client, cases: list[tuple], concurrency: int, total: int, reset) -> tuple[dict, list[str]]:
+    """以固定并发度跑 total 次请求（轮流使用 cases），返回汇总与失败明细"""
+    latencies: list[float] = []
+    failures: list[str] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index, errors
+        while next_index < total:
+            name, path, body, check = cases[next_index % len(cases)]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                resp = await client.post(path, json=body)
+                problems = check(resp)
+            except Exception as e:
+                problems = [f"{type(e).__name__}: {e}"]
+            if problems:
+                errors += 1
+                failures.append(f"{name}: {'; '.join(problems)}")
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started), failures
+
+
+def listing_cases(manifest: dict) -> list[tuple]:
+    def make_check(expect: dict):
+        def check(resp) -> list[str]:
+            if resp.status_code != 200:
+                return [f"HTTP {resp.status_code}: {resp.text[:200]}"]
+            return check_listing(resp.json(), expect)
+        return check
+
+    return [
+        (c["name"], "/api/scrape-property", {"url": c["url"], "force_refresh": True}, make_check(c["expect"]))
+        for c in manifest["listings"]
+    ]
+
+
+def site_plan_cases(manifest: dict) -> list[tuple]:
+    def make_check(expect):
+        def check(resp) -> list[str]:
+            if expect is None:
+                return [] if resp.status_code == 404 else [f"期望 404，实际 HTTP {resp.status_code}"]
+            if resp.status_code != 200:
+                return [f"HTTP {resp.status_code}: {resp.text[:200]}"]
+            got = resp.json().get("site_plan_url")
+            return [] if got == expect else [f"site_plan_url: 期望 {expect!r}，实际 {got!r}"]
+        return check
+
+    return [
+        (c["apartment_name"], "/api/scrape-site-plan", {"apartment_name": c["apartment_name"]}, make_check(c["expect"]))
+        for c in manifest["site_plans"]
+    ]
+
+
+async def run_tier(main, client, manifest: dict, tier: str, levels: list[int], total: int) -> tuple[dict, list[str]]:
+    main.http_fetcher.enabled = tier == "http"
+    if tier == "http":
+        # 只测 HTTP 直取层：夹具中有意缺少户型图 / 中介的房源按默认配置会交给浏览器，这里只要求核心字段
+        main.SCRAPE_HTTP_REQUIRED_FIELDS[:] = ["price", "size_sqft", "main_image_url"]
+    if tier == "browser" and not main.browser_pool.stats().get("connected"):
+        print(f"SKIP {tier}: 浏览器未启动（需先执行 playwright install chromium）", file=sys.stderr)
+        return {}, []
+
+    def reset() -> None:
+        # 每轮都从冷缓存开始（scrape-property 已带 force_refresh），保证测到的是真实抓取而不是缓存命中
+        main.site_plan_cache.clear()
+
+    scenarios = [("scrape_property", listing_cases(manifest))]
+    if tier == "browser":
+        # /api/scrape-site-plan 始终用浏览器打开 99.co；HTTP 层的 site plan 查询已包含在 scrape_property 中
+        scenarios.append(("site_plan", site_plan_cases(manifest)))
+
+    results: dict = {}
+    failures: list[str] = []
+    for scenario, cases in scenarios:
+        for level in levels:
+            summary, failed = await run_level(client, cases, level, total, reset)
+            results[f"{scenario}/c{level}"] = summary
+            failures.extend(
+                f"{tier} {scenario}/c{level} {f} (x{n})" for f, n in Counter(failed).items()
+            )
+            print(
+                f"[{tier}] {scenario:<16} c={level:<3} p50={summary['p50_ms']:>8.1f}ms "
+                f"p95={summary['p95_ms']:>8.1f}ms p99={summary['p99_ms']:>8.1f}ms "
+                f"{summary['pages_per_sec']:>7.1f} pages/s errors={summary['errors']}",
+                file=sys.stderr,
+            )
+    return results, failures
+
+
+def compare(results: dict, baseline: dict, max_regression: float, min_delta_ms: float) -> list[str]:
+    """p95 相比 baseline 变慢超过 max_regression（且绝对值超过 min_delta_ms，过滤毫秒级抖动）的场景"""
+    regressions = []
+    for tier, scenarios in results.items():
+        for key, summary in scenarios.items():
+            base = baseline.get(tier, {}).get(key)
+            if not base or not base.get("p95_ms"):
+                continue
+            ratio = summary["p95_ms"] / base["p95_ms"] - 1
+            if ratio > max_regression and summary["p95_ms"] - base["p95_ms"] > min_delta_ms:
+                regressions.append(
+                    f"{tier} {key}: p95 {base['p95_ms']}ms → {summary['p95_ms']}ms (+{ratio:.0%})"
+                )
+    return regressions
+
+
+def machine_meta() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def same_machine(meta: dict) -> bool:
+    current = machine_meta()
+    return all(meta.get(k) == v for k, v in current.items())
+
+
+def run_reference(ref: str, args: argparse.Namespace) -> dict:
+    """在临时 git worktree 中用相同参数跑 ref 的基准测试，返回其结果作为对照"""
+    toplevel = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    script = os.path.relpath(os.path.abspath(__file__), toplevel)
+    with tempfile.TemporaryDirectory(prefix="bench-ref-") as tmp:
+        worktree = os.path.join(tmp, "tree")
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, ref], cwd=toplevel, capture_output=True, check=True
+        )
+        try:
+            if not os.path.exists(os.path.join(worktree, script)):
+                raise SystemExit(f"{ref} 中没有 {script}，无法作为对照")
+            out = os.path.join(tmp, "reference.json")
+            print(f"对照: 在 {ref} 上运行基准测试…", file=sys.stderr)
+            subprocess.run(
+                [
+                    sys.executable, os.path.join(worktree, script),
+                    "--tier", args.tier, "--concurrency", args.concurrency,
+                    "--requests", str(args.requests), "--latency-ms", str(args.latency_ms),
+                    "--out", out, "--baseline", os.path.join(tmp, "none.json"),
+                ],
+                cwd=os.path.dirname(os.path.dirname(os.path.join(worktree, script))),
+            )
+            if not os.path.exists(out):
+                raise SystemExit(f"{ref} 的基准测试没有产出结果")
+            with open(out, encoding="utf-8") as f:
+                return json.load(f)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=toplevel, capture_output=True)
+
+
+async def run(args: argparse.Namespace) -> int:
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    reference = run_reference(args.against, args) if args.against else None
+    server, origin = start_fixture_server(latency_ms=args.latency_ms)
+
+    # main 在导入时读取环境变量，必须先设置好
+    os.environ["SCRAPE_UPSTREAM_OVERRIDES"] = upstream_overrides(origin)
+    os.environ["SCRAPE_CACHE_DB"] = ""
+    os.environ["SCRAPE_SELECTOR_STATS_PATH"] = ""  # 不读写持久化的选择器统计，每次从原始顺序开始
+    os.environ["SCRAPE_MAX_CONCURRENCY"] = str(max(levels))
+    os.environ["SCRAPE_MAX_QUEUE"] = str(max(levels) * 4)
+    import httpx
+    import main
+
+    tiers = ["http", "browser"] if args.tier == "both" else [args.tier]
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    results: dict = {}
+    failures: list[str] = []
+    try:
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                for tier in tiers:
+                    tier_results, tier_failures = await run_tier(main, client, manifest, tier, levels, args.requests)
+                    if tier_results:
+                        results[tier] = tier_results
+                    failures.extend(tier_failures)
+    finally:
+        server.shutdown()
+
+    report = {
+        "meta": {
+            **machine_meta(),
+            "tiers": sorted(results),
+            "latency_ms": args.latency_ms,
+            "requests_per_level": args.requests,
+        },
+        **results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"结果已写入 {args.out}", file=sys.stderr)
+
+    for line in failures:
+        print(f"FAIL {line}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"baseline 已更新: {args.baseline}", file=sys.stderr)
+        return 1 if failures else 0
+
+    regressions: list[str] = []
+    gating = True
+    if reference is not None:
+        regressions = compare(results, reference, args.max_regression, args.min_delta_ms)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression, args.min_delta_ms)
+        # 其他机器上记录的 baseline 只能作参考，耗时差异不足以判定回归
+        gating = same_machine(baseline.get("meta", {}))
+        if regressions and not gating:
+            print("baseline 记录于其他机器，以下仅供参考；用 --against <基准提交> 在本机对照", file=sys.stderr)
+    for line in regressions:
+        print(f"{'REGRESSION' if gating else 'WARN'} {line}", file=sys.stderr)
+    return 1 if (regressions and gating) or failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="抓取 API 离线基准测试")
+    parser.add_argument("--tier", choices=["http", "browser", "both"], default="http")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="逗号分隔的并发度列表")
+    parser.add_argument("--requests", type=int, default=40, help="每个并发度的请求数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="替身服务器的模拟网络延迟（毫秒）")
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "results", "latest.json"))
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写为 baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="允许的 p95 回归比例")
+    parser.add_argument("--min-delta-ms", type=float, default=20, help="p95 变慢不超过该毫秒数时不算回归")
+    parser.add_argument("--against", default="", help="git 提交 / 分支：先在本机跑它作为对照，代替 baseline.json")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,1479 @@
 Property Guru 房源抓取 API
 POST /api/scrape-property 传入 URL，返回抓取到的房源信息
 """
+import asyncio
+import bisect
+import gzip
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
 import re
-from typing import Optional
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, TypeVar
+from urllib.parse import urlsplit
 
-from fastapi import FastAPI, HTTPException
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from playwright.async_api import async_playwright
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+from selectolax.lexbor import LexborHTMLParser, LexborNode
 
-app = FastAPI(title="Property Scrape API")
+logger = logging.getLogger("scrape_api")
+
+T = TypeVar("T")
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# 浏览器池配置：常驻 Chromium 进程数、健康检查间隔（秒）
+BROWSER_POOL_SIZE = int(os.environ.get("SCRAPE_BROWSER_POOL_SIZE", "1"))
+BROWSER_HEALTH_INTERVAL = float(os.environ.get("SCRAPE_BROWSER_HEALTH_INTERVAL", "30"))
+
+# 浏览器启动配置：default 或 low-memory（512 MB–1 GB 小容器：精简进程与缓存，更早回收）
+BROWSER_PROFILE = os.environ.get("SCRAPE_BROWSER_PROFILE", "default")
+BROWSER_LAUNCH_PROFILES = {
+    "default": {"args": [], "max_pages": 200, "max_rss_mb": 0},
+    "low-memory": {
+        "args": [
+            "--disable-dev-shm-usage",
+            "--disable-gpu",
+            "--renderer-process-limit=2",
+            "--disable-extensions",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-features=site-per-process,Translate,BackForwardCache,MediaRouter,OptimizationHints",
+            "--js-flags=--max-old-space-size=192",
+            "--disk-cache-size=1",
+            "--media-cache-size=1",
+            "--mute-audio",
+        ],
+        "max_pages": 50,
+        "max_rss_mb": 300,
+    },
+}
+_browser_profile = BROWSER_LAUNCH_PROFILES.get(BROWSER_PROFILE, BROWSER_LAUNCH_PROFILES["default"])
+# 额外的 Chromium 启动参数（空格分隔），追加在启动配置之后
+BROWSER_LAUNCH_ARGS = _browser_profile["args"] + os.environ.get("SCRAPE_BROWSER_ARGS", "").split()
+# 浏览器回收：打开 MAX_PAGES 个页面后，或所有 Chromium 进程 RSS 合计超过 MAX_RSS_MB（0 关闭）时，
+# 等在途抓取结束（最多 DRAIN_TIMEOUT 秒）后关闭并重新启动
+BROWSER_MAX_PAGES = int(os.environ.get("SCRAPE_BROWSER_MAX_PAGES", str(_browser_profile["max_pages"])))
+BROWSER_MAX_RSS_MB = float(os.environ.get("SCRAPE_BROWSER_MAX_RSS_MB", str(_browser_profile["max_rss_mb"])))
+BROWSER_DRAIN_TIMEOUT = float(os.environ.get("SCRAPE_BROWSER_DRAIN_TIMEOUT", "60"))
+
+# 准入控制：同时进行的抓取数、排队上限、最长排队时间（秒）
+SCRAPE_MAX_CONCURRENCY = int(os.environ.get("SCRAPE_MAX_CONCURRENCY", "2"))
+SCRAPE_MAX_QUEUE = int(os.environ.get("SCRAPE_MAX_QUEUE", "20"))
+SCRAPE_MAX_QUEUE_WAIT = float(os.environ.get("SCRAPE_MAX_QUEUE_WAIT", "30"))
+
+# 批量抓取：单次链接数上限、单个批次内的并发数（仍受全局准入控制约束）
+SCRAPE_BATCH_MAX_URLS = int(os.environ.get("SCRAPE_BATCH_MAX_URLS", "50"))
+SCRAPE_BATCH_CONCURRENCY = int(os.environ.get("SCRAPE_BATCH_CONCURRENCY", str(SCRAPE_MAX_CONCURRENCY)))
+
+# 增量刷新（/api/refresh-listings）：单次最多条数、并发的条件请求数（有变化需要完整抓取时仍受 SCRAPE_MAX_CONCURRENCY 限制）
+SCRAPE_REFRESH_MAX_ITEMS = int(os.environ.get("SCRAPE_REFRESH_MAX_ITEMS", "200"))
+SCRAPE_REFRESH_CONCURRENCY = int(os.environ.get("SCRAPE_REFRESH_CONCURRENCY", "8"))
+
+# 异步抓取任务：后台 worker 数、排队任务上限、已结束任务的保留时间（秒）
+SCRAPE_JOB_WORKERS = int(os.environ.get("SCRAPE_JOB_WORKERS", str(SCRAPE_MAX_CONCURRENCY)))
+SCRAPE_JOB_MAX_QUEUED = int(os.environ.get("SCRAPE_JOB_MAX_QUEUED", "200"))
+SCRAPE_JOB_RETENTION = float(os.environ.get("SCRAPE_JOB_RETENTION", "3600"))
+
+# HTTP 直取：先用普通 HTTP 请求取服务端渲染的 HTML 并解析，缺少必需字段或被反爬拦截时才启用浏览器。
+# 户型图常在媒体画廊 modal 内、中介电话常由脚本渲染，HTML 中没有时交给浏览器（点开画廊）补齐
+SCRAPE_HTTP_FAST_PATH = os.environ.get("SCRAPE_HTTP_FAST_PATH", "1") != "0"
+SCRAPE_HTTP_TIMEOUT = float(os.environ.get("SCRAPE_HTTP_TIMEOUT", "10"))
+SCRAPE_HTTP_REQUIRED_FIELDS = [
+    f.strip()
+    for f in os.environ.get(
+        "SCRAPE_HTTP_REQUIRED_FIELDS", "price,size_sqft,main_image_url,floor_plan_url,listing_agent_phone"
+    ).split(",")
+    if f.strip()
+]
+
+# 浏览器抓取时记录站点自身 JSON 响应（XHR / fetch）的 URL 模式（子串，逗号分隔），设为空关闭。
+# 默认只记录房源详情页的 Next.js 数据路由；/api/、graphql 等还会返回相似房源、推荐列表。
+# 只有 id 与页面链接一致的房源数据优先于 DOM，其余只补齐 DOM 缺失的字段
+SCRAPE_CAPTURE_URL_PATTERNS = [
+    p.strip() for p in os.environ.get("SCRAPE_CAPTURE_URL_PATTERNS", "/_next/data/").split(",") if p.strip()
+]
+_CAPTURE_MAX_BYTES = 2 * 1024 * 1024
+
+# 抓取结果内存缓存：最多条目数、过期时间（秒）
+SCRAPE_CACHE_SIZE = int(os.environ.get("SCRAPE_CACHE_SIZE", "500"))
+SCRAPE_CACHE_TTL = float(os.environ.get("SCRAPE_CACHE_TTL", str(6 * 3600)))
+
+# site plan 缓存（按公寓 slug）：找到的图片地址长期缓存，99.co 上没有的公寓按较短 TTL 做负缓存
+SITE_PLAN_CACHE_SIZE = int(os.environ.get("SITE_PLAN_CACHE_SIZE", "2000"))
+SITE_PLAN_CACHE_TTL = float(os.environ.get("SITE_PLAN_CACHE_TTL", str(7 * 24 * 3600)))
+SITE_PLAN_NEGATIVE_TTL = float(os.environ.get("SITE_PLAN_NEGATIVE_TTL", str(24 * 3600)))
+
+# 抓取结果磁盘缓存（SQLite，WAL 模式，同机多个 worker 进程共享）；设为空字符串则关闭
+SCRAPE_CACHE_DB = os.environ.get(
+    "SCRAPE_CACHE_DB", os.path.join(tempfile.gettempdir(), "property-scrape-cache.sqlite3")
+)
+SCRAPE_CACHE_DB_MAX_MB = float(os.environ.get("SCRAPE_CACHE_DB_MAX_MB", "50"))
+
+# 原始页面存档目录：每次抓取成功后把页面 HTML（及浏览器捕获的 JSON）按内容哈希 gzip 压缩保存，
+# 供提取规则改进后离线重新提取（reextract.py）；设为空字符串则关闭
+SCRAPE_ARCHIVE_DIR = os.environ.get("SCRAPE_ARCHIVE_DIR", "")
+
+# 自适应选择器顺序：按各站点近期命中率重排选择器，持续未命中的跳过；EXPLORE 为按原始顺序完整尝试的概率（发现页面改版）
+SCRAPE_SELECTOR_ADAPTIVE = os.environ.get("SCRAPE_SELECTOR_ADAPTIVE", "1") != "0"
+SCRAPE_SELECTOR_EXPLORE = float(os.environ.get("SCRAPE_SELECTOR_EXPLORE", "0.1"))
+# 命中统计按 DECAY 指数衰减（每次记录），有效样本 ≥ MIN_SAMPLES 且命中率低于 SKIP_BELOW 的选择器被跳过
+SCRAPE_SELECTOR_DECAY = float(os.environ.get("SCRAPE_SELECTOR_DECAY", "0.9"))
+SCRAPE_SELECTOR_MIN_SAMPLES = float(os.environ.get("SCRAPE_SELECTOR_MIN_SAMPLES", "5"))
+SCRAPE_SELECTOR_SKIP_BELOW = float(os.environ.get("SCRAPE_SELECTOR_SKIP_BELOW", "0.1"))
+# 命中统计持久化文件（JSON），设为空字符串则只保存在内存中
+SCRAPE_SELECTOR_STATS_PATH = os.environ.get(
+    "SCRAPE_SELECTOR_STATS_PATH", os.path.join(tempfile.gettempdir(), "property-selector-stats.json")
+)
+
+# 各阶段等待页面就绪的时间预算（毫秒）：目标元素出现即继续，超出预算按现有 DOM 提取
+READY_TIMEOUT_LISTING = int(os.environ.get("SCRAPE_READY_TIMEOUT_LISTING", "5000"))
+READY_TIMEOUT_GALLERY = int(os.environ.get("SCRAPE_READY_TIMEOUT_GALLERY", "3000"))
+READY_TIMEOUT_SITE_PLAN = int(os.environ.get("SCRAPE_READY_TIMEOUT_SITE_PLAN", "6000"))
+
+# 字段提取方式：evaluate = 一次 page.evaluate 取回全部候选后在 Python 中识别（默认）；
+# html = 取一次页面 HTML 快照交给离线提取引擎（不占事件循环）；
+# locator = 逐个选择器调用 Playwright（旧方式，每个未命中的选择器都要等超时）
+SCRAPE_EXTRACTION_MODE = os.environ.get("SCRAPE_EXTRACTION_MODE", "evaluate")
+# 离线提取进程池大小；0 表示在线程中执行
+SCRAPE_EXTRACTION_WORKERS = int(os.environ.get("SCRAPE_EXTRACTION_WORKERS", "0"))
+
+# 房源抓取中并行查询 99.co site plan 的时间预算（秒），超时则不带 site plan 返回
+SCRAPE_SITE_PLAN_BUDGET = float(os.environ.get("SCRAPE_SITE_PLAN_BUDGET", "10"))
+
+# 单个请求的总时间预算（秒，含排队）：各阶段的超时都从中扣除，用尽返回 504；
+# 剩余不足 SCRAPE_OPTIONAL_PHASE_MIN 秒时跳过可选阶段（点开画廊找户型图、中介姓名、site plan）
+SCRAPE_DEADLINE = float(os.environ.get("SCRAPE_DEADLINE", "45"))
+SCRAPE_OPTIONAL_PHASE_MIN = float(os.environ.get("SCRAPE_OPTIONAL_PHASE_MIN", "3"))
+# 可选阶段为返回响应预留的时间（秒），避免可选阶段把整个请求拖到超时
+_OPTIONAL_PHASE_RESERVE = 1.0
+# 检查客户端是否已断开的间隔（秒）
+_DISCONNECT_POLL_INTERVAL = 0.5
+
+# 请求拦截：屏蔽重资源类型与第三方跟踪脚本（设 SCRAPE_BLOCK_RESOURCES=0 关闭）
+SCRAPE_BLOCK_RESOURCES = os.environ.get("SCRAPE_BLOCK_RESOURCES", "1") != "0"
+SCRAPE_BLOCKED_RESOURCE_TYPES = {
+    t.strip() for t in os.environ.get("SCRAPE_BLOCKED_RESOURCE_TYPES", "image,media,font").split(",") if t.strip()
+}
+SCRAPE_BLOCKED_HOSTS_EXTRA = [
+    h.strip() for h in os.environ.get("SCRAPE_BLOCKED_HOSTS_EXTRA", "").split(",") if h.strip()
+]
+
+# 上游站点改写：host=origin，逗号分隔（如 www.99.co=http://127.0.0.1:8765），
+# 把页面、HTTP 直取与图片请求转发到本地替身服务器，供离线基准测试使用；生产环境留空
+SCRAPE_UPSTREAM_OVERRIDES = {
+    host.strip().lower(): origin.strip().rstrip("/")
+    for host, _, origin in (
+        item.partition("=") for item in os.environ.get("SCRAPE_UPSTREAM_OVERRIDES", "").split(",") if "=" in item
+    )
+}
+
+
+def _upstream_url(url: str) -> str:
+    """按 SCRAPE_UPSTREAM_OVERRIDES 改写实际请求的地址（响应中的链接仍为原始地址）"""
+    if not SCRAPE_UPSTREAM_OVERRIDES:
+        return url
+    parts = urlsplit(url)
+    origin = SCRAPE_UPSTREAM_OVERRIDES.get((parts.hostname or "").lower())
+    if origin is None:
+        return url
+    return origin + (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+
+# 阶段耗时直方图的桶上界（秒）
+PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _prom_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ScrapeMetrics:
+    """进程内指标：各阶段耗时直方图、选择器命中/未命中计数、各层给出的结果数，由 /metrics 以 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self.phases: dict[str, Histogram] = {}
+        self.selectors: dict[tuple[str, str, str], int] = {}
+        self.results: dict[str, int] = {}
+        self.skipped: dict[str, int] = {}
+        self.aborted: dict[str, int] = {}
+        self.refreshes: dict[tuple[str, str], int] = {}
+
+    def observe(self, phase: str, seconds: float) -> None:
+        hist = self.phases.get(phase)
+        if hist is None:
+            hist = self.phases[phase] = Histogram(PHASE_BUCKETS)
+        hist.observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.phases.append((phase, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录 with 块耗时（出错或超时也记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def selector(self, group: str, selector: str, hit: bool) -> None:
+        key = (group, selector, "hit" if hit else "miss")
+        self.selectors[key] = self.selectors.get(key, 0) + 1
+
+    def result(self, tier: str) -> None:
+        self.results[tier] = self.results.get(tier, 0) + 1
+
+    def skip(self, phase: str) -> None:
+        self.skipped[phase] = self.skipped.get(phase, 0) + 1
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.skipped.append(phase)
+
+    def abort(self, reason: str) -> None:
+        self.aborted[reason] = self.aborted.get(reason, 0) + 1
+
+    def refresh(self, status: str, check: str) -> None:
+        self.refreshes[(status, check)] = self.refreshes.get((status, check), 0) + 1
+
+    def render(self) -> list[str]:
+        lines = [
+            "# HELP scrape_phase_seconds Scrape phase latency.",
+            "# TYPE scrape_phase_seconds histogram",
+        ]
+        for phase, hist in sorted(self.phases.items()):
+            cumulative = 0
+            for bound, n in zip(hist.buckets + (math.inf,), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f'scrape_phase_seconds_bucket{{phase="{phase}",le="{le}"}} {cumulative}')
+            lines.append(f'scrape_phase_seconds_sum{{phase="{phase}"}} {hist.sum:.6f}')
+            lines.append(f'scrape_phase_seconds_count{{phase="{phase}"}} {hist.count}')
+        lines += [
+            "# HELP scrape_selector_total Selector lookups by outcome.",
+            "# TYPE scrape_selector_total counter",
+        ]
+        for (group, selector, outcome), n in sorted(self.selectors.items()):
+            lines.append(
+                f'scrape_selector_total{{group="{group}",selector="{_prom_label(selector)}",outcome="{outcome}"}} {n}'
+            )
+        lines += [
+            "# HELP scrape_results_total Scrapes completed, by the tier that produced the result.",
+            "# TYPE scrape_results_total counter",
+        ]
+        for tier, n in sorted(self.results.items()):
+            lines.append(f'scrape_results_total{{tier="{tier}"}} {n}')
+        lines += [
+            "# HELP scrape_phase_skipped_total Optional phases skipped because the request deadline was close.",
+            "# TYPE scrape_phase_skipped_total counter",
+        ]
+        for phase, n in sorted(self.skipped.items()):
+            lines.append(f'scrape_phase_skipped_total{{phase="{phase}"}} {n}')
+        lines += [
+            "# HELP scrape_aborted_total Requests stopped early because the deadline was exceeded or the client disconnected.",
+            "# TYPE scrape_aborted_total counter",
+        ]
+        for reason, n in sorted(self.aborted.items()):
+            lines.append(f'scrape_aborted_total{{reason="{reason}"}} {n}')
+        lines += [
+            "# HELP scrape_refresh_total Listing refresh checks, by outcome and how the outcome was decided.",
+            "# TYPE scrape_refresh_total counter",
+        ]
+        for (status, check), n in sorted(self.refreshes.items()):
+            lines.append(f'scrape_refresh_total{{status="{status}",check="{check}"}} {n}')
+        return lines
+
+
+scrape_metrics = ScrapeMetrics()
+
+
+# 选择器组所属站点（命中统计按 站点:组 分开保存）
+SELECTOR_GROUP_SITES = {
+    "price": "propertyguru",
+    "size": "propertyguru",
+    "agent": "propertyguru",
+    "gallery": "propertyguru",
+    "floor_plan": "propertyguru",
+    "site_plan": "99co",
+}
+
+
+class SelectorStats:
+    """各站点选择器的命中统计（指数衰减，近期结果权重更高），用于重排选择器顺序、跳过持续未命中的选择器。
+    定期写入 JSON 文件，重启后沿用；以 explore 概率按原始顺序完整尝试，页面改版后旧选择器重新命中时能恢复"""
+
+    def __init__(self, path: str, enabled: bool, explore: float, decay: float, min_samples: float, skip_below: float):
+        self.path = path
+        self.enabled = enabled
+        self.explore = explore
+        self.decay = decay
+        self.min_samples = min_samples
+        self.skip_below = skip_below
+        self._stats: dict[str, dict[str, list[float]]] = {}  # 站点:组 → 选择器 → [命中, 未命中]（衰减后）
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self.reordered = 0
+        self.skipped = 0
+        self.explored = 0
+
+    @staticmethod
+    def _key(group: str) -> str:
+        return f"{SELECTOR_GROUP_SITES.get(group, 'propertyguru')}:{group}"
+
+    def _score(self, counts: Optional[list[float]]) -> float:
+        """命中率的平滑估计；没有样本的选择器为 0.5"""
+        hits, misses = counts or (0.0, 0.0)
+        return (hits + 1) / (hits + misses + 2)
+
+    def record(self, group: str, selector: str, hit: bool) -> None:
+        counts = self._stats.setdefault(self._key(group), {}).setdefault(selector, [0.0, 0.0])
+        counts[0] = counts[0] * self.decay + (1 if hit else 0)
+        counts[1] = counts[1] * self.decay + (0 if hit else 1)
+        self._dirty = True
+
+    def order(self, group: str, selectors: list[str]) -> list[str]:
+        """按近期命中率从高到低排列（相近时保持原始优先级），去掉持续未命中的；全部被跳过时返回原始顺序"""
+        stats = self._stats.get(self._key(group))
+        if not self.enabled or not stats:
+            return selectors
+        if random.random() < self.explore:
+            self.explored += 1
+            return selectors
+        ranked = sorted(
+            range(len(selectors)), key=lambda i: (-round(self._score(stats.get(selectors[i])), 1), i)
+        )
+        kept = [
+            selectors[i]
+            for i in ranked
+            if sum(stats.get(selectors[i]) or (0.0, 0.0)) < self.min_samples
+            or self._score(stats.get(selectors[i])) >= self.skip_below
+        ]
+        if not kept:
+            return selectors
+        if len(kept) < len(selectors):
+            self.skipped += 1
+        if kept != selectors[: len(kept)]:
+            self.reordered += 1
+        return kept
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._stats = {
+                key: {sel: [float(c[0]), float(c[1])] for sel, c in selectors.items()}
+                for key, selectors in data.items()
+            }
+        except (OSError, ValueError, TypeError, IndexError) as e:
+            logger.warning("选择器命中统计读取失败，从空统计开始: %s", e)
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({key: {sel: [round(c[0], 4), round(c[1], 4)] for sel, c in sel_map.items()} for key, sel_map in self._stats.items()}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("选择器命中统计保存失败: %s", e)
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.load)
+        if self.path:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await asyncio.to_thread(self.save)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(60)
+            await asyncio.to_thread(self.save)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "reordered": self.reordered,
+            "skipped": self.skipped,
+            "explored": self.explored,
+            "groups": {
+                key: {sel: round(self._score(c), 3) for sel, c in sorted(sel_map.items(), key=lambda kv: -self._score(kv[1]))}
+                for key, sel_map in sorted(self._stats.items())
+            },
+        }
+
+
+selector_stats = SelectorStats(
+    SCRAPE_SELECTOR_STATS_PATH,
+    SCRAPE_SELECTOR_ADAPTIVE,
+    SCRAPE_SELECTOR_EXPLORE,
+    SCRAPE_SELECTOR_DECAY,
+    SCRAPE_SELECTOR_MIN_SAMPLES,
+    SCRAPE_SELECTOR_SKIP_BELOW,
+)
+
+
+def _record_selector(group: str, selector: str, hit: bool) -> None:
+    """记录一次选择器查找结果：计入 /metrics 与自适应顺序的命中统计"""
+    scrape_metrics.selector(group, selector, hit)
+    selector_stats.record(group, selector, hit)
+
+
+class ScrapeTrace:
+    """单次请求的追踪：按发生顺序记录的阶段耗时与各字段来源，用于 Server-Timing 响应头与 debug 字段"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self.sources: dict[str, str] = {}
+        self.skipped: list[str] = []
+
+    def server_timing(self, cache_status: str, queue_wait: float) -> str:
+        entries = [f'cache;desc="{cache_status}"', f"queue;dur={queue_wait * 1000:.1f}"]
+        entries += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def debug(self, cache_status: str, queue_wait: float, tier: Optional[str]) -> "ScrapeDebug":
+        return ScrapeDebug(
+            cache=cache_status,
+            tier=tier,
+            total_ms=round((time.perf_counter() - self.started) * 1000, 1),
+            queue_wait_ms=round(queue_wait * 1000, 1),
+            phases=[{"name": name, "ms": round(seconds * 1000, 1)} for name, seconds in self.phases],
+            sources=dict(self.sources),
+            skipped_phases=list(self.skipped),
+        )
+
+
+_current_trace: ContextVar[Optional[ScrapeTrace]] = ContextVar("scrape_trace", default=None)
+
+
+async def _with_trace(trace: ScrapeTrace, aw: Awaitable[T]) -> T:
+    """在 trace 下执行 aw：期间记录的阶段与字段来源（包括其中创建的子任务）都写入 trace"""
+    token = _current_trace.set(trace)
+    try:
+        return await aw
+    finally:
+        _current_trace.reset(token)
+
+
+def _note_sources(sources: dict[str, str]) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.sources.update(sources)
+
+
+class Deadline:
+    """单个请求的截止时间，各阶段的超时都不超过剩余时间"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def exceeded(self) -> HTTPException:
+        scrape_metrics.abort("deadline")
+        return HTTPException(status_code=504, detail=f"抓取超时（超过 {self.seconds:g} 秒）")
+
+
+def _scrape_error(e: Exception, what: str = "抓取") -> HTTPException:
+    """抓取异常对应的 HTTP 错误：请求时间已用尽时为 504（各阶段超时都已按剩余时间收紧），否则为 500"""
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        return deadline.exceeded()
+    return HTTPException(status_code=500, detail=f"{what}失败: {str(e)}")
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("scrape_deadline", default=None)
+
+
+def _budget(cap: float, reserve: float = 0.0) -> float:
+    """当前请求可用于某阶段的秒数：不超过 cap，也不超过剩余时间减去 reserve"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return cap
+    return max(0.0, min(cap, deadline.remaining() - reserve))
+
+
+def _budget_ms(cap_ms: int, reserve: float = 0.0) -> int:
+    """_budget 的毫秒版本，供 Playwright 超时参数使用（至少 1：Playwright 中 0 表示不限时）"""
+    return max(1, int(_budget(cap_ms / 1000, reserve) * 1000))
+
+
+def _optional_phase(phase: str) -> bool:
+    """剩余时间足够时返回 True；不足时记录跳过并返回 False"""
+    deadline = _current_deadline.get()
+    if deadline is None or deadline.remaining() >= SCRAPE_OPTIONAL_PHASE_MIN:
+        return True
+    scrape_metrics.skip(phase)
+    return False
+
+
+async def _until_disconnected(request: Request, aw: Awaitable[T]) -> T:
+    """执行 aw，客户端断开时立即取消（释放排队名额、关闭浏览器 context），名额留给仍在等待的请求"""
+    task = asyncio.ensure_future(aw)
+
+    async def watch() -> None:
+        while not await request.is_disconnected():
+            await asyncio.sleep(_DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            # 等取消完成（浏览器 context 已关闭、排队名额已归还）再返回
+            await asyncio.wait({task})
+    if task.cancelled():
+        scrape_metrics.abort("disconnect")
+        # 客户端已不在，状态码只出现在访问日志中（沿用 nginx 的 499）
+        raise HTTPException(status_code=499, detail="客户端已断开，抓取已取消")
+    return task.result()
+
+
+def _process_memory() -> dict:
+    """本进程 RSS，以及子进程中 Chromium 的进程数与 RSS 合计（读 /proc，非 Linux 时只有 ru_maxrss 近似值）"""
+    page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * page_size
+    except OSError:
+        import resource
+
+        return {"rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "chromium_processes": None, "chromium_rss_bytes": None}
+
+    # 遍历 /proc 建立父子关系，统计本进程所有后代中的 Chromium 进程
+    children: dict[int, list[int]] = {}
+    names: dict[int, str] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        pid = int(entry)
+        # comm 可能含空格，以最后一个 ')' 分隔
+        names[pid] = stat[stat.find("(") + 1:stat.rfind(")")]
+        ppid = int(stat[stat.rfind(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(pid)
+    chromium = []
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        if "chrom" in names.get(pid, "").lower() or "headless_shell" in names.get(pid, ""):
+            chromium.append(pid)
+    chromium_rss = 0
+    for pid in chromium:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                chromium_rss += int(f.read().split()[1]) * page_size
+        except OSError:
+            pass
+    return {"rss_bytes": rss, "chromium_processes": len(chromium), "chromium_rss_bytes": chromium_rss}
+
+
+class BrowserPool:
+    """常驻 Chromium 池：在 lifespan 中启动，每个请求分配一个独立的 BrowserContext（用完即关闭）。
+    浏览器打开 max_pages 个页面后或 Chromium 内存超过 max_rss_mb 时回收：不再分配新 context，
+    等在途抓取结束后关闭，下次使用时重新启动，长时间运行内存保持平稳"""
+
+    def __init__(
+        self,
+        size: int,
+        health_interval: float,
+        launch_args: Optional[list[str]] = None,
+        max_pages: int = 0,
+        max_rss_mb: float = 0,
+        drain_timeout: float = 60,
+    ):
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self.launch_args = launch_args or []
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.drain_timeout = drain_timeout
+        self._playwright: Optional[Playwright] = None
+        self._browsers: list[Optional[Browser]] = [None] * self.size
+        self._active: list[int] = [0] * self.size  # 每个槽位上正在使用的 context 数
+        self._in_use: dict[Browser, int] = {}  # 每个浏览器实例上正在使用的 context 数（回收时据此等待）
+        self._pages: list[int] = [0] * self.size  # 当前浏览器已打开的页面数
+        self._drained: list[Optional[asyncio.Event]] = [None] * self.size  # 槽位回收中：旧浏览器关闭后 set
+        self._launch_locks = [asyncio.Lock() for _ in range(self.size)]
+        self._health_task: Optional[asyncio.Task] = None
+        self._drain_tasks: set[asyncio.Task] = set()
+        self.restarts = 0
+        self.recycled: dict[str, int] = {}  # 回收原因（pages / rss）→ 次数
+
+    async def start(self) -> None:
+        self._playwright = await async_playwright().start()
+        for i in range(self.size):
+            try:
+                await self._ensure_browser(i)
+            except Exception as e:
+                # 启动失败不阻塞服务，首次请求或健康检查时再重试
+                logger.warning("浏览器 #%d 启动失败: %s", i, e)
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for task in list(self._drain_tasks):
+            task.cancel()
+        await asyncio.gather(*self._drain_tasks, return_exceptions=True)
+        for i, browser in enumerate(self._browsers):
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+            self._browsers[i] = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _ensure_browser(self, i: int) -> Browser:
+        """返回第 i 个浏览器；未启动或已崩溃（断开连接）则重新启动"""
+        browser = self._browsers[i]
+        if browser is not None and browser.is_connected():
+            return browser
+        drained = self._drained[i]
+        if drained is not None:
+            # 回收中：等旧浏览器处理完在途抓取并关闭后再启动新的，避免两个浏览器同时占用内存
+            await drained.wait()
+        async with self._launch_locks[i]:
+            browser = self._browsers[i]
+            if browser is not None and browser.is_connected():
+                return browser
+            if self._playwright is None:
+                raise RuntimeError("浏览器池未启动")
+            if browser is not None:
+                self.restarts += 1
+                logger.warning("浏览器 #%d 已断开，重新启动", i)
+            browser = await self._playwright.chromium.launch(headless=True, args=self.launch_args)
+            self._browsers[i] = browser
+            self._pages[i] = 0
+            return browser
+
+    def _retire(self, i: int, reason: str) -> None:
+        """回收第 i 个浏览器：不再分配新 context，在途抓取结束（或超过 drain_timeout）后关闭"""
+        browser = self._browsers[i]
+        if browser is None or self._drained[i] is not None:
+            return
+        self._browsers[i] = None
+        self._drained[i] = asyncio.Event()
+        self.recycled[reason] = self.recycled.get(reason, 0) + 1
+        logger.info("回收浏览器 #%d（%s，已打开 %d 个页面）", i, reason, self._pages[i])
+        task = asyncio.create_task(self._drain(i, browser))
+        self._drain_tasks.add(task)
+        task.add_done_callback(self._drain_tasks.discard)
+
+    async def _drain(self, i: int, browser: Browser) -> None:
+        try:
+            deadline = time.monotonic() + self.drain_timeout
+            while self._in_use.get(browser, 0) > 0 and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+            try:
+                await asyncio.wait_for(browser.close(), timeout=10)
+            except Exception:
+                pass
+        finally:
+            self._in_use.pop(browser, None)
+            self._pages[i] = 0
+            drained, self._drained[i] = self._drained[i], None
+            if drained is not None:
+                drained.set()
+
+    async def _check_memory(self) -> None:
+        """Chromium RSS 合计超过 max_rss_mb 时回收打开页面最多的浏览器（每次检查最多回收一个）"""
+        if self.max_rss_mb <= 0:
+            return
+        memory = await asyncio.to_thread(_process_memory)
+        chromium_rss = memory.get("chromium_rss_bytes")
+        if not chromium_rss or chromium_rss < self.max_rss_mb * 1024 * 1024:
+            return
+        candidates = [k for k in range(self.size) if self._browsers[k] is not None and self._drained[k] is None]
+        if candidates:
+            logger.warning("Chromium 内存 %.0f MB 超过上限 %.0f MB", chromium_rss / 1024 / 1024, self.max_rss_mb)
+            self._retire(max(candidates, key=lambda k: self._pages[k]), "rss")
+
+    async def _replace_browser(self, i: int) -> None:
+        """强制关闭第 i 个浏览器（如无响应），下次使用时重新启动"""
+        browser = self._browsers[i]
+        self._browsers[i] = None
+        if browser is not None:
+            self._in_use.pop(browser, None)
+            try:
+                await asyncio.wait_for(browser.close(), timeout=5)
+            except Exception:
+                pass
+        self.restarts += 1
+        await self._ensure_browser(i)
+
+    async def _probe(self, i: int) -> None:
+        """健康检查：能在限定时间内新建并关闭 context 即视为存活"""
+        browser = await self._ensure_browser(i)
+        context = await asyncio.wait_for(browser.new_context(), timeout=10)
+        await asyncio.wait_for(context.close(), timeout=10)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self._check_memory()
+            except Exception as e:
+                logger.warning("内存检查失败: %s", e)
+            for i in range(self.size):
+                if self._drained[i] is not None:
+                    continue
+                try:
+                    await self._probe(i)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("浏览器 #%d 健康检查失败，替换: %s", i, e)
+                    try:
+                        await self._replace_browser(i)
+                    except Exception as e2:
+                        logger.warning("浏览器 #%d 重启失败: %s", i, e2)
+
+    @asynccontextmanager
+    async def context(self) -> AsyncIterator[BrowserContext]:
+        """从负载最低（优先不在回收中）的浏览器分配一个独立 context，用完即关闭（cookie/缓存不跨请求共享）"""
+        i = min(range(self.size), key=lambda k: (self._drained[k] is not None, self._active[k]))
+        self._active[i] += 1
+        browser: Optional[Browser] = None
+        try:
+            with scrape_metrics.phase("browser_acquire"):
+                browser = await self._ensure_browser(i)
+                self._in_use[browser] = self._in_use.get(browser, 0) + 1
+                context = await browser.new_context(user_agent=USER_AGENT)
+
+            def count_page(_page: Page) -> None:
+                if self._browsers[i] is browser:
+                    self._pages[i] += 1
+
+            context.on("page", count_page)
+            try:
+                yield context
+            finally:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+        finally:
+            self._active[i] -= 1
+            if browser is not None:
+                if browser in self._in_use:
+                    self._in_use[browser] -= 1
+                if self.max_pages and self._browsers[i] is browser and self._pages[i] >= self.max_pages:
+                    self._retire(i, "pages")
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "connected": sum(1 for b in self._browsers if b is not None and b.is_connected()),
+            "active_contexts": sum(self._active),
+            "restarts": self.restarts,
+            "recycled": dict(self.recycled),
+            "draining": sum(1 for d in self._drained if d is not None),
+            "pages": list(self._pages),
+            "profile": BROWSER_PROFILE,
+        }
+
+
+browser_pool = BrowserPool(
+    BROWSER_POOL_SIZE,
+    BROWSER_HEALTH_INTERVAL,
+    BROWSER_LAUNCH_ARGS,
+    BROWSER_MAX_PAGES,
+    BROWSER_MAX_RSS_MB,
+    BROWSER_DRAIN_TIMEOUT,
+)
+
+
+class ScrapeScheduler:
+    """准入控制：限制同时进行的抓取数，超出部分在有界队列中排队，队列满或等待超时则快速拒绝"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.waiting_background = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._recent_waits: deque[float] = deque(maxlen=200)
+        self._recent_durations: deque[float] = deque(maxlen=200)
+
+    def _retry_after(self) -> int:
+        """按最近抓取耗时估算排在前面的请求需要多久跑完（秒）"""
+        durations = self._recent_durations
+        avg = sum(durations) / len(durations) if durations else 10.0
+        rounds = (self.waiting + self.waiting_background + 1) / self.max_concurrency
+        return max(1, math.ceil(rounds * avg))
+
+    @asynccontextmanager
+    async def slot(self, background: bool = False) -> AsyncIterator[float]:
+        """获取一个抓取名额，yield 排队等待的秒数。
+        background 为已由任务队列（SCRAPE_JOB_MAX_QUEUED）准入的后台任务：不占也不受排队上限与最长排队时间限制，一直等到有名额"""
+        start = time.monotonic()
+        if not self._sem.locked():
+            # 有空闲名额时 acquire 立即返回，不经过队列
+            await self._sem.acquire()
+        elif background:
+            self.waiting_background += 1
+            try:
+                await self._sem.acquire()
+            finally:
+                self.waiting_background -= 1
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="抓取请求过多，请稍后重试",
+                    headers={"Retry-After": str(self._retry_after())},
+                )
+            self.waiting += 1
+            try:
+                # 排队时间同样计入请求的总时间预算
+                await asyncio.wait_for(self._sem.acquire(), timeout=_budget(self.max_wait))
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="抓取排队超时，请稍后重试",
+                    headers={"Retry-After": str(self._retry_after())},
+                )
+            finally:
+                self.waiting -= 1
+        waited = time.monotonic() - start
+        self._recent_waits.append(waited)
+        self.in_flight += 1
+        try:
+            yield waited
+        finally:
+            self.in_flight -= 1
+            self._recent_durations.append(time.monotonic() - start - waited)
+            self._sem.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._recent_waits)
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "background_waiting": self.waiting_background,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000) if waits else 0,
+            "p95_wait_ms": round(waits[int(0.95 * (len(waits) - 1))] * 1000) if waits else 0,
+        }
+
+
+scrape_scheduler = ScrapeScheduler(SCRAPE_MAX_CONCURRENCY, SCRAPE_MAX_QUEUE, SCRAPE_MAX_QUEUE_WAIT)
+
+
+class TTLCache:
+    """有界 LRU 缓存，条目超过 TTL 视为过期"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+scrape_cache = TTLCache(SCRAPE_CACHE_SIZE, SCRAPE_CACHE_TTL)
+# 值为 site plan 图片地址；空字符串表示已确认 99.co 上没有（负缓存）
+site_plan_cache = TTLCache(SITE_PLAN_CACHE_SIZE, SITE_PLAN_CACHE_TTL)
+
+
+def _remember_site_plan(slug: str, site_plan_url: Optional[str]) -> None:
+    if not slug:
+        return
+    if site_plan_url:
+        site_plan_cache.set(slug, site_plan_url)
+    else:
+        site_plan_cache.set(slug, "", ttl=SITE_PLAN_NEGATIVE_TTL)
+
+
+class SqliteCache:
+    """SQLite 持久化缓存：重启/重新部署后仍保留，多个 worker 进程通过 WAL 并发读写同一文件。
+    值为 JSON 字符串；超过 TTL 视为过期，总大小超过上限时按最近访问时间淘汰。
+    方法均为同步阻塞调用，在事件循环中请用 asyncio.to_thread 调用。"""
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS scrape_cache (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_cache_accessed ON scrape_cache(accessed_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """每次操作单独开连接（autocommit），可在任意线程调用"""
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        """返回 (payload, 剩余有效秒数)，未命中或已过期返回 None"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload, expires_at FROM scrape_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE scrape_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0], row[1] - now
+
+    def set(self, key: str, payload: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scrape_cache (key, payload, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now + self.ttl, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """先删过期条目，仍超出大小上限则删最久未访问的条目"""
+        conn.execute("DELETE FROM scrape_cache WHERE expires_at <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM scrape_cache").fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM scrape_cache ORDER BY accessed_at LIMIT 50"
+            ).fetchall()
+            if not rows:
+                break
+            # 每批最多取 50 条，只删到总大小回到上限以内为止
+            victims = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM scrape_cache WHERE key = ?", victims)
+
+    def pop(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM scrape_cache WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scrape_cache"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _open_disk_cache() -> Optional[SqliteCache]:
+    if not SCRAPE_CACHE_DB:
+        return None
+    try:
+        return SqliteCache(SCRAPE_CACHE_DB, SCRAPE_CACHE_TTL, int(SCRAPE_CACHE_DB_MAX_MB * 1024 * 1024))
+    except sqlite3.Error as e:
+        logger.warning("磁盘缓存不可用，仅使用内存缓存: %s", e)
+        return None
+
+
+scrape_disk_cache = _open_disk_cache()
+
+
+class PageArchive:
+    """原始页面存档（内容寻址）：objects/<sha256 前两位>/<sha256>.gz 保存 gzip 压缩的 HTML / JSON，
+    相同内容只存一份；index.jsonl 每次抓取追加一行 { url, fetched_at, tier, html, json }（值为对象哈希）。
+    方法均为同步阻塞调用，在事件循环中请用 asyncio.to_thread 调用。"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.stored = 0
+        self.deduplicated = 0
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.gz")
+
+    def put_object(self, data: bytes) -> str:
+        """保存一个对象，返回其 sha256；已存在则不重复写入"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            self.deduplicated += 1
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=6))
+        os.replace(tmp, path)
+        self.stored += 1
+        return digest
+
+    def get_object(self, digest: str) -> bytes:
+        with open(self._object_path(digest), "rb") as f:
+            return gzip.decompress(f.read())
+
+    def add(self, url: str, html: str, captured: Optional[list] = None, tier: Optional[str] = None) -> dict:
+        entry = {
+            "url": url,
+            "fetched_at": time.time(),
+            "tier": tier,
+            "html": self.put_object(html.encode("utf-8")),
+            "json": self.put_object(json.dumps(captured, ensure_ascii=False).encode("utf-8")) if captured else None,
+        }
+        # 单行追加写入（O_APPEND），多个 worker 进程可共用同一个存档
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def entries(self, latest_only: bool = True) -> list[dict]:
+        """读取索引；latest_only 时每个链接只保留最近一次抓取"""
+        if not os.path.exists(self.index_path):
+            return []
+        entries: list[dict] = []
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # 写入中断留下的半行
+        if not latest_only:
+            return entries
+        latest: dict[str, dict] = {}
+        for entry in entries:
+            latest[entry["url"]] = entry
+        return list(latest.values())
+
+    def load(self, entry: dict) -> tuple[str, Optional[list]]:
+        """返回 (HTML, 捕获的 JSON 列表或 None)"""
+        html = self.get_object(entry["html"]).decode("utf-8")
+        captured = json.loads(self.get_object(entry["json"])) if entry.get("json") else None
+        return html, captured
+
+    def stats(self) -> dict:
+        return {"root": self.root, "stored": self.stored, "deduplicated": self.deduplicated}
+
+
+def _open_archive() -> Optional[PageArchive]:
+    if not SCRAPE_ARCHIVE_DIR:
+        return None
+    try:
+        return PageArchive(SCRAPE_ARCHIVE_DIR)
+    except OSError as e:
+        logger.warning("页面存档目录不可用，不保存原始页面: %s", e)
+        return None
+
+
+page_archive = _open_archive()
+_archive_tasks: set[asyncio.Task] = set()
+
+
+def _archive_page(url: str, html: Optional[str], captured: Optional[list], tier: str) -> None:
+    """后台写入页面存档（压缩与写盘在线程中进行，不阻塞抓取响应）"""
+    if page_archive is None or not html:
+        return
+
+    async def write() -> None:
+        try:
+            await asyncio.to_thread(page_archive.add, url, html, captured, tier)
+        except Exception as e:
+            logger.warning("页面存档写入失败: %s (%s)", url, e)
+
+    task = asyncio.create_task(write())
+    _archive_tasks.add(task)
+    task.add_done_callback(_archive_tasks.discard)
+
+
+class SingleFlight:
+    """合并同一 key 的并发调用：第一个调用者真正执行，其余调用者等待同一个结果。
+    发起者离开时只要还有其他等待者，调用继续执行；所有等待者都离开后取消调用"""
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+        # 所有等待者都已取消时，避免 "Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """返回 (结果, 是否复用了其他请求正在进行的调用)"""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # shield：单个等待者离开（断开、超时）不影响其他等待者
+            return await asyncio.shield(task), shared
+        finally:
+            if not task.done() and self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] <= 0:
+                    self.abandoned += 1
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "coalesced": self.coalesced, "abandoned": self.abandoned}
+
+
+scrape_flights = SingleFlight()
+
+
+# 广告、统计、埋点等第三方域名（按域名后缀匹配），抓取时一律不加载
+TRACKER_HOSTS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "adservice.google.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "bat.bing.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "adnxs.com",
+    "amazon-adsystem.com",
+    "scorecardresearch.com",
+    "nr-data.net",
+    "newrelic.com",
+    "segment.io",
+    "mixpanel.com",
+    "analytics.tiktok.com",
+    "sc-static.net",
+    "ads.linkedin.com",
+    "snap.licdn.com",
+    "branch.io",
+    "intercom.io",
+    "onesignal.com",
+]
+
+# 各站点放行的资源（URL 子串），即使类型在屏蔽列表中也照常加载。
+# 房源图库/户型图为懒加载，放行图片 CDN 以保证 src 照常写入、尺寸过滤（bounding_box）可用。
+RESOURCE_ALLOW_LISTS = {
+    "propertyguru": ["pgimgs.com"],
+    "99co": ["pic2.99.co"],
+}
+
+
+class ResourcePolicy:
+    """page.route 拦截策略：放行站点白名单，屏蔽重资源类型与跟踪域名"""
+
+    def __init__(self, enabled: bool, blocked_types: set[str], blocked_hosts: list[str], allow_lists: dict[str, list[str]]):
+        self.enabled = enabled
+        self.blocked_types = blocked_types
+        self.blocked_hosts = blocked_hosts
+        self.allow_lists = allow_lists
+        self.blocked = 0
+        self.allowed = 0
+
+    def _is_tracker(self, url: str) -> bool:
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == h or host.endswith("." + h) for h in self.blocked_hosts)
+
+    def should_block(self, site: str, url: str, resource_type: str) -> bool:
+        if any(pattern in url for pattern in self.allow_lists.get(site, [])):
+            return False
+        return resource_type in self.blocked_types or self._is_tracker(url)
+
+    async def apply(self, page: Page, site: str) -> None:
+        """为页面安装拦截规则；site 为 RESOURCE_ALLOW_LISTS 中的站点键"""
+        if not self.enabled and not SCRAPE_UPSTREAM_OVERRIDES:
+            return
+
+        async def handle(route) -> None:
+            request = route.request
+            if self.enabled and self.should_block(site, request.url, request.resource_type):
+                self.blocked += 1
+                await route.abort()
+                return
+            self.allowed += 1
+            upstream = _upstream_url(request.url)
+            if upstream != request.url:
+                # 改写到替身服务器（可能跨协议，continue_ 不支持），由 Playwright 代为请求后原样返回
+                await route.fulfill(response=await route.fetch(url=upstream))
+            else:
+                await route.continue_()
+
+        await page.route("**/*", handle)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "blocked": self.blocked, "allowed": self.allowed}
+
+
+resource_policy = ResourcePolicy(
+    SCRAPE_BLOCK_RESOURCES,
+    SCRAPE_BLOCKED_RESOURCE_TYPES,
+    TRACKER_HOSTS + SCRAPE_BLOCKED_HOSTS_EXTRA,
+    RESOURCE_ALLOW_LISTS,
+)
+
+
+# 反爬挑战页特征（Cloudflare 等），命中即视为被拦截，改用浏览器
+_BOT_CHALLENGE_RE = re.compile(
+    r"<title>\s*(?:Just a moment|Attention Required|Access denied)|challenge-platform|cf-chl-|/cdn-cgi/challenge",
+    re.I,
+)
+
+
+class HttpFetcher:
+    """HTTP 直取层：共享连接池的 httpx.AsyncClient，取回服务端渲染的页面 HTML"""
+
+    def __init__(self, enabled: bool, timeout: float):
+        self.enabled = enabled
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self.fetched = 0
+        self.blocked = 0
+        self.errors = 0
+        self.served = 0  # 直接由 HTTP 层给出结果
+        self.fallbacks = 0  # 转交浏览器
+        self.not_modified = 0  # 条件请求返回 304
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        self._client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-SG,en;q=0.9",
+            },
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_html(self, url: str) -> tuple[Optional[str], int]:
+        """返回 (HTML, 状态码)；被反爬拦截、出错或未启用时 HTML 为 None"""
+        if self._client is None:
+            return None, 0
+        try:
+            resp = await self._client.get(_upstream_url(url))
+        except httpx.HTTPError:
+            self.errors += 1
+            return None, 0
+        if resp.status_code in (403, 429, 503) or (
+            resp.status_code == 200 and _BOT_CHALLENGE_RE.search(resp.text[:8192])
+        ):
+            self.blocked += 1
+            return None, resp.status_code
+        if resp.status_code != 200:
+            return None, resp.status_code
+        self.fetched += 1
+        return resp.text, resp.status_code
+
+    async def get_conditional(
+        self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> tuple[Optional[str], int, dict]:
+        """条件请求（If-None-Match / If-Modified-Since），返回 (HTML, 状态码, { etag, last_modified })。
+        未变化时状态码为 304、HTML 为 None；房源下架后被重定向到非房源页时按 410 返回"""
+        if self._client is None:
+            return None, 0, {}
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            resp = await self._client.get(_upstream_url(url), headers=headers)
+        except httpx.HTTPError:
+            self.errors += 1
+            return None, 0, {}
+        validators = {"etag": resp.headers.get("etag"), "last_modified": resp.headers.get("last-modified")}
+        if resp.status_code == 304:
+            self.not_modified += 1
+            return None, 304, {"etag": validators["etag"] or etag, "last_modified": validators["last_modified"] or last_modified}
+        if resp.status_code in (403, 429, 503) or (
+            resp.status_code == 200 and _BOT_CHALLENGE_RE.search(resp.text[:8192])
+        ):
+            self.blocked += 1
+            return None, resp.status_code, {}
+        if resp.status_code == 200 and resp.history and "/listing/" not in resp.url.path:
+            return None, 410, {}
+        if resp.status_code != 200:
+            return None, resp.status_code, {}
+        self.fetched += 1
+        return resp.text, 200, validators
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "fetched": self.fetched,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "not_modified": self.not_modified,
+        }
+
+
+http_fetcher = HttpFetcher(SCRAPE_HTTP_FAST_PATH, SCRAPE_HTTP_TIMEOUT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await browser_pool.start()
+    await http_fetcher.start()
+    await selector_stats.start()
+    scrape_jobs.start()
+    try:
+        yield
+    finally:
+        await scrape_jobs.stop()
+        await selector_stats.stop()
+        if _archive_tasks:
+            await asyncio.gather(*_archive_tasks, return_exceptions=True)
+        await http_fetcher.stop()
+        await browser_pool.stop()
+        if _extraction_executor is not None:
+            _extraction_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="Property Scrape API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,536 +1482,2181 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Queue-Wait", "X-Cache", "Server-Timing"],
+)
+
+
+class ScrapeRequest(BaseModel):
+    url: str
+    force_refresh: bool = False  # 忽略缓存，强制重新抓取
+    debug: bool = False  # 响应中附带 debug 字段（阶段耗时、字段来源、缓存状态）
+
+
+class BatchScrapeRequest(BaseModel):
+    urls: list[str]
+    force_refresh: bool = False
+
+
+class RefreshItem(BaseModel):
+    link: str
+    etag: Optional[str] = None  # 上次刷新返回的校验值，原样带回
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    previous: Optional[dict] = None  # 当前保存的房源字段（ScrapeResponse 字段名），用于输出逐字段变化
+
+
+class RefreshRequest(BaseModel):
+    items: list[RefreshItem]
+
+
+class ScrapeJobRequest(BaseModel):
+    url: str
+    force_refresh: bool = False
+    priority: int = 0  # 数值越大越先执行
+
+
+class SitePlanRequest(BaseModel):
+    apartment_name: str
+
+
+class SitePlanResponse(BaseModel):
+    site_plan_url: str
+
+
+class ScrapeDebug(BaseModel):
+    cache: str  # HIT / MISS / COALESCED
+    tier: Optional[str] = None
+    total_ms: float
+    queue_wait_ms: float
+    phases: list[dict]  # [{ name, ms }]，按发生顺序
+    sources: dict[str, str]  # 字段 → 产出它的选择器 / 策略（本次请求实际抓取时才有）
+    skipped_phases: list[str] = []  # 因剩余时间不足而跳过的可选阶段
+
+
+class ScrapeResponse(BaseModel):
+    title: str
+    link: str
+    price: Optional[str] = None
+    size_sqft: Optional[str] = None
+    bedrooms: Optional[str] = None
+    bathrooms: Optional[str] = None
+    main_image_url: Optional[str] = None
+    image_urls: Optional[list[str]] = None  # 第一张主图 + 第二张户型图
+    floor_plan_url: Optional[str] = None
+    basic_info: Optional[str] = None
+    listing_agent_name: Optional[str] = None  # 卖家中介姓名
+    listing_agent_phone: Optional[str] = None  # 卖家中介电话
+    listing_type: Optional[str] = None  # 'sale' | 'rent' 出售 vs 出租
+    lease_tenure: Optional[str] = None  # 地契：99年地契、999年地契、永久地契
+    site_plan_url: Optional[str] = None  # 公寓小区平面图，从 99.co 抓取
+    tier: Optional[str] = None  # 抓取方式：http（HTTP 直取）/ browser（浏览器）
+    debug: Optional[ScrapeDebug] = None  # 仅请求 debug 时返回
+
+
+class ScrapeJobResponse(BaseModel):
+    job_id: str
+    url: str
+    priority: int
+    status: str  # queued | running | succeeded | failed | cancelled
+    result: Optional[ScrapeResponse] = None
+    error: Optional[dict] = None  # { status, detail }
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+def _normalize_propertyguru_url(url: str) -> str:
+    """统一 Property Guru 链接格式，便于去重"""
+    url = url.strip()
+    if not url.startswith("http"):
+        url = "https://" + url
+    return url.rstrip("/")
+
+
+def _scrape_cache_key(url: str) -> str:
+    """缓存键：规范化后的链接去掉 query/fragment（如 utm 参数），域名小写"""
+    parts = urlsplit(_normalize_propertyguru_url(url))
+    return f"{parts.scheme}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+async def _cache_get(key: str) -> Optional[ScrapeResponse]:
+    """先查内存缓存，未命中再查磁盘缓存并回填内存"""
+    cached = scrape_cache.get(key)
+    if cached is not None or scrape_disk_cache is None:
+        return cached
+    try:
+        row = await asyncio.to_thread(scrape_disk_cache.get, key)
+    except sqlite3.Error as e:
+        logger.warning("读取磁盘缓存失败: %s", e)
+        return None
+    if row is None:
+        return None
+    payload, ttl_left = row
+    try:
+        result = ScrapeResponse.model_validate_json(payload)
+    except (ValidationError, ValueError) as e:
+        # 行损坏或字段结构已变：删除后按未命中处理，重新抓取
+        logger.warning("磁盘缓存条目无法解析，已删除: %s (%s)", key, e)
+        try:
+            await asyncio.to_thread(scrape_disk_cache.pop, key)
+        except sqlite3.Error:
+            pass
+        return None
+    scrape_cache.set(key, result, ttl=ttl_left)
+    return result
+
+
+async def _cache_set(key: str, result: ScrapeResponse) -> None:
+    scrape_cache.set(key, result)
+    if scrape_disk_cache is None:
+        return
+    try:
+        await asyncio.to_thread(scrape_disk_cache.set, key, result.model_dump_json())
+    except sqlite3.Error as e:
+        logger.warning("写入磁盘缓存失败: %s", e)
+
+
+_FREEHOLD_RE = re.compile(r"freehold|永久|永久地契", re.I)
+_LEASE_999_RE = re.compile(r"999\s*[- ]?year|999\s*年|999年地契", re.I)
+_LEASE_99_RE = re.compile(r"\b99\s*[- ]?year|\b99\s*年|99年地契|leasehold", re.I)
+
+
+def _detect_lease_tenure(body: str) -> Optional[str]:
+    """从页面内容识别地契/租期，仅对出售房源有意义"""
+    # 永久/Freehold 优先
+    if _FREEHOLD_RE.search(body):
+        return "永久地契"
+    # 999 必须先于 99 检查，避免误判
+    if _LEASE_999_RE.search(body):
+        return "999年地契"
+    if _LEASE_99_RE.search(body):
+        return "99年地契"
+    return None
+
+
+def _extract_apartment_name(title: str) -> Optional[str]:
+    """从房源 title 提取公寓/项目名，用于 99.co 查询"""
+    if not title or len(title.strip()) < 2:
+        return None
+    t = title.strip()
+    # "Project - 2 Bedroom" -> Project
+    m = re.match(r"^(.+?)\s*[-–—]\s+", t)
+    if m:
+        return m.group(1).strip()
+    # "2 Bed at Project Name" -> Project Name
+    m = re.search(r"\s+at\s+(.+)$", t, re.I)
+    if m:
+        return m.group(1).strip()
+    return t
+
+
+def _apartment_name_to_slug(name: str) -> str:
+    """将公寓名称转为 99.co URL 的 slug：去掉特殊字符、空格变横线"""
+    # 去掉特殊字符（如 @），只保留字母、数字、空格、连字符
+    slug = re.sub(r"[^a-zA-Z0-9\s\-]", "", name.strip())
+    # 将单个或多个空格统一替换为单个 -
+    slug = re.sub(r"\s+", "-", slug)
+    slug = slug.lower().strip("-")
+    for suffix in ["-condo", "-residences", "-residence"]:
+        if slug.endswith(suffix):
+            slug = slug[: -len(suffix)]
+    return slug
+
+
+_FOR_SALE_RE = re.compile(r"for[ -]sale", re.I)
+_FOR_RENT_RE = re.compile(r"for[ -]rent", re.I)
+
+
+def _detect_listing_type(url: str, body: str) -> Optional[str]:
+    """从 URL 或页面内容识别房源类型：出售 vs 出租"""
+    url_lower = url.lower()
+    if "/for-sale/" in url_lower or "/for_sale/" in url_lower:
+        return "sale"
+    if "/for-rent/" in url_lower or "/for_rent/" in url_lower or "/rent/" in url_lower:
+        return "rent"
+    # 页面文案常见：For Sale / For Rent
+    if _FOR_SALE_RE.search(body):
+        return "sale"
+    if _FOR_RENT_RE.search(body):
+        return "rent"
+    return None
+
+
+# Property Guru 房源页就绪标志：价格与图库图片都已渲染（每项内逗号分隔的选择器任一出现即可）
+LISTING_READY_SELECTORS = [
+    '[data-automation-id="listing-detail-price"], [class*="price"]',
+    'img[src*="pgimgs"], [class*="gallery"] img',
+]
+
+PRICE_SELECTORS = [
+    '[data-automation-id="listing-detail-price"]',
+    '[class*="price"]',
+    '[data-testid*="price"]',
+    'span:has-text("S$")',
+    'span:has-text("$")',
+]
+
+SIZE_SELECTORS = [
+    'text=/\\d+\\s*sqft/i',
+    'text=/\\d+\\s*sq\\s*ft/i',
+    '[class*="size"]',
+    '[data-automation-id*="size"]',
+]
+
+AGENT_SELECTORS = [
+    '[data-automation-id*="agent"]',
+    '[data-automation-id*="listing-agent"]',
+    '[class*="listing-agent"]',
+    '[class*="agent-name"]',
+    '[class*="contact-agent"]',
+    'a[href*="/agent/"]',
+    '[class*="seller"]',
+]
+
+# 主图区域（排除户型图），按优先级排列
+GALLERY_SELECTORS = [
+    '[data-automation-id*="listing-gallery"] img',
+    '[data-automation-id*="listing-detail"] img',
+    '[class*="listing-gallery"] img',
+    '[class*="listing-images"] img',
+    '[class*="property-gallery"] img',
+    '[class*="photo-gallery"] img',
+    'img[src*="pgimgs.com/listing"]',
+    'img[src*="pgimgs"]',
+    '[class*="gallery"] img',
+    '[class*="carousel"] img',
+]
+
+# 打开媒体画廊（户型图常在 modal 内）
+GALLERY_OPEN_SELECTOR = (
+    '[data-automation-id*="media-gallery"], [data-automation-id*="gallery"], '
+    '[class*="media-gallery"] button, [class*="photo-gallery"] button, '
+    'button:has-text("View"), a:has-text("View all"), [class*="gallery"] [role="button"]'
 )
 
+FLOOR_PLAN_SELECTORS = [
+    'img[da-id="media-gallery-floorPlans"]',
+    'img.floorPlans',
+    '.floorPlans-section img',
+    'img.media-image.floorPlans',
+]
+
+SITE_PLAN_IMG_SELECTORS = [
+    "#site_plans img.CarouselPhoto_image__06711",
+    "#site_plans .CarouselPhoto_imageContainer__WOp2O img",
+    "#site_plans img[src*='pic2.99.co']",
+    "#site_plans img",
+]
+
+
+async def _wait_ready(page: Page, selectors: list[str], timeout_ms: int) -> bool:
+    """等待所有选择器都出现在 DOM 中（仅支持 CSS），超时返回 False 而不抛异常"""
+    if timeout_ms <= 0:
+        return False
+    try:
+        await page.wait_for_function(
+            "sels => sels.every(s => document.querySelector(s))",
+            arg=selectors,
+            timeout=timeout_ms,
+        )
+        return True
+    except Exception:
+        return False
+
+
+def _site_plan_page_url(slug: str) -> str:
+    return f"https://www.99.co/singapore/condos-apartments/{slug}#site_plans"
+
+
+async def _find_site_plan(page: Page, slug: str, goto_timeout: int) -> tuple[Optional[str], bool]:
+    """打开 99.co 公寓页面定位 site plan 图片：等 #site_plans 出现 → 滚动触发懒加载 → 等图片就绪。
+    返回 (图片地址, 是否确定)：页面不存在（404/410）或已渲染完成却没有 #site_plans 为确定的未找到；
+    被拦截（403/429/5xx、挑战页）、渲染超时或图片未加载出来时不确定，不应做负缓存"""
+    await resource_policy.apply(page, "99co")
+    resp = await page.goto(_upstream_url(_site_plan_page_url(slug)), wait_until="domcontentloaded", timeout=goto_timeout)
+    if resp is not None and resp.status >= 400:
+        return None, resp.status in (404, 410)
+    deadline = time.monotonic() + READY_TIMEOUT_SITE_PLAN / 1000
+    if not await _wait_ready(page, ["#site_plans"], READY_TIMEOUT_SITE_PLAN):
+        rendered = await page.evaluate(
+            """() => document.readyState === 'complete'
+            && !!document.querySelector('h1')
+            && !/Just a moment|Attention Required|Access denied/i.test(document.title)"""
+        )
+        return None, bool(rendered)
+    await page.evaluate(
+        """() => {
+        const el = document.querySelector('#site_plans');
+        if (el) el.scrollIntoView();
+    }"""
+    )
+    remaining = int((deadline - time.monotonic()) * 1000)
+    await _wait_ready(page, ["#site_plans img[src*='pic2.99.co']"], remaining)
+    for sel in selector_stats.order("site_plan", SITE_PLAN_IMG_SELECTORS):
+        try:
+            if await page.locator(sel).count() > 0:
+                src = await page.locator(sel).first.get_attribute("src")
+                if src and "pic2.99.co" in src:
+                    _record_selector("site_plan", sel, True)
+                    return src, True
+        except Exception:
+            pass
+        _record_selector("site_plan", sel, False)
+    return None, False
+
+
+def _is_logo_or_ui(src: str, alt: str) -> bool:
+    """排除 logo、favicon、品牌图等非房源图"""
+    if not src:
+        return True
+    s = src.lower()
+    a = (alt or "").lower()
+    skip = ["logo", "favicon", "brand", "icon", "avatar", "placeholder"]
+    return any(x in s or x in a for x in skip)
+
+
+async def _extract_with_locators(page: Page, url: str) -> dict:
+    """逐个选择器调用 Playwright 提取字段（每个未命中的选择器都要等待超时）"""
+    title = ""
+    price: Optional[str] = None
+    size_sqft: Optional[str] = None
+    bedrooms: Optional[str] = None
+    bathrooms: Optional[str] = None
+    main_image_url: Optional[str] = None
+    image_urls: list[str] = []
+    floor_plan_url: Optional[str] = None
+    basic_info_parts: list[str] = []
+
+    # Title: og:title 或 h1
+    og_title = await page.evaluate(
+        """() => {
+        const m = document.querySelector('meta[property="og:title"]');
+        return m ? m.getAttribute('content') : '';
+    }"""
+    )
+    if og_title:
+        title = og_title
+
+    if not title:
+        h1 = await page.locator("h1").first.text_content()
+        if h1:
+            title = h1.strip()
+
+    if not title:
+        title = "Property"
+
+    # Price: 常见选择器
+    for sel in selector_stats.order("price", PRICE_SELECTORS):
+        try:
+            el = page.locator(sel).first
+            txt = await el.text_content(timeout=_budget_ms(500))
+            if txt and re.search(r"[\$S].*[\d,]+", txt):
+                price = txt.strip()
+                _record_selector("price", sel, True)
+                break
+        except Exception:
+            pass
+        _record_selector("price", sel, False)
+
+    if not price:
+        body = await page.content()
+        price_match = re.search(
+            r"S?\$[\s]*[\d,]+(?:\s*(?:million|mil|k|K))?", body
+        )
+        if price_match:
+            price = price_match.group(0).strip()
+
+    # Size: sqft
+    for sel in selector_stats.order("size", SIZE_SELECTORS):
+        try:
+            el = page.locator(sel).first
+            txt = await el.text_content(timeout=_budget_ms(500))
+            if txt and re.search(r"\d+\s*sq", txt, re.I):
+                size_sqft = txt.strip()
+                _record_selector("size", sel, True)
+                break
+        except Exception:
+            pass
+        _record_selector("size", sel, False)
+
+    body = await page.content()
+    if not size_sqft:
+        size_match = re.search(r"(\d[\d,]*)\s*sq\s*ft", body, re.I)
+        if size_match:
+            size_sqft = f"{size_match.group(1)} sqft"
+
+    # Bedrooms & Bathrooms: 常见格式 2 Bedrooms, 3 Bathrooms 或 2Bedroom 2Bathroom
+    bed_match = re.search(r"(\d+)\s*bed(?:room)?s?", body, re.I)
+    if bed_match:
+        bedrooms = bed_match.group(1) + " 房"
+    bath_match = re.search(r"(\d+)\s*bath(?:room)?s?", body, re.I)
+    if bath_match:
+        bathrooms = bath_match.group(1) + " 卫"
+    if price:
+        basic_info_parts.append(price)
+    if size_sqft:
+        basic_info_parts.append(size_sqft)
+    if bedrooms:
+        basic_info_parts.append(bedrooms)
+    if bathrooms:
+        basic_info_parts.append(bathrooms)
+    basic_info = " | ".join(basic_info_parts) if basic_info_parts else None
+
+    # 收集第一张主图 + 第二张户型图（排除 logo、网站图标等）
+    og_image = await page.evaluate(
+        """() => {
+        const m = document.querySelector('meta[property="og:image"]');
+        return m ? m.getAttribute('content') : '';
+    }"""
+    )
+    # og:image 可能是网站 logo，仅当不含 logo 且无更好选择时使用
+    if og_image and _is_logo_or_ui(og_image, ""):
+        og_image = None
+
+    # 优先从主图区域抓取第一张房源图（排除户型图）
+    seen_srcs: set[str] = set()
+    for selector in selector_stats.order("gallery", GALLERY_SELECTORS):
+        if len(image_urls) >= 1 and main_image_url:
+            break
+        try:
+            imgs = await page.locator(selector).all()
+            for img in imgs[:12]:
+                if len(image_urls) >= 1 and main_image_url:
+                    break
+                src = await img.get_attribute("src")
+                alt = await img.get_attribute("alt") or ""
+                if not src or src in seen_srcs:
+                    continue
+                if "floor" in src.lower() or "plan" in src.lower():
+                    continue
+                if _is_logo_or_ui(src, alt):
+                    continue
+                # 可选：排除过小图片（logo 通常 < 80px）
+                try:
+                    box = await img.bounding_box()
+                    if box and (box["width"] < 60 or box["height"] < 60):
+                        continue
+                except Exception:
+                    pass
+                seen_srcs.add(src)
+                if not main_image_url:
+                    main_image_url = src
+                if len(image_urls) < 1:
+                    image_urls.append(src)
+        except Exception:
+            pass
+        _record_selector("gallery", selector, bool(main_image_url))
+
+    # 若仍未找到，才用 og:image 作为兜底（且确认不是 logo）
+    if og_image and not main_image_url:
+        main_image_url = og_image
+    if og_image and len(image_urls) < 1 and og_image not in image_urls:
+        image_urls.insert(0, og_image)
+
+    # Floor plan: 优先从 Property Guru 媒体画廊的 floorPlans-section 抓取（可能在 modal 内）
+    floor_plan_start = time.perf_counter()
+    # 户型图常在未打开的 modal 内，第一轮只记录命中；未命中由打开画廊后的第二轮记录
+    for sel in selector_stats.order("floor_plan", FLOOR_PLAN_SELECTORS):
+        try:
+            if await page.locator(sel).count() > 0:
+                src = await page.locator(sel).first.get_attribute("src", timeout=_budget_ms(2000))
+                if src:
+                    floor_plan_url = src
+                    _record_selector("floor_plan", sel, True)
+                    break
+        except Exception:
+            pass
+    # 若 modal 未打开导致找不到，尝试点击打开媒体画廊（剩余时间不足时跳过）
+    if not floor_plan_url and _optional_phase("floor_plan"):
+        try:
+            gallery_loc = page.locator(GALLERY_OPEN_SELECTOR).first
+            if await gallery_loc.count() > 0:
+                await gallery_loc.click(timeout=_budget_ms(5000, _OPTIONAL_PHASE_RESERVE))
+                await _wait_ready(
+                    page, [", ".join(FLOOR_PLAN_SELECTORS)], _budget_ms(READY_TIMEOUT_GALLERY, _OPTIONAL_PHASE_RESERVE)
+                )
+                for sel in selector_stats.order("floor_plan", FLOOR_PLAN_SELECTORS):
+                    try:
+                        if await page.locator(sel).count() > 0:
+                            src = await page.locator(sel).first.get_attribute(
+                                "src", timeout=_budget_ms(2000, _OPTIONAL_PHASE_RESERVE)
+                            )
+                            if src:
+                                floor_plan_url = src
+                                _record_selector("floor_plan", sel, True)
+                                break
+                    except Exception:
+                        pass
+                    _record_selector("floor_plan", sel, False)
+        except Exception:
+            pass
+    # 兜底：含 floor/plan 的图
+    if not floor_plan_url:
+        floor_imgs = await page.locator(
+            'img[src*="floor"], img[src*="plan"], [alt*="floor" i] img, [alt*="plan" i] img'
+        ).all()
+        for img in floor_imgs[:3]:
+            src = await img.get_attribute("src")
+            if src:
+                floor_plan_url = src
+                break
+    scrape_metrics.observe("floor_plan", time.perf_counter() - floor_plan_start)
+
+    # image_urls: 第一张主图 + 第二张户型图
+    if floor_plan_url and floor_plan_url not in image_urls:
+        image_urls.append(floor_plan_url)
+
+    # 卖家中介：姓名与电话（Property Guru 常见结构）
+    agent_start = time.perf_counter()
+    listing_agent_name: Optional[str] = None
+    listing_agent_phone: Optional[str] = None
+    # 1. 优先从 tel: 链接提取电话
+    tel_links = await page.locator('a[href^="tel:"]').all()
+    for tel in tel_links[:8]:
+        href = await tel.get_attribute("href")
+        if href:
+            phone = re.sub(r"[\s\-]", "", href.replace("tel:", "").strip())
+            if re.search(r"^\+?[\d]{8,15}$", phone):
+                listing_agent_phone = phone
+                # 尝试从同一区域获取中介姓名（父级容器内找非按钮文字）
+                if not listing_agent_name:
+                    try:
+                        parent = tel.locator("xpath=ancestor::*[contains(@class, 'agent') or contains(@class, 'contact') or contains(@class, 'listing')][1]")
+                        if await parent.count() > 0:
+                            parent_txt = await parent.first.text_content(timeout=300)
+                            if parent_txt:
+                                skip_words = {"contact", "call", "whatsapp", "phone", "sms", "enquire", "view"}
+                                for part in re.split(r"[\s\n]+", parent_txt.replace(phone, "")):
+                                    s = part.strip()
+                                    if 2 <= len(s) <= 40 and not re.search(r"^[\d\+\-]+$", s) and s.lower() not in skip_words:
+                                        listing_agent_name = s
+                                        break
+                    except Exception:
+                        pass
+                break
+    # 2. 正则从 HTML 中提取 tel:
+    if not listing_agent_phone:
+        tel_match = re.search(r'tel:(\+?[\d\s\-\.]{8,25})', body)
+        if tel_match:
+            p = re.sub(r"[\s\-\.]", "", tel_match.group(1))
+            if re.search(r"^\+?[\d]{8,15}$", p):
+                listing_agent_phone = p
+    # 3. 兜底：新加坡常见格式 +65 8/9xxx xxxx 或 8 位手机号
+    if not listing_agent_phone:
+        sg_phone_patterns = [
+            r"(?:\+65|65)\s*(\d[\d\s]{6,11})",
+            r"(\+65\s*\d{4}\s*\d{4})",
+            r"(?:contact|call|phone|tel)[:\s]*(\+?[\d\s\-]{8,20})",
+        ]
+        for pat in sg_phone_patterns:
+            m = re.search(pat, body, re.I)
+            if m:
+                p = re.sub(r"[\s\-]", "", m.group(1))
+                if re.search(r"^\+?[\d]{8,15}$", p):
+                    listing_agent_phone = p if p.startswith("+") else (f"+65{p}" if len(p) == 8 and p[0] in "89" else p)
+                    break
+    # 4. 中介姓名（逐个选择器等待，剩余时间不足时跳过）
+    agent_selectors = selector_stats.order("agent", AGENT_SELECTORS) if _optional_phase("agent") else []
+    for sel in agent_selectors:
+        try:
+            el = page.locator(sel).first
+            txt = await el.text_content(timeout=_budget_ms(500, _OPTIONAL_PHASE_RESERVE))
+            if txt and 2 <= len(txt.strip()) <= 80 and not re.search(r"^[\d\+]+$", txt.strip()):
+                listing_agent_name = txt.strip()
+                _record_selector("agent", sel, True)
+                break
+        except Exception:
+            pass
+        _record_selector("agent", sel, False)
+    scrape_metrics.observe("agent", time.perf_counter() - agent_start)
+
+    listing_type = _detect_listing_type(url, body)
+    # 地契仅对出售房源有意义，租房不抓取
+    lease_tenure = None
+    if listing_type == "sale":
+        lease_tenure = _detect_lease_tenure(body)
+
+    return {
+        "title": title,
+        "price": price,
+        "size_sqft": size_sqft,
+        "bedrooms": bedrooms,
+        "bathrooms": bathrooms,
+        "main_image_url": main_image_url,
+        "image_urls": image_urls[:2] if image_urls else None,
+        "floor_plan_url": floor_plan_url,
+        "basic_info": basic_info,
+        "listing_agent_name": listing_agent_name,
+        "listing_agent_phone": listing_agent_phone,
+        "listing_type": listing_type,
+        "lease_tenure": lease_tenure,
+    }
+
+
+# 一次 page.evaluate 收集所有候选数据：各选择器首个匹配的文本、图库图片（含尺寸）、户型图、tel 链接、meta 与 HTML。
+# 选择器支持 CSS 以及本文件用到的两种 Playwright 扩展写法：`css:has-text("x")` 与 `text=/re/flags`。
+_PAGE_DATA_JS = """(args) => {
+    const firstMatch = (sel) => {
+        const hasText = /^(.*):has-text\\("(.*)"\\)$/.exec(sel);
+        if (hasText) {
+            for (const el of document.querySelectorAll(hasText[1] || '*')) {
+                if ((el.textContent || '').includes(hasText[2])) return el;
+            }
+            return null;
+        }
+        const textRe = /^text=\\/(.*)\\/([a-z]*)$/.exec(sel);
+        if (textRe) {
+            const re = new RegExp(textRe[1], textRe[2]);
+            const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+            while (walker.nextNode()) {
+                const parent = walker.currentNode.parentElement;
+                if (parent && !/^(SCRIPT|STYLE|NOSCRIPT|TEMPLATE)$/.test(parent.tagName) && re.test(walker.currentNode.textContent)) return parent;
+            }
+            return null;
+        }
+        try { return document.querySelector(sel); } catch (e) { return null; }
+    };
+    const all = (sel) => { try { return Array.from(document.querySelectorAll(sel)); } catch (e) { return []; } };
+    const texts = (sels) => sels.map(sel => {
+        const el = firstMatch(sel);
+        return { selector: sel, text: el ? el.textContent : null };
+    });
+    // 与 Playwright bounding_box 一致：不可见元素返回 null
+    const box = (el) => {
+        if (!el.getClientRects().length) return null;
+        const r = el.getBoundingClientRect();
+        return { width: r.width, height: r.height };
+    };
+    const meta = (p) => {
+        const m = document.querySelector(`meta[property="${p}"]`);
+        return m ? m.getAttribute('content') : '';
+    };
+    const floorPlans = () => ({
+        floor_plans: args.floorPlan.map(sel => {
+            const el = all(sel)[0];
+            return { selector: sel, src: el ? el.getAttribute('src') : null };
+        }),
+        floor_images: all('img[src*="floor"], img[src*="plan"], [alt*="floor" i] img, [alt*="plan" i] img')
+            .slice(0, 3).map(img => img.getAttribute('src')),
+    });
+    if (args.floorPlanOnly) return floorPlans();
+    const h1 = document.querySelector('h1');
+    return {
+        og_title: meta('og:title'),
+        og_image: meta('og:image'),
+        h1: h1 ? h1.textContent : null,
+        prices: texts(args.price),
+        sizes: texts(args.size),
+        agents: texts(args.agent),
+        gallery: args.gallery.map(sel => ({
+            selector: sel,
+            images: all(sel).slice(0, 12).map(img => ({
+                src: img.getAttribute('src'),
+                alt: img.getAttribute('alt'),
+                box: box(img),
+            })),
+        })),
+        ...floorPlans(),
+        tel_links: all('a[href^="tel:"]').slice(0, 8).map(a => {
+            const c = a.parentElement && a.parentElement.closest('[class*="agent"], [class*="contact"], [class*="listing"]');
+            return { href: a.getAttribute('href'), context: c ? c.textContent : null };
+        }),
+        html: document.documentElement.outerHTML,
+    };
+}"""
+
+
+def _first_candidate(
+    candidates: Optional[list[dict]], accept: Callable[[str], bool], group: Optional[str] = None
+) -> tuple[Optional[str], Optional[str]]:
+    """按选择器顺序返回第一个通过校验的 (候选文本（已 strip）, 选择器)；给出 group 时记录每个候选是否命中。
+    候选已全部取回，命中之后的也照常计入，统计不受顺序影响"""
+    found: tuple[Optional[str], Optional[str]] = (None, None)
+    for c in candidates or []:
+        txt = c.get("text")
+        hit = bool(txt and accept(txt))
+        if group:
+            _record_selector(group, c.get("selector") or "", hit)
+        if hit and found[0] is None:
+            found = (txt.strip(), c.get("selector"))
+            if not group:
+                break
+    return found
+
+
+# _extract_fields 使用的正则（预编译，每份页面只做一次 HTML 快照、多次 C 层搜索）
+_PRICE_TEXT_RE = re.compile(r"[\$S].*[\d,]+")
+_PRICE_RE = re.compile(r"S?\$[\s]*[\d,]+(?:\s*(?:million|mil|k|K))?")
+_SIZE_TEXT_RE = re.compile(r"\d+\s*sq", re.I)
+_SIZE_RE = re.compile(r"(\d[\d,]*)\s*sq\s*ft", re.I)
+_BED_RE = re.compile(r"(\d+)\s*bed(?:room)?s?", re.I)
+_BATH_RE = re.compile(r"(\d+)\s*bath(?:room)?s?", re.I)
+_PHONE_RE = re.compile(r"^\+?[\d]{8,15}$")
+_PHONE_SEPARATORS_RE = re.compile(r"[\s\-]")
+_PHONE_LIKE_RE = re.compile(r"^[\d\+\-]+$")
+_DIGITS_ONLY_RE = re.compile(r"^[\d\+]+$")
+_WHITESPACE_RE = re.compile(r"[\s\n]+")
+_TEL_HREF_RE = re.compile(r'tel:(\+?[\d\s\-\.]{8,25})')
+_TEL_SEPARATORS_RE = re.compile(r"[\s\-\.]")
+# 新加坡常见格式 +65 8/9xxx xxxx 或 8 位手机号
+_SG_PHONE_RES = [
+    re.compile(r"(?:\+65|65)\s*(\d[\d\s]{6,11})", re.I),
+    re.compile(r"(\+65\s*\d{4}\s*\d{4})", re.I),
+    re.compile(r"(?:contact|call|phone|tel)[:\s]*(\+?[\d\s\-]{8,20})", re.I),
+]
+
+
+def _gallery_main_image(group: dict) -> Optional[str]:
+    """图库候选中第一张非户型、非 logo、尺寸足够的图片"""
+    for img in group.get("images") or []:
+        src = img.get("src")
+        if not src:
+            continue
+        if "floor" in src.lower() or "plan" in src.lower():
+            continue
+        if _is_logo_or_ui(src, img.get("alt") or ""):
+            continue
+        box = img.get("box")
+        if box and (box["width"] < 60 or box["height"] < 60):
+            continue
+        return src
+    return None
+
+
+def _extract_fields(data: dict, url: str, record: bool = True, record_selectors: bool = True) -> dict:
+    """对页面数据（_PAGE_DATA_JS 的结果）应用字段识别规则，返回 ScrapeResponse 的房源字段。
+    record 为 False 时不计入指标与请求追踪（同一份数据的预览性提取）；
+    record_selectors 为 False 时只记录字段来源、不计入选择器命中（HTML 快照上的结果不代表浏览器 DOM）"""
+    body = data.get("html") or ""
+    record_selectors = record and record_selectors
+    sources: dict[str, str] = {}  # 字段 → 产出它的选择器 / 策略
+
+    # Title: og:title 或 h1
+    title = data.get("og_title") or (data.get("h1") or "").strip() or "Property"
+    sources["title"] = "og:title" if data.get("og_title") else "h1" if title != "Property" else "default"
+
+    # Price / Size: 选择器候选优先，其次正则匹配整页 HTML
+    metric_group = (lambda name: name) if record_selectors else (lambda name: None)
+    price, sel = _first_candidate(data.get("prices"), lambda t: bool(_PRICE_TEXT_RE.search(t)), metric_group("price"))
+    if price:
+        sources["price"] = f"selector:{sel}"
+    else:
+        price_match = _PRICE_RE.search(body)
+        if price_match:
+            price = price_match.group(0).strip()
+            sources["price"] = "regex:html"
+    size_sqft, sel = _first_candidate(data.get("sizes"), lambda t: bool(_SIZE_TEXT_RE.search(t)), metric_group("size"))
+    if size_sqft:
+        sources["size_sqft"] = f"selector:{sel}"
+    else:
+        size_match = _SIZE_RE.search(body)
+        if size_match:
+            size_sqft = f"{size_match.group(1)} sqft"
+            sources["size_sqft"] = "regex:html"
+
+    bedrooms: Optional[str] = None
+    bathrooms: Optional[str] = None
+    bed_match = _BED_RE.search(body)
+    if bed_match:
+        bedrooms = bed_match.group(1) + " 房"
+        sources["bedrooms"] = "regex:html"
+    bath_match = _BATH_RE.search(body)
+    if bath_match:
+        bathrooms = bath_match.group(1) + " 卫"
+        sources["bathrooms"] = "regex:html"
+    basic_info_parts = [x for x in (price, size_sqft, bedrooms, bathrooms) if x]
+    basic_info = " | ".join(basic_info_parts) if basic_info_parts else None
+
+    # 主图：图库区域第一张非户型、非 logo、尺寸足够的图片；找不到再用 og:image
+    og_image = data.get("og_image") or None
+    if og_image and _is_logo_or_ui(og_image, ""):
+        og_image = None
+    main_image_url: Optional[str] = None
+    image_urls: list[str] = []
+    for group in data.get("gallery") or []:
+        src = _gallery_main_image(group)
+        if record_selectors:
+            # 已选出主图后，其余图库候选也照常计入指标
+            _record_selector("gallery", group.get("selector") or "", bool(src))
+        if src and not main_image_url:
+            main_image_url = src
+            image_urls.append(src)
+            sources["main_image_url"] = f"selector:{group.get('selector')}"
+            if not record_selectors:
+                break
+    if og_image and not main_image_url:
+        main_image_url = og_image
+        sources["main_image_url"] = "og:image"
+    if og_image and not image_urls:
+        image_urls.insert(0, og_image)
+
+    # Floor plan: 媒体画廊 floorPlans 选择器优先，兜底为含 floor/plan 的图
+    floor_plan = None
+    for c in data.get("floor_plans") or []:
+        if record_selectors:
+            _record_selector("floor_plan", c.get("selector") or "", bool(c.get("src")))
+        if c.get("src") and floor_plan is None:
+            floor_plan = c
+            if not record_selectors:
+                break
+    floor_plan_url = floor_plan["src"] if floor_plan else None
+    if floor_plan:
+        sources["floor_plan_url"] = f"selector:{floor_plan.get('selector')}"
+    else:
+        floor_plan_url = next((src for src in data.get("floor_images") or [] if src), None)
+        if floor_plan_url:
+            sources["floor_plan_url"] = "img:floor/plan"
+    if floor_plan_url and floor_plan_url not in image_urls:
+        image_urls.append(floor_plan_url)
+
+    # 卖家中介电话：tel: 链接 → HTML 中的 tel: → 新加坡号码格式
+    listing_agent_name: Optional[str] = None
+    listing_agent_phone: Optional[str] = None
+    for tel in data.get("tel_links") or []:
+        href = tel.get("href")
+        if not href:
+            continue
+        phone = _PHONE_SEPARATORS_RE.sub("", href.replace("tel:", "").strip())
+        if _PHONE_RE.search(phone):
+            listing_agent_phone = phone
+            sources["listing_agent_phone"] = "tel_link"
+            # 同一区域（父级容器）中的非按钮文字作为中介姓名
+            parent_txt = tel.get("context")
+            if parent_txt:
+                skip_words = {"contact", "call", "whatsapp", "phone", "sms", "enquire", "view"}
+                for part in _WHITESPACE_RE.split(parent_txt.replace(phone, "")):
+                    s = part.strip()
+                    if 2 <= len(s) <= 40 and not _PHONE_LIKE_RE.search(s) and s.lower() not in skip_words:
+                        listing_agent_name = s
+                        sources["listing_agent_name"] = "tel_link_context"
+                        break
+            break
+    if not listing_agent_phone:
+        tel_match = _TEL_HREF_RE.search(body)
+        if tel_match:
+            p = _TEL_SEPARATORS_RE.sub("", tel_match.group(1))
+            if _PHONE_RE.search(p):
+                listing_agent_phone = p
+                sources["listing_agent_phone"] = "regex:tel_href"
+    if not listing_agent_phone:
+        for pat in _SG_PHONE_RES:
+            m = pat.search(body)
+            if m:
+                p = _PHONE_SEPARATORS_RE.sub("", m.group(1))
+                if _PHONE_RE.search(p):
+                    listing_agent_phone = p if p.startswith("+") else (f"+65{p}" if len(p) == 8 and p[0] in "89" else p)
+                    sources["listing_agent_phone"] = "regex:sg_phone"
+                    break
+    agent_name, sel = _first_candidate(
+        data.get("agents"),
+        lambda t: 2 <= len(t.strip()) <= 80 and not _DIGITS_ONLY_RE.search(t.strip()),
+        metric_group("agent"),
+    )
+    if agent_name:
+        listing_agent_name = agent_name
+        sources["listing_agent_name"] = f"selector:{sel}"
+
+    listing_type = _detect_listing_type(url, body)
+    # 地契仅对出售房源有意义，租房不抓取
+    lease_tenure = _detect_lease_tenure(body) if listing_type == "sale" else None
+    if listing_type:
+        sources["listing_type"] = "url/html"
+    if lease_tenure:
+        sources["lease_tenure"] = "regex:html"
+    if record:
+        _note_sources(sources)
+
+    return {
+        "title": title,
+        "price": price,
+        "size_sqft": size_sqft,
+        "bedrooms": bedrooms,
+        "bathrooms": bathrooms,
+        "main_image_url": main_image_url,
+        "image_urls": image_urls[:2] if image_urls else None,
+        "floor_plan_url": floor_plan_url,
+        "basic_info": basic_info,
+        "listing_agent_name": listing_agent_name,
+        "listing_agent_phone": listing_agent_phone,
+        "listing_type": listing_type,
+        "lease_tenure": lease_tenure,
+    }
+
+
+# ---------- 离线 HTML 提取：对一份页面快照解析一次，产出与 _PAGE_DATA_JS 相同结构的数据，无需浏览器 ----------
+
+_RAW_TEXT_TAGS = {"script", "style", "noscript", "template"}
+_HAS_TEXT_SELECTOR_RE = re.compile(r'^(.*):has-text\("(.*)"\)$')
+_TEXT_REGEX_SELECTOR_RE = re.compile(r"^text=/(.*)/([a-z]*)$")
+
+
+class HtmlSnapshot:
+    """页面快照上的 DOM 查询：HTML5 解析与 CSS 选择器由 selectolax（lexbor，C 实现）完成，
+    另外支持 Playwright 的 `:has-text("x")`、`text=/re/flags`"""
+
+    def __init__(self, html: str):
+        self.html = html
+        self._doc = LexborHTMLParser(html)
+        self._matched: dict[str, set[int]] = {}
+
+    @staticmethod
+    def text_content(node: LexborNode) -> str:
+        return node.text(deep=True)
+
+    def select_all(self, selector: str, limit: Optional[int] = None) -> list[LexborNode]:
+        """按文档顺序返回匹配的元素"""
+        if limit == 1:
+            node = self._doc.css_first(selector)
+            return [node] if node is not None else []
+        # 逗号并列的多组都命中同一元素时 lexbor 会重复返回，按 querySelectorAll 语义去重
+        seen: set[int] = set()
+        nodes = []
+        for node in self._doc.css(selector):
+            if node.mem_id not in seen:
+                seen.add(node.mem_id)
+                nodes.append(node)
+                if limit is not None and len(nodes) >= limit:
+                    break
+        return nodes
+
+    def matches(self, node: LexborNode, selector: str) -> bool:
+        matched = self._matched.get(selector)
+        if matched is None:
+            matched = self._matched[selector] = {n.mem_id for n in self._doc.css(selector)}
+        return node.mem_id in matched
+
+    def first_match(self, selector: str) -> Optional[LexborNode]:
+        """与 _PAGE_DATA_JS 的 firstMatch 相同语义"""
+        m = _HAS_TEXT_SELECTOR_RE.match(selector)
+        if m:
+            for node in self.select_all(m.group(1) or "*"):
+                if m.group(2) in self.text_content(node):
+                    return node
+            return None
+        m = _TEXT_REGEX_SELECTOR_RE.match(selector)
+        if m:
+            pattern = re.compile(m.group(1), re.I if "i" in m.group(2) else 0)
+            for node in self._doc.root.traverse(include_text=True):
+                if not node.is_text_node:
+                    continue
+                parent = node.parent
+                if parent is not None and parent.tag not in _RAW_TEXT_TAGS and pattern.search(node.text_content or ""):
+                    return parent
+            return None
+        found = self.select_all(selector, limit=1)
+        return found[0] if found else None
+
+    def closest(self, node: Optional[LexborNode], selector: str) -> Optional[LexborNode]:
+        while node is not None and node.tag != "-undef":
+            if self.matches(node, selector):
+                return node
+            node = node.parent
+        return None
+
+    def meta_property(self, prop: str) -> str:
+        node = self._doc.css_first(f'meta[property="{prop}"]')
+        return (node.attrs.get("content") or "") if node is not None else ""
+
+
+def _attr_box(node: LexborNode) -> Optional[dict]:
+    """快照中没有布局信息，用 width/height 属性近似渲染尺寸；缺失时视为未知（不做尺寸过滤）"""
+    try:
+        return {"width": float(node.attrs["width"]), "height": float(node.attrs["height"])}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _snapshot_page_data(html: str) -> dict:
+    """从 HTML 快照构造与 _PAGE_DATA_JS 相同结构的页面数据"""
+    doc = HtmlSnapshot(html)
+
+    def texts(selectors: list[str]) -> list[dict]:
+        out = []
+        for sel in selectors:
+            node = doc.first_match(sel)
+            out.append({"selector": sel, "text": doc.text_content(node) if node else None})
+        return out
+
+    floor_plans = []
+    for sel in FLOOR_PLAN_SELECTORS:
+        found = doc.select_all(sel, limit=1)
+        floor_plans.append({"selector": sel, "src": found[0].attrs.get("src") if found else None})
+    tel_links = []
+    for a in doc.select_all('a[href^="tel:"]', limit=8):
+        container = doc.closest(a.parent, '[class*="agent"], [class*="contact"], [class*="listing"]') if a.parent else None
+        tel_links.append({"href": a.attrs.get("href"), "context": doc.text_content(container) if container else None})
+    h1 = doc.first_match("h1")
+    return {
+        "og_title": doc.meta_property("og:title"),
+        "og_image": doc.meta_property("og:image"),
+        "h1": doc.text_content(h1) if h1 else None,
+        "prices": texts(PRICE_SELECTORS),
+        "sizes": texts(SIZE_SELECTORS),
+        "agents": texts(AGENT_SELECTORS),
+        "gallery": [
+            {
+                "selector": sel,
+                "images": [
+                    {"src": img.attrs.get("src"), "alt": img.attrs.get("alt"), "box": _attr_box(img)}
+                    for img in doc.select_all(sel, limit=12)
+                ],
+            }
+            for sel in GALLERY_SELECTORS
+        ],
+        "floor_plans": floor_plans,
+        "floor_images": [
+            img.attrs.get("src")
+            for img in doc.select_all('img[src*="floor"], img[src*="plan"], [alt*="floor" i] img, [alt*="plan" i] img', limit=3)
+        ],
+        "tel_links": tel_links,
+        "html": html,
+    }
+
+
+# ---------- 内嵌 JSON：JSON-LD、Next.js __NEXT_DATA__ 等服务端直出的数据，补齐 DOM 提取缺失的字段 ----------
+
+_JSON_SCRIPT_RE = re.compile(r'<script\b([^>]*type=["\']application/(?:ld\+)?json["\'][^>]*)>(.*?)</script>', re.I | re.S)
+_JSON_WALK_LIMIT = 50000
+
+_EMBEDDED_PRICE_KEYS = {"price", "askingprice", "listingprice"}
+_EMBEDDED_SIZE_KEYS = {"floorarea", "floorsize", "floor_area", "builtuparea", "sizesqft"}
+_EMBEDDED_BED_KEYS = {"bedrooms", "numberofbedrooms", "beds"}
+_EMBEDDED_BATH_KEYS = {"bathrooms", "numberofbathroomstotal", "baths"}
+_EMBEDDED_IMAGE_KEYS = {"image", "images", "photos", "gallery"}
+_EMBEDDED_AGENT_KEYS = {"agent", "seller", "broker", "realestateagent", "lister"}
+_EMBEDDED_PHONE_KEYS = ("telephone", "mobile", "phone", "phonenumber", "mobilenumber")
+
+
+def _embedded_json_blobs(html: str) -> list:
+    """页面中 type=application/json 与 application/ld+json 的脚本，JSON-LD 在前；解析失败的跳过"""
+    ld: list = []
+    other: list = []
+    for m in _JSON_SCRIPT_RE.finditer(html):
+        try:
+            blob = json.loads(m.group(2))
+        except ValueError:
+            continue
+        (ld if "ld+json" in m.group(1).lower() else other).append(blob)
+    return ld + other
+
+
+def _walk_json(blob: Any) -> Iterator[tuple[str, Any, dict]]:
+    """广度优先遍历 (小写键, 值, 所在对象)：页面主体数据通常比推荐房源等列表层级更浅"""
+    queue = deque([blob])
+    seen = 0
+    while queue and seen < _JSON_WALK_LIMIT:
+        node = queue.popleft()
+        seen += 1
+        if isinstance(node, dict):
+            for k, v in node.items():
+                yield str(k).lower(), v, node
+                if isinstance(v, (dict, list)):
+                    queue.append(v)
+        elif isinstance(node, list):
+            queue.extend(x for x in node if isinstance(x, (dict, list)))
+
+
+def _json_scalar(v: Any) -> Optional[str]:
+    """字符串/数字直接取值；对象取 pretty/formatted/value 等常见展示字段"""
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return f"{v:g}" if isinstance(v, float) else str(v)
+    if isinstance(v, str):
+        return v.strip() or None
+    if isinstance(v, dict):
+        for k in ("pretty", "formatted", "display", "text", "value", "amount"):
+            if k in v:
+                return _json_scalar(v[k])
+    return None
+
+
+def _json_number(v: Any) -> Optional[float]:
+    text = _json_scalar(v)
+    if not text:
+        return None
+    m = re.search(r"\d[\d,]*(?:\.\d+)?", text)
+    return float(m.group(0).replace(",", "")) if m else None
+
+
+def _json_urls(v: Any) -> Iterator[str]:
+    if isinstance(v, str):
+        if v.startswith("http"):
+            yield v
+    elif isinstance(v, list):
+        for x in v:
+            yield from _json_urls(x)
+    elif isinstance(v, dict):
+        for k in ("url", "src", "contentUrl", "original", "large"):
+            if k in v:
+                yield from _json_urls(v[k])
+
+
+def _json_listing_fields(blobs: list) -> dict:
+    """从 JSON 数据中按常见键名识别房源字段，只返回找到的字段（按 blobs 顺序，每个字段取最浅的一处）"""
+    found: dict[str, Any] = {}
+    for blob in blobs:
+        for key, value, _ in _walk_json(blob):
+            if "price" not in found and key in _EMBEDDED_PRICE_KEYS:
+                text = _json_scalar(value)
+                if text and _PRICE_TEXT_RE.search(text):
+                    found["price"] = text
+                elif text and (n := _json_number(value)):
+                    found["price"] = f"S$ {n:,.0f}"
+            elif "size_sqft" not in found and key in _EMBEDDED_SIZE_KEYS:
+                n = _json_number(value)
+                if n:
+                    unit = json.dumps(value).lower() if isinstance(value, dict) else ""
+                    if "mtk" in unit or "sqm" in unit:
+                        n *= 10.7639
+                    found["size_sqft"] = f"{n:,.0f} sqft"
+            elif "bedrooms" not in found and key in _EMBEDDED_BED_KEYS:
+                n = _json_number(value)
+                if n is not None:
+                    found["bedrooms"] = f"{n:g} 房"
+            elif "bathrooms" not in found and key in _EMBEDDED_BATH_KEYS:
+                n = _json_number(value)
+                if n is not None:
+                    found["bathrooms"] = f"{n:g} 卫"
+            elif "floor_plan_url" not in found and "floorplan" in key.replace("_", ""):
+                url = next(_json_urls(value), None)
+                if url:
+                    found["floor_plan_url"] = url
+            elif "main_image_url" not in found and key in _EMBEDDED_IMAGE_KEYS:
+                for url in _json_urls(value):
+                    low = url.lower()
+                    if "floor" not in low and "plan" not in low and not _is_logo_or_ui(url, ""):
+                        found["main_image_url"] = url
+                        break
+            elif "listing_agent_phone" not in found and key in _EMBEDDED_AGENT_KEYS and isinstance(value, dict):
+                for pk in _EMBEDDED_PHONE_KEYS:
+                    phone = _PHONE_SEPARATORS_RE.sub("", _json_scalar(value.get(pk)) or "")
+                    if _PHONE_RE.search(phone):
+                        found["listing_agent_phone"] = phone
+                        name = _json_scalar(value.get("name") or value.get("fullName"))
+                        if name:
+                            found["listing_agent_name"] = name
+                        break
+            elif "lease_tenure" not in found and key == "tenure":
+                tenure = _detect_lease_tenure(_json_scalar(value) or "")
+                if tenure:
+                    found["lease_tenure"] = tenure
+    return found
 
-class ScrapeRequest(BaseModel):
-    url: str
 
+def _embedded_listing_fields(html: str) -> dict:
+    return _json_listing_fields(_embedded_json_blobs(html))
 
-class SitePlanRequest(BaseModel):
-    apartment_name: str
 
+_JSON_ID_KEYS = {"id", "listingid", "listing_id"}
+_LISTING_ID_RE = re.compile(r"(\d{5,})/?$")
 
-class SitePlanResponse(BaseModel):
-    site_plan_url: str
 
+def _listing_id_from_url(url: str) -> Optional[str]:
+    """房源链接末尾的数字 id（…-24026893）"""
+    m = _LISTING_ID_RE.search(urlsplit(url).path)
+    return m.group(1) if m else None
 
-class ScrapeResponse(BaseModel):
-    title: str
-    link: str
-    price: Optional[str] = None
-    size_sqft: Optional[str] = None
-    bedrooms: Optional[str] = None
-    bathrooms: Optional[str] = None
-    main_image_url: Optional[str] = None
-    image_urls: Optional[list[str]] = None  # 第一张主图 + 第二张户型图
-    floor_plan_url: Optional[str] = None
-    basic_info: Optional[str] = None
-    listing_agent_name: Optional[str] = None  # 卖家中介姓名
-    listing_agent_phone: Optional[str] = None  # 卖家中介电话
-    listing_type: Optional[str] = None  # 'sale' | 'rent' 出售 vs 出租
-    lease_tenure: Optional[str] = None  # 地契：99年地契、999年地契、永久地契
-    site_plan_url: Optional[str] = None  # 公寓小区平面图，从 99.co 抓取
 
+def _listing_json_node(blob: Any, listing_id: str) -> Optional[dict]:
+    """blob 中 id 等于 listing_id 的最浅对象（本房源的详情数据），没有时返回 None"""
+    for key, value, node in _walk_json(blob):
+        if key in _JSON_ID_KEYS and _json_scalar(value) == listing_id:
+            return node
+    return None
 
-def _normalize_propertyguru_url(url: str) -> str:
-    """统一 Property Guru 链接格式，便于去重"""
-    url = url.strip()
-    if not url.startswith("http"):
-        url = "https://" + url
-    return url.rstrip("/")
 
+def _captured_listing_fields(blobs: list, url: str) -> tuple[dict, dict]:
+    """从浏览器捕获的 JSON 响应中识别房源字段，按归属分开返回 (本房源字段, 归属不明的字段)：
+    id 与页面链接一致的对象只在其内部取字段；其余响应可能是相似房源、推荐列表"""
+    listing_id = _listing_id_from_url(url)
+    own: list = []
+    unscoped: list = []
+    for blob in blobs:
+        node = _listing_json_node(blob, listing_id) if listing_id else None
+        if node is not None:
+            own.append(node)
+        else:
+            unscoped.append(blob)
+    return _json_listing_fields(own), _json_listing_fields(unscoped)
 
-def _detect_lease_tenure(body: str) -> Optional[str]:
-    """从页面内容识别地契/租期，仅对出售房源有意义"""
-    body_lower = body.lower()
-    # 永久/Freehold 优先
-    if re.search(r"freehold|永久|永久地契", body_lower):
-        return "永久地契"
-    # 999 必须先于 99 检查，避免误判
-    if re.search(r"999\s*[- ]?year|999\s*年|999年地契", body_lower):
-        return "999年地契"
-    if re.search(r"\b99\s*[- ]?year|\b99\s*年|99年地契|leasehold", body_lower):
-        return "99年地契"
-    return None
 
+def _merge_json_fields(
+    fields: dict, found: dict, override: bool = False, source: Optional[str] = "json:embedded"
+) -> dict:
+    """把 JSON 中识别出的字段合并进 DOM 提取结果：默认只补齐缺失字段，override 时 JSON 优先；
+    之后重建 image_urls 与 basic_info。source 为写入请求追踪的字段来源，None 时不记录"""
+    applied: dict[str, str] = {}
+    for key, value in found.items():
+        if key == "lease_tenure" and fields.get("listing_type") != "sale":
+            continue
+        if value and (override or not fields.get(key)):
+            fields[key] = value
+            applied[key] = source or ""
+    if source:
+        _note_sources(applied)
+    image_urls = [src for src in (fields.get("main_image_url"), fields.get("floor_plan_url")) if src]
+    fields["image_urls"] = list(dict.fromkeys(image_urls)) or fields.get("image_urls")
+    parts = [fields.get(k) for k in ("price", "size_sqft", "bedrooms", "bathrooms") if fields.get(k)]
+    fields["basic_info"] = " | ".join(parts) if parts else None
+    return fields
 
-def _extract_apartment_name(title: str) -> Optional[str]:
-    """从房源 title 提取公寓/项目名，用于 99.co 查询"""
-    if not title or len(title.strip()) < 2:
-        return None
-    t = title.strip()
-    # "Project - 2 Bedroom" -> Project
-    m = re.match(r"^(.+?)\s*[-–—]\s+", t)
-    if m:
-        return m.group(1).strip()
-    # "2 Bed at Project Name" -> Project Name
-    m = re.search(r"\s+at\s+(.+)$", t, re.I)
-    if m:
-        return m.group(1).strip()
-    return t
 
+def _merge_captured_fields(fields: dict, captured: tuple[dict, dict], source: Optional[str] = "json:network") -> dict:
+    """合并 _captured_listing_fields 的结果：本房源字段优先于 DOM，归属不明的只补齐缺失字段"""
+    own, unscoped = captured
+    fields = _merge_json_fields(fields, own, override=True, source=source)
+    return _merge_json_fields(fields, unscoped, source=source)
 
-def _apartment_name_to_slug(name: str) -> str:
-    """将公寓名称转为 99.co URL 的 slug：去掉特殊字符、空格变横线"""
-    # 去掉特殊字符（如 @），只保留字母、数字、空格、连字符
-    slug = re.sub(r"[^a-zA-Z0-9\s\-]", "", name.strip())
-    # 将单个或多个空格统一替换为单个 -
-    slug = re.sub(r"\s+", "-", slug)
-    slug = slug.lower().strip("-")
-    for suffix in ["-condo", "-residences", "-residence"]:
-        if slug.endswith(suffix):
-            slug = slug[: -len(suffix)]
-    return slug
 
+def extract_listing_from_html(html: str, url: str, captured: Optional[list] = None) -> ScrapeResponse:
+    """离线提取引擎：一份 Property Guru 页面 HTML → ScrapeResponse（不含 site plan）。
+    DOM / meta 规则为主，内嵌 JSON 补齐缺失字段；captured 为浏览器抓取时记录的站点 JSON 响应（存档中保存），
+    与在线抓取一样，其中本房源的数据优先于 DOM。纯 CPU、无需浏览器，可直接对保存的页面做单元测试，也可放进进程池执行。"""
+    url = _normalize_propertyguru_url(url)
+    # HTTP 直取、增量刷新、离线重新提取与 html 模式都走这里：选择器命中只由浏览器 DOM 上的提取计入，
+    # 否则会被随后改用浏览器的请求和离线回填左右 locator 模式的顺序与 /metrics 中的命中率
+    fields = _extract_fields(_snapshot_page_data(html), url, record_selectors=False)
+    fields = _merge_json_fields(fields, _embedded_listing_fields(html))
+    if captured:
+        fields = _merge_captured_fields(fields, _captured_listing_fields(captured, url))
+    return ScrapeResponse(link=url, **fields)
 
-def _detect_listing_type(url: str, body: str) -> Optional[str]:
-    """从 URL 或页面内容识别房源类型：出售 vs 出租"""
-    url_lower = url.lower()
-    if "/for-sale/" in url_lower or "/for_sale/" in url_lower:
-        return "sale"
-    if "/for-rent/" in url_lower or "/for_rent/" in url_lower or "/rent/" in url_lower:
-        return "rent"
-    body_lower = body.lower()
-    # 页面文案常见：For Sale / For Rent
-    if "for sale" in body_lower or "for-sale" in body_lower:
-        return "sale"
-    if "for rent" in body_lower or "for-rent" in body_lower or "for rent" in body_lower:
-        return "rent"
-    return None
 
+_extraction_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _extract_listing_traced(html: str, url: str) -> tuple[ScrapeResponse, dict[str, str]]:
+    """进程池中执行的离线提取：子进程里没有发起请求的追踪，把字段来源随结果一起返回，由父进程记入"""
+    trace = ScrapeTrace()
+    token = _current_trace.set(trace)
+    try:
+        return extract_listing_from_html(html, url), trace.sources
+    finally:
+        _current_trace.reset(token)
 
-@app.post("/api/scrape-property", response_model=ScrapeResponse)
-async def scrape_property(req: ScrapeRequest):
-    url = _normalize_propertyguru_url(req.url)
-    if "propertyguru.com.sg" not in url and "propertyguru.com" not in url:
-        raise HTTPException(status_code=400, detail="仅支持 Property Guru 链接")
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+async def _extract_html_off_loop(html: str, url: str) -> ScrapeResponse:
+    """在事件循环之外运行离线提取：配置了 SCRAPE_EXTRACTION_WORKERS 时用进程池，否则用线程"""
+    global _extraction_executor
+    if SCRAPE_EXTRACTION_WORKERS <= 0:
+        # to_thread 复制当前上下文，字段来源直接记入本请求的追踪
+        return await asyncio.to_thread(extract_listing_from_html, html, url)
+    if _extraction_executor is None:
+        # spawn：避免在已有 Playwright 线程的进程里 fork
+        _extraction_executor = ProcessPoolExecutor(
+            max_workers=SCRAPE_EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn")
         )
-        page = await context.new_page()
+    loop = asyncio.get_running_loop()
+    result, sources = await loop.run_in_executor(_extraction_executor, _extract_listing_traced, html, url)
+    _note_sources(sources)
+    return result
 
+
+# 渐进式结果（SSE）中的字段分组，按通常的就绪先后排列
+FIELD_GROUPS: dict[str, tuple[str, ...]] = {
+    "core": ("title", "price", "size_sqft", "bedrooms", "bathrooms", "basic_info", "listing_type", "lease_tenure"),
+    "images": ("main_image_url", "image_urls"),
+    "floor_plan": ("floor_plan_url", "image_urls"),
+    "agent": ("listing_agent_name", "listing_agent_phone"),
+    "site_plan": ("site_plan_url",),
+}
+
+# 进度回调：(分组名, 该组字段)；抓取过程中某组字段确定后立即调用
+ProgressFn = Callable[[str, dict], None]
+
+
+def _emit_groups(on_progress: Optional[ProgressFn], fields: dict, groups: Iterable[str]) -> None:
+    if on_progress is None:
+        return
+    for group in groups:
+        on_progress(group, {k: fields.get(k) for k in FIELD_GROUPS[group]})
+
+
+class ResponseCapture:
+    """记录页面加载期间站点自身 XHR / fetch 返回的 JSON（URL 含任一模式），供提取时优先使用"""
+
+    def __init__(self, page: Page, patterns: list[str], max_bytes: int = _CAPTURE_MAX_BYTES):
+        self.patterns = patterns
+        self.max_bytes = max_bytes
+        self.blobs: list = []
+        self._pending: set[asyncio.Task] = set()
+        if patterns:
+            page.on("response", self._on_response)
+
+    def _on_response(self, response) -> None:
+        if response.status != 200 or not any(p in response.url for p in self.patterns):
+            return
+        if "json" not in (response.headers.get("content-type") or ""):
+            return
+        task = asyncio.create_task(self._read(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _read(self, response) -> None:
         try:
-            # 使用 load 而非 networkidle：Property Guru 等网站有大量后台请求，networkidle 难以达成
-            await page.goto(url, wait_until="load", timeout=30000)
-            await page.wait_for_timeout(2000)
-
-            title = ""
-            price: Optional[str] = None
-            size_sqft: Optional[str] = None
-            bedrooms: Optional[str] = None
-            bathrooms: Optional[str] = None
-            main_image_url: Optional[str] = None
-            image_urls: list[str] = []
-            floor_plan_url: Optional[str] = None
-            basic_info_parts: list[str] = []
-
-            # Title: og:title 或 h1
-            og_title = await page.evaluate(
-                """() => {
-                const m = document.querySelector('meta[property="og:title"]');
-                return m ? m.getAttribute('content') : '';
-            }"""
+            body = await response.body()
+            if len(body) <= self.max_bytes:
+                self.blobs.append(json.loads(body))
+        except Exception:
+            pass
+
+    async def fields(self, url: str, timeout: float = 1.0) -> tuple[dict, dict]:
+        """等待仍在读取的响应体（最多 timeout 秒）后，从已记录的 JSON 中识别房源字段：(本房源字段, 归属不明的字段)"""
+        if self._pending:
+            await asyncio.wait(set(self._pending), timeout=timeout)
+        return _captured_listing_fields(self.blobs, url)
+
+
+async def _extract_with_snapshot(page: Page, url: str, open_gallery: bool = True) -> dict:
+    """只取一次 page.content() 快照交给离线提取引擎；户型图在画廊 modal 内时先点开画廊再取快照"""
+    if (
+        open_gallery
+        and await page.locator(", ".join(FLOOR_PLAN_SELECTORS)).count() == 0
+        and _optional_phase("floor_plan")
+    ):
+        with scrape_metrics.phase("floor_plan"):
+            try:
+                gallery_loc = page.locator(GALLERY_OPEN_SELECTOR).first
+                if await gallery_loc.count() > 0:
+                    await gallery_loc.click(timeout=_budget_ms(5000, _OPTIONAL_PHASE_RESERVE))
+                    await _wait_ready(
+                        page, [", ".join(FLOOR_PLAN_SELECTORS)], _budget_ms(READY_TIMEOUT_GALLERY, _OPTIONAL_PHASE_RESERVE)
+                    )
+            except Exception:
+                pass
+    html = await page.content()
+    result = await _extract_html_off_loop(html, url)
+    return result.model_dump(exclude={"link", "site_plan_url", "tier"})
+
+
+async def _extract_with_evaluate(
+    page: Page, url: str, on_progress: Optional[ProgressFn] = None, captured: Optional[tuple[dict, dict]] = None
+) -> dict:
+    """一次 page.evaluate 取回全部候选数据，再在 Python 中应用识别规则；captured（网络响应中的字段）按归属合并。
+    户型图需要点开画廊时，先通过 on_progress 推送其余字段"""
+    captured = captured or ({}, {})
+    args = {
+        # 一次 evaluate 已取回全部候选，按代码中的固定优先级选取；选择器统计只作指标，重排与跳过仅用于 locator 模式
+        "price": PRICE_SELECTORS,
+        "size": SIZE_SELECTORS,
+        "agent": AGENT_SELECTORS,
+        "gallery": GALLERY_SELECTORS,
+        "floorPlan": FLOOR_PLAN_SELECTORS,
+        "floorPlanOnly": False,
+    }
+    data = await page.evaluate(_PAGE_DATA_JS, args)
+    # 户型图可能在媒体画廊 modal 内：网络响应和页面中都没有时点开画廊，只重新收集户型图候选
+    if (
+        not captured[0].get("floor_plan_url")
+        and not any(c.get("src") for c in data["floor_plans"])
+        and _optional_phase("floor_plan")
+    ):
+        early = _merge_captured_fields(_extract_fields(data, url, record=False), captured, source=None)
+        _emit_groups(on_progress, early, ("core", "images", "agent"))
+        with scrape_metrics.phase("floor_plan"):
+            try:
+                gallery_loc = page.locator(GALLERY_OPEN_SELECTOR).first
+                if await gallery_loc.count() > 0:
+                    await gallery_loc.click(timeout=_budget_ms(5000, _OPTIONAL_PHASE_RESERVE))
+                    await _wait_ready(
+                        page, [", ".join(FLOOR_PLAN_SELECTORS)], _budget_ms(READY_TIMEOUT_GALLERY, _OPTIONAL_PHASE_RESERVE)
+                    )
+                    data.update(await page.evaluate(_PAGE_DATA_JS, {**args, "floorPlanOnly": True}))
+            except Exception:
+                pass
+    return _merge_captured_fields(_extract_fields(data, url), captured)
+
+
+async def _lookup_site_plan(context: BrowserContext, title: str) -> Optional[str]:
+    """从 99.co 抓取公寓 site plan（best-effort）：受 SCRAPE_SITE_PLAN_BUDGET 限时，失败或超时返回 None"""
+    apt_name = _extract_apartment_name(title)
+    slug = _apartment_name_to_slug(apt_name) if apt_name else ""
+    if not slug:
+        return None
+    cached = site_plan_cache.get(slug)
+    if cached is not None:
+        return cached or None
+    if not _optional_phase("site_plan"):
+        return None
+    plan_page = None
+    try:
+        plan_page = await context.new_page()
+        with scrape_metrics.phase("site_plan"):
+            site_plan_url, conclusive = await asyncio.wait_for(
+                _find_site_plan(plan_page, slug, _budget_ms(15000, _OPTIONAL_PHASE_RESERVE)),
+                timeout=_budget(SCRAPE_SITE_PLAN_BUDGET, _OPTIONAL_PHASE_RESERVE),
             )
-            if og_title:
-                title = og_title
-
-            if not title:
-                h1 = await page.locator("h1").first.text_content()
-                if h1:
-                    title = h1.strip()
-
-            if not title:
-                title = "Property"
-
-            # Price: 常见选择器
-            price_selectors = [
-                '[data-automation-id="listing-detail-price"]',
-                '[class*="price"]',
-                '[data-testid*="price"]',
-                'span:has-text("S$")',
-                'span:has-text("$")',
-            ]
-            for sel in price_selectors:
-                try:
-                    el = page.locator(sel).first
-                    txt = await el.text_content(timeout=500)
-                    if txt and re.search(r"[\$S].*[\d,]+", txt):
-                        price = txt.strip()
-                        break
-                except Exception:
-                    pass
+    except Exception:
+        # 超时或出错不做负缓存，下次再试
+        return None
+    finally:
+        if plan_page is not None:
+            try:
+                await plan_page.close()
+            except Exception:
+                pass
+    if conclusive:
+        _remember_site_plan(slug, site_plan_url)
+    return site_plan_url
 
-            if not price:
-                body = await page.content()
-                price_match = re.search(
-                    r"S?\$[\s]*[\d,]+(?:\s*(?:million|mil|k|K))?", body
-                )
-                if price_match:
-                    price = price_match.group(0).strip()
-
-            # Size: sqft
-            size_selectors = [
-                'text=/\\d+\\s*sqft/i',
-                'text=/\\d+\\s*sq\s*ft/i',
-                '[class*="size"]',
-                '[data-automation-id*="size"]',
-            ]
-            for sel in size_selectors:
-                try:
-                    el = page.locator(sel).first
-                    txt = await el.text_content(timeout=500)
-                    if txt and re.search(r"\d+\s*sq", txt, re.I):
-                        size_sqft = txt.strip()
-                        break
-                except Exception:
-                    pass
 
-            body = await page.content()
-            if not size_sqft:
-                size_match = re.search(r"(\d[\d,]*)\s*sq\s*ft", body, re.I)
-                if size_match:
-                    size_sqft = f"{size_match.group(1)} sqft"
-
-            # Bedrooms & Bathrooms: 常见格式 2 Bedrooms, 3 Bathrooms 或 2Bedroom 2Bathroom
-            bed_match = re.search(r"(\d+)\s*bed(?:room)?s?", body, re.I)
-            if bed_match:
-                bedrooms = bed_match.group(1) + " 房"
-            bath_match = re.search(r"(\d+)\s*bath(?:room)?s?", body, re.I)
-            if bath_match:
-                bathrooms = bath_match.group(1) + " 卫"
-            if price:
-                basic_info_parts.append(price)
-            if size_sqft:
-                basic_info_parts.append(size_sqft)
-            if bedrooms:
-                basic_info_parts.append(bedrooms)
-            if bathrooms:
-                basic_info_parts.append(bathrooms)
-            basic_info = " | ".join(basic_info_parts) if basic_info_parts else None
-
-            # 收集第一张主图 + 第二张户型图（排除 logo、网站图标等）
-            def _is_logo_or_ui(src: str, alt: str) -> bool:
-                """排除 logo、favicon、品牌图等非房源图"""
-                if not src:
-                    return True
-                s = src.lower()
-                a = (alt or "").lower()
-                skip = ["logo", "favicon", "brand", "icon", "avatar", "placeholder"]
-                return any(x in s or x in a for x in skip)
-
-            og_image = await page.evaluate(
+async def _find_site_plan_http(slug: str) -> tuple[Optional[str], bool]:
+    """用 HTTP 取 99.co 公寓页面 HTML 查找 site plan 图片。
+    返回 (图片地址, 是否确定)：页面不存在为确定的未找到；图片懒加载未直出时不确定"""
+    html, status = await http_fetcher.get_html(_site_plan_page_url(slug).split("#")[0])
+    if html is None:
+        return None, status in (404, 410)
+    doc = HtmlSnapshot(html)
+    # HTML 快照上的查找不计入选择器命中（同 extract_listing_from_html）
+    for sel in SITE_PLAN_IMG_SELECTORS:
+        for img in doc.select_all(sel, limit=4):
+            for attr in ("src", "data-src"):
+                src = img.attrs.get(attr) or ""
+                if "pic2.99.co" in src:
+                    return src, True
+    return None, False
+
+
+async def _lookup_site_plan_http(title: str) -> Optional[str]:
+    """HTTP 直取层的 site plan 查询（best-effort，受 SCRAPE_SITE_PLAN_BUDGET 限时）：先用 HTTP 取 99.co 页面，
+    结果不确定（被拦截、图片懒加载未直出）时再用浏览器渲染页面查找"""
+    apt_name = _extract_apartment_name(title)
+    slug = _apartment_name_to_slug(apt_name) if apt_name else ""
+    if not slug:
+        return None
+    cached = site_plan_cache.get(slug)
+    if cached is not None:
+        return cached or None
+    if not _optional_phase("site_plan"):
+        return None
+    try:
+        with scrape_metrics.phase("site_plan"):
+            site_plan_url, conclusive = await asyncio.wait_for(
+                _find_site_plan_http(slug), timeout=_budget(SCRAPE_SITE_PLAN_BUDGET, _OPTIONAL_PHASE_RESERVE)
+            )
+    except Exception:
+        site_plan_url, conclusive = None, False
+    if conclusive:
+        _remember_site_plan(slug, site_plan_url)
+        return site_plan_url
+    # HTML 中没找到不代表没有 site plan：与浏览器层一样渲染页面再查（剩余预算不足时 _lookup_site_plan 直接跳过）
+    try:
+        async with browser_pool.context() as context:
+            return await _lookup_site_plan(context, title)
+    except Exception as e:
+        logger.info("site plan 浏览器查询失败: %s (%s)", slug, e)
+        return None
+
+
+def _missing_http_fields(result: ScrapeResponse) -> list[str]:
+    """HTTP 直取结果缺少的必需字段（SCRAPE_HTTP_REQUIRED_FIELDS，及未取到标题）"""
+    missing = [f for f in SCRAPE_HTTP_REQUIRED_FIELDS if not getattr(result, f, None)]
+    if result.title == "Property":
+        missing.append("title")
+    return missing
+
+
+async def _scrape_listing_http(url: str, on_progress: Optional[ProgressFn] = None) -> Optional[ScrapeResponse]:
+    """HTTP 直取层：普通 GET 取 HTML → 离线提取（DOM / meta + 内嵌 JSON）。
+    被反爬拦截、请求失败或缺少 SCRAPE_HTTP_REQUIRED_FIELDS 中的字段时返回 None，由浏览器接手"""
+    with scrape_metrics.phase("http_fetch"):
+        html, _ = await http_fetcher.get_html(url)
+    if html is None:
+        return None
+    with scrape_metrics.phase("extraction"):
+        result = await _extract_html_off_loop(html, url)
+    missing = _missing_http_fields(result)
+    if missing:
+        logger.info("HTTP 直取缺少字段 %s，改用浏览器: %s", ",".join(missing), url)
+        return None
+    _archive_page(url, html, None, "http")
+    fields = result.model_dump()
+    _emit_groups(on_progress, fields, ("core", "images", "floor_plan", "agent"))
+    site_plan_url = await _lookup_site_plan_http(result.title)
+    _emit_groups(on_progress, {"site_plan_url": site_plan_url}, ("site_plan",))
+    return result.model_copy(update={"site_plan_url": site_plan_url, "tier": "http"})
+
+
+async def _scrape_listing(
+    url: str, on_progress: Optional[ProgressFn] = None, browser_only: bool = False
+) -> ScrapeResponse:
+    """分层抓取：先 HTTP 直取，必要时再用浏览器（url 已规范化）；browser_only 时调用方已试过 HTTP，直接用浏览器"""
+    with scrape_metrics.phase("scrape"):
+        if http_fetcher.enabled and not browser_only:
+            try:
+                result = await _scrape_listing_http(url, on_progress)
+            except Exception as e:
+                logger.warning("HTTP 直取失败，改用浏览器: %s (%s)", url, e)
+                result = None
+            if result is not None:
+                http_fetcher.served += 1
+                scrape_metrics.result("http")
+                return result
+            http_fetcher.fallbacks += 1
+        result = await _scrape_listing_browser(url, on_progress)
+        scrape_metrics.result("browser")
+        return result
+
+
+async def _scrape_listing_browser(url: str, on_progress: Optional[ProgressFn] = None) -> ScrapeResponse:
+    """用浏览器池中的独立 context 抓取单个 Property Guru 房源。
+    on_progress 在各组字段确定时被调用，同一组可能推送多次（以最后一次为准）"""
+    site_plan_task: Optional[asyncio.Task] = None
+    try:
+        async with browser_pool.context() as context:
+            page = await context.new_page()
+            await resource_policy.apply(page, "propertyguru")
+            capture = ResponseCapture(page, SCRAPE_CAPTURE_URL_PATTERNS)
+
+            # 不等 load / networkidle：Property Guru 有大量图片与后台请求；DOM 就绪后只等提取所需的元素
+            with scrape_metrics.phase("goto"):
+                await page.goto(_upstream_url(url), wait_until="domcontentloaded", timeout=_budget_ms(30000))
+
+            # og:title 随 HTML 直出，拿到公寓名后立即在另一个页面并行查 99.co site plan
+            early_title = await page.evaluate(
                 """() => {
-                const m = document.querySelector('meta[property="og:image"]');
-                return m ? m.getAttribute('content') : '';
+                const m = document.querySelector('meta[property="og:title"]');
+                const h1 = document.querySelector('h1');
+                return (m && m.getAttribute('content')) || (h1 ? h1.textContent.trim() : '');
             }"""
             )
-            # og:image 可能是网站 logo，仅当不含 logo 且无更好选择时使用
-            if og_image and _is_logo_or_ui(og_image, ""):
-                og_image = None
-
-            # 优先从主图区域抓取第一张房源图（排除户型图）
-            gallery_selectors = [
-                '[data-automation-id*="listing-gallery"] img',
-                '[data-automation-id*="listing-detail"] img',
-                '[class*="listing-gallery"] img',
-                '[class*="listing-images"] img',
-                '[class*="property-gallery"] img',
-                '[class*="photo-gallery"] img',
-                'img[src*="pgimgs.com/listing"]',
-                'img[src*="pgimgs"]',
-                '[class*="gallery"] img',
-                '[class*="carousel"] img',
-            ]
-            seen_srcs: set[str] = set()
-            for selector in gallery_selectors:
-                if len(image_urls) >= 1 and main_image_url:
-                    break
-                try:
-                    imgs = await page.locator(selector).all()
-                    for img in imgs[:12]:
-                        if len(image_urls) >= 1 and main_image_url:
-                            break
-                        src = await img.get_attribute("src")
-                        alt = await img.get_attribute("alt") or ""
-                        if not src or src in seen_srcs:
-                            continue
-                        if "floor" in src.lower() or "plan" in src.lower():
-                            continue
-                        if _is_logo_or_ui(src, alt):
-                            continue
-                        # 可选：排除过小图片（logo 通常 < 80px）
-                        try:
-                            box = await img.bounding_box()
-                            if box and (box["width"] < 60 or box["height"] < 60):
-                                continue
-                        except Exception:
-                            pass
-                        seen_srcs.add(src)
-                        if not main_image_url:
-                            main_image_url = src
-                        if len(image_urls) < 1:
-                            image_urls.append(src)
-                except Exception:
-                    pass
+            if early_title:
+                site_plan_task = asyncio.create_task(_lookup_site_plan(context, early_title))
 
-            # 若仍未找到，才用 og:image 作为兜底（且确认不是 logo）
-            if og_image and not main_image_url:
-                main_image_url = og_image
-            if og_image and len(image_urls) < 1 and og_image not in image_urls:
-                image_urls.insert(0, og_image)
-
-            # Floor plan: 优先从 Property Guru 媒体画廊的 floorPlans-section 抓取（可能在 modal 内）
-            floor_plan_selectors = [
-                'img[da-id="media-gallery-floorPlans"]',
-                'img.floorPlans',
-                '.floorPlans-section img',
-                'img.media-image.floorPlans',
-            ]
-            for sel in floor_plan_selectors:
-                try:
-                    if await page.locator(sel).count() > 0:
-                        src = await page.locator(sel).first.get_attribute("src", timeout=2000)
-                        if src:
-                            floor_plan_url = src
-                            break
-                except Exception:
-                    pass
-            # 若 modal 未打开导致找不到，尝试点击打开媒体画廊
-            if not floor_plan_url:
-                try:
-                    gallery_loc = page.locator(
-                        '[data-automation-id*="media-gallery"], [data-automation-id*="gallery"], '
-                        '[class*="media-gallery"] button, [class*="photo-gallery"] button, '
-                        'button:has-text("View"), a:has-text("View all"), [class*="gallery"] [role="button"]'
-                    ).first
-                    if await gallery_loc.count() > 0:
-                        await gallery_loc.click()
-                        await page.wait_for_timeout(1500)
-                        for sel in floor_plan_selectors:
-                            try:
-                                if await page.locator(sel).count() > 0:
-                                    src = await page.locator(sel).first.get_attribute("src", timeout=2000)
-                                    if src:
-                                        floor_plan_url = src
-                                        break
-                            except Exception:
-                                pass
-                except Exception:
-                    pass
-            # 兜底：含 floor/plan 的图
-            if not floor_plan_url:
-                floor_imgs = await page.locator(
-                    'img[src*="floor"], img[src*="plan"], [alt*="floor" i] img, [alt*="plan" i] img'
-                ).all()
-                for img in floor_imgs[:3]:
-                    src = await img.get_attribute("src")
-                    if src:
-                        floor_plan_url = src
-                        break
+            # 本房源的接口数据已带齐核心字段时不必等页面渲染，DOM 只用来补齐其余字段
+            captured = await capture.fields(url, _budget(1.0))
+            if not all(captured[0].get(f) for f in ("price", "size_sqft", "main_image_url")):
+                with scrape_metrics.phase("ready_wait"):
+                    await _wait_ready(page, LISTING_READY_SELECTORS, _budget_ms(READY_TIMEOUT_LISTING))
+                captured = await capture.fields(url, _budget(1.0))
 
-            # image_urls: 第一张主图 + 第二张户型图
-            if floor_plan_url and floor_plan_url not in image_urls:
-                image_urls.append(floor_plan_url)
-
-            # 卖家中介：姓名与电话（Property Guru 常见结构）
-            listing_agent_name: Optional[str] = None
-            listing_agent_phone: Optional[str] = None
-            # 1. 优先从 tel: 链接提取电话
-            tel_links = await page.locator('a[href^="tel:"]').all()
-            for tel in tel_links[:8]:
-                href = await tel.get_attribute("href")
-                if href:
-                    phone = re.sub(r"[\s\-]", "", href.replace("tel:", "").strip())
-                    if re.search(r"^\+?[\d]{8,15}$", phone):
-                        listing_agent_phone = phone
-                        # 尝试从同一区域获取中介姓名（父级容器内找非按钮文字）
-                        if not listing_agent_name:
-                            try:
-                                parent = tel.locator("xpath=ancestor::*[contains(@class, 'agent') or contains(@class, 'contact') or contains(@class, 'listing')][1]")
-                                if await parent.count() > 0:
-                                    parent_txt = await parent.first.text_content(timeout=300)
-                                    if parent_txt:
-                                        skip_words = {"contact", "call", "whatsapp", "phone", "sms", "enquire", "view"}
-                                        for part in re.split(r"[\s\n]+", parent_txt.replace(phone, "")):
-                                            s = part.strip()
-                                            if 2 <= len(s) <= 40 and not re.search(r"^[\d\+\-]+$", s) and s.lower() not in skip_words:
-                                                listing_agent_name = s
-                                                break
-                            except Exception:
-                                pass
-                        break
-            # 2. 正则从 HTML 中提取 tel:
-            if not listing_agent_phone:
-                tel_match = re.search(r'tel:(\+?[\d\s\-\.]{8,25})', body)
-                if tel_match:
-                    p = re.sub(r"[\s\-\.]", "", tel_match.group(1))
-                    if re.search(r"^\+?[\d]{8,15}$", p):
-                        listing_agent_phone = p
-            # 3. 兜底：新加坡常见格式 +65 8/9xxx xxxx 或 8 位手机号
-            if not listing_agent_phone:
-                sg_phone_patterns = [
-                    r"(?:\+65|65)\s*(\d[\d\s]{6,11})",
-                    r"(\+65\s*\d{4}\s*\d{4})",
-                    r"(?:contact|call|phone|tel)[:\s]*(\+?[\d\s\-]{8,20})",
-                ]
-                for pat in sg_phone_patterns:
-                    m = re.search(pat, body, re.I)
-                    if m:
-                        p = re.sub(r"[\s\-]", "", m.group(1))
-                        if re.search(r"^\+?[\d]{8,15}$", p):
-                            listing_agent_phone = p if p.startswith("+") else (f"+65{p}" if len(p) == 8 and p[0] in "89" else p)
-                            break
-            # 4. 中介姓名
-            agent_selectors = [
-                '[data-automation-id*="agent"]',
-                '[data-automation-id*="listing-agent"]',
-                '[class*="listing-agent"]',
-                '[class*="agent-name"]',
-                '[class*="contact-agent"]',
-                'a[href*="/agent/"]',
-                '[class*="seller"]',
-            ]
-            for sel in agent_selectors:
+            with scrape_metrics.phase("extraction"):
+                if SCRAPE_EXTRACTION_MODE == "locator":
+                    fields = await _extract_with_locators(page, url)
+                    _note_sources({k: "locator" for k, v in fields.items() if v})
+                    fields = _merge_captured_fields(fields, captured)
+                elif SCRAPE_EXTRACTION_MODE == "html":
+                    fields = await _extract_with_snapshot(page, url, open_gallery=not captured[0].get("floor_plan_url"))
+                    fields = _merge_captured_fields(fields, captured)
+                else:
+                    fields = await _extract_with_evaluate(page, url, on_progress, captured)
+            _emit_groups(on_progress, fields, ("core", "images", "floor_plan", "agent"))
+            if page_archive is not None:
+                # 存档提取后的 DOM（画廊已点开时包含户型图），离线重新提取时与在线结果一致
                 try:
-                    el = page.locator(sel).first
-                    txt = await el.text_content(timeout=500)
-                    if txt and 2 <= len(txt.strip()) <= 80 and not re.search(r"^[\d\+]+$", txt.strip()):
-                        listing_agent_name = txt.strip()
-                        break
-                except Exception:
-                    pass
+                    _archive_page(url, await page.content(), list(capture.blobs), "browser")
+                except Exception as e:
+                    logger.warning("读取页面 HTML 存档失败: %s (%s)", url, e)
+
+            # 标题需等页面渲染后才有时，退回到提取完成后再查
+            if site_plan_task is None:
+                site_plan_task = asyncio.create_task(_lookup_site_plan(context, fields["title"]))
+            site_plan_url = await site_plan_task
+            _emit_groups(on_progress, {"site_plan_url": site_plan_url}, ("site_plan",))
+
+            return ScrapeResponse(link=url, site_plan_url=site_plan_url, tier="browser", **fields)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _scrape_error(e)
+    finally:
+        if site_plan_task is not None and not site_plan_task.done():
+            site_plan_task.cancel()
 
-            listing_type = _detect_listing_type(url, body)
-            # 地契仅对出售房源有意义，租房不抓取
-            lease_tenure = None
-            if listing_type == "sale":
-                lease_tenure = _detect_lease_tenure(body)
 
-            # 从 99.co 抓取公寓 site plan（best-effort，失败不影响主流程）
-            site_plan_url: Optional[str] = None
-            apt_name = _extract_apartment_name(title)
-            if apt_name:
+def _validate_listing_url(raw_url: str) -> str:
+    """规范化链接并校验为 Property Guru 房源，否则抛 400"""
+    url = _normalize_propertyguru_url(raw_url)
+    if "propertyguru.com.sg" not in url and "propertyguru.com" not in url:
+        raise HTTPException(status_code=400, detail="仅支持 Property Guru 链接")
+    return url
+
+
+async def _get_listing(
+    url: str,
+    force_refresh: bool = False,
+    on_progress: Optional[ProgressFn] = None,
+    deadline: Optional[Deadline] = None,
+    browser_only: bool = False,
+    background: bool = False,
+) -> tuple[ScrapeResponse, str, float]:
+    """缓存 → 合并同一房源的并发抓取 → 排队抓取。
+    返回 (结果, 缓存状态 HIT/MISS/COALESCED, 排队等待秒数)；on_progress 只在本请求实际执行抓取时收到中间结果。
+    deadline 为本请求的总时间预算（默认 SCRAPE_DEADLINE，从调用时开始计），超出抛 504；browser_only 见 _scrape_listing。
+    background 为异步任务：排队等名额不受同步请求的排队上限与超时限制，时间预算从拿到名额时开始计"""
+    deadline = deadline or Deadline(SCRAPE_DEADLINE)
+    cache_key = _scrape_cache_key(url)
+    if not force_refresh:
+        cached = await _cache_get(cache_key)
+        if cached is not None:
+            return cached.model_copy(update={"link": url}), "HIT", 0.0
+
+    queue_wait = 0.0
+
+    async def scrape_and_cache() -> ScrapeResponse:
+        nonlocal queue_wait
+        # 在 SingleFlight 的任务内设置，各阶段（及其子任务）按发起请求的剩余时间限时
+        _current_deadline.set(deadline)
+        async with scrape_scheduler.slot(background) as waited:
+            queue_wait = waited
+            if background:
+                run_deadline = Deadline(SCRAPE_DEADLINE)
+                _current_deadline.set(run_deadline)
                 try:
-                    slug = _apartment_name_to_slug(apt_name)
-                    plan_url = f"https://www.99.co/singapore/condos-apartments/{slug}#site_plans"
-                    plan_page = await context.new_page()
-                    await plan_page.goto(plan_url, wait_until="load", timeout=15000)
-                    await plan_page.wait_for_timeout(2500)
-                    await plan_page.evaluate(
-                        """() => {
-                        const el = document.querySelector('#site_plans');
-                        if (el) el.scrollIntoView({ behavior: 'smooth' });
-                    }"""
+                    result = await asyncio.wait_for(
+                        _scrape_listing(url, on_progress, browser_only), timeout=run_deadline.remaining()
                     )
-                    await plan_page.wait_for_timeout(1500)
-                    for sel in [
-                        "#site_plans img.CarouselPhoto_image__06711",
-                        "#site_plans .CarouselPhoto_imageContainer__WOp2O img",
-                        "#site_plans img[src*='pic2.99.co']",
-                        "#site_plans img",
-                    ]:
-                        if await plan_page.locator(sel).count() > 0:
-                            img = plan_page.locator(sel).first
-                            src = await img.get_attribute("src")
-                            if src and "pic2.99.co" in src:
-                                site_plan_url = src
-                                break
-                    await plan_page.close()
-                except Exception:
-                    pass
+                except asyncio.TimeoutError:
+                    raise run_deadline.exceeded()
+            else:
+                result = await _scrape_listing(url, on_progress, browser_only)
+        await _cache_set(cache_key, result)
+        return result
 
-            await browser.close()
-
-            return ScrapeResponse(
-                title=title,
-                link=url,
-                price=price,
-                size_sqft=size_sqft,
-                bedrooms=bedrooms,
-                bathrooms=bathrooms,
-                main_image_url=main_image_url,
-                image_urls=image_urls[:2] if image_urls else None,
-                floor_plan_url=floor_plan_url,
-                basic_info=basic_info,
-                listing_agent_name=listing_agent_name,
-                listing_agent_phone=listing_agent_phone,
-                listing_type=listing_type,
-                lease_tenure=lease_tenure,
-                site_plan_url=site_plan_url,
-            )
+    # 同一房源正在被其他请求抓取时，直接等待那次抓取的结果（各自按自己的截止时间等待）
+    try:
+        result, shared = await asyncio.wait_for(
+            scrape_flights.do(cache_key, scrape_and_cache), timeout=None if background else deadline.remaining()
+        )
+    except asyncio.TimeoutError:
+        raise deadline.exceeded()
+    if shared:
+        return result.model_copy(update={"link": url}), "COALESCED", 0.0
+    return result, "MISS", queue_wait
+
+
+@app.post("/api/scrape-property", response_model=ScrapeResponse)
+async def scrape_property(req: ScrapeRequest, request: Request, response: Response):
+    url = _validate_listing_url(req.url)
+    trace = ScrapeTrace()
+    # 客户端断开时取消抓取；同一房源还有其他请求在等待时抓取继续（见 SingleFlight）
+    result, cache_status, queue_wait = await _until_disconnected(
+        request, _with_trace(trace, _get_listing(url, req.force_refresh))
+    )
+    response.headers["X-Cache"] = cache_status
+    response.headers["X-Queue-Wait"] = f"{queue_wait * 1000:.0f}"
+    # 浏览器开发者工具 Network → Timing 中可直接查看各阶段耗时
+    response.headers["Server-Timing"] = trace.server_timing(cache_status, queue_wait)
+    response.headers["Timing-Allow-Origin"] = "*"
+    if req.debug:
+        result = result.model_copy(update={"debug": trace.debug(cache_status, queue_wait, result.tier)})
+    return result
+
+
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/scrape-property/stream")
+async def scrape_property_stream(url: str, force_refresh: bool = False, debug: bool = False):
+    """SSE 渐进式抓取：各组字段确定后立即推送（core → images → floor_plan → agent → site_plan），
+    最后推送 complete（完整 ScrapeResponse）或 error"""
+    url = _validate_listing_url(url)
+    progress: asyncio.Queue = asyncio.Queue()
+
+    def on_progress(group: str, fields: dict) -> None:
+        progress.put_nowait((group, fields))
+
+    trace = ScrapeTrace()
+
+    async def stream() -> AsyncIterator[str]:
+        task = asyncio.create_task(_with_trace(trace, _get_listing(url, force_refresh, on_progress)))
+        emitted: set[str] = set()
+        try:
+            while not task.done():
+                getter = asyncio.create_task(progress.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                group, fields = getter.result()
+                emitted.add(group)
+                yield _sse_event(group, fields)
+            while not progress.empty():
+                group, fields = progress.get_nowait()
+                emitted.add(group)
+                yield _sse_event(group, fields)
+            try:
+                result, cache_status, queue_wait = await task
+            except HTTPException as e:
+                yield _sse_event("error", {"status": e.status_code, "detail": e.detail})
+                return
+            except Exception as e:
+                yield _sse_event("error", {"status": 500, "detail": f"抓取失败: {str(e)}"})
+                return
+            # 缓存命中或合并到其他请求的抓取时没有中间结果，按分组补齐
+            fields = result.model_dump()
+            for group in FIELD_GROUPS:
+                if group not in emitted:
+                    yield _sse_event(group, {k: fields.get(k) for k in FIELD_GROUPS[group]})
+            complete: dict[str, Any] = {"cache": cache_status, "result": fields}
+            if debug:
+                complete["debug"] = trace.debug(cache_status, queue_wait, result.tier).model_dump()
+            yield _sse_event("complete", complete)
+        finally:
+            # 客户端断开时取消抓取（合并中的抓取由 SingleFlight 保护，不受影响）
+            task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/scrape-properties")
+async def scrape_properties(req: BatchScrapeRequest):
+    """批量抓取：按并发上限抓取多个房源，每完成一个输出一行 NDJSON（完成顺序），单个失败不影响其他"""
+    if not req.urls:
+        raise HTTPException(status_code=400, detail="链接列表不能为空")
+    if len(req.urls) > SCRAPE_BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"单次最多 {SCRAPE_BATCH_MAX_URLS} 个链接")
+
+    sem = asyncio.Semaphore(SCRAPE_BATCH_CONCURRENCY)
+
+    async def scrape_one(index: int, raw_url: str) -> dict:
+        line: dict[str, Any] = {"index": index, "url": raw_url}
+        try:
+            url = _validate_listing_url(raw_url)
+            async with sem:
+                result, cache_status, _ = await _get_listing(url, req.force_refresh)
+            line.update(ok=True, cache=cache_status, result=result.model_dump())
+        except HTTPException as e:
+            line.update(ok=False, status=e.status_code, error=e.detail)
+        except Exception as e:
+            line.update(ok=False, status=500, error=f"抓取失败: {str(e)}")
+        return line
+
+    async def stream() -> AsyncIterator[str]:
+        tasks = [asyncio.create_task(scrape_one(i, u)) for i, u in enumerate(req.urls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的抓取
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# 计算内容哈希前去掉的部分：脚本、样式、注释、<link> 等每次请求都可能不同（nonce、构建号、统计代码）而与房源无关的内容
+_VOLATILE_HTML_RE = re.compile(
+    r"<script\b[^>]*>.*?</script>|<style\b[^>]*>.*?</style>|<noscript\b[^>]*>.*?</noscript>|<!--.*?-->|<link\b[^>]*>",
+    re.I | re.S,
+)
+
+# 刷新时逐字段比较的字段（site_plan_url 按公寓名查询，不随房源页面变化；标题中介会在后台改写，刷新不写回）
+REFRESH_DIFF_FIELDS = tuple(
+    f for f in ScrapeResponse.model_fields if f not in ("link", "title", "site_plan_url", "tier", "debug")
+)
+
+
+def _listing_content_hash(html: str) -> str:
+    """房源页面的内容哈希：去掉易变部分后的 HTML + 内嵌 JSON 中的房源字段"""
+    digest = hashlib.sha256(re.sub(r"\s+", " ", _VOLATILE_HTML_RE.sub("", html)).encode("utf-8"))
+    digest.update(json.dumps(_embedded_listing_fields(html), sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
 
+
+def _listing_changes(previous: Optional[dict], current: dict) -> dict[str, dict]:
+    """逐字段比较（只比较 previous 中提供的字段，空字符串与 null 视为相同）：{ 字段: { old, new } }。
+    本次没取到的字段不算变化：调用方不会清空已保存的值，否则每次刷新都会重复报告同一条变化"""
+    changes: dict[str, dict] = {}
+    for field in REFRESH_DIFF_FIELDS:
+        if not previous or field not in previous:
+            continue
+        old, new = previous[field] or None, current.get(field) or None
+        if new is not None and old != new:
+            changes[field] = {"old": old, "new": new}
+    return changes
+
+
+async def _refresh_listing(item: RefreshItem) -> dict:
+    """增量刷新一个房源：先发条件请求，304 或内容哈希未变即结束（一次 HTTP 请求）；
+    有变化时从取回的 HTML 直接提取，缺字段或被拦截时才用浏览器抓取。
+    返回 { status: unchanged | changed | gone, check, etag, last_modified, content_hash, changes, result }"""
+    url = _validate_listing_url(item.link)
+    line: dict[str, Any] = {
+        "etag": item.etag,
+        "last_modified": item.last_modified,
+        "content_hash": item.content_hash,
+    }
+
+    def done(status: str, check: str, **extra: Any) -> dict:
+        scrape_metrics.refresh(status, check)
+        line.update(status=status, check=check, **extra)
+        return line
+
+    with scrape_metrics.phase("refresh_check"):
+        html, status_code, validators = await http_fetcher.get_conditional(url, item.etag, item.last_modified)
+    if status_code == 304:
+        line.update(validators)
+        return done("unchanged", "not_modified")
+    if status_code in (404, 410):
+        return done("gone", f"http_{status_code}")
+
+    result: Optional[ScrapeResponse] = None
+    check = "full"
+    if html is not None:
+        line.update(validators)
+        line["content_hash"] = await asyncio.to_thread(_listing_content_hash, html)
+        if item.content_hash and line["content_hash"] == item.content_hash:
+            return done("unchanged", "hash")
+        with scrape_metrics.phase("extraction"):
+            extracted = await _extract_html_off_loop(html, url)
+        if not _missing_http_fields(extracted):
+            check = "html"
+            site_plan_url = (item.previous or {}).get("site_plan_url") or await _lookup_site_plan_http(extracted.title)
+            result = extracted.model_copy(update={"site_plan_url": site_plan_url, "tier": "http"})
+            _archive_page(url, html, None, "http")
+            await _cache_set(_scrape_cache_key(url), result)
+    if result is None:
+        # 被拦截、请求失败或 HTML 缺少字段：HTTP 已经试过，直接用浏览器抓取（同时更新缓存）；没有 HTML 时下次刷新仍需提取
+        result, _, _ = await _get_listing(url, force_refresh=True, browser_only=True)
+        if html is None:
+            line["content_hash"] = None
+
+    fields = result.model_dump(exclude={"debug"})
+    changes = _listing_changes(item.previous, fields)
+    if item.previous is not None and not changes:
+        # 页面有变化但房源字段没变（如推荐列表、浏览次数），只更新校验值和哈希
+        return done("unchanged", check)
+    return done("changed", check, changes=changes, result=fields)
+
+
+@app.post("/api/refresh-listings")
+async def refresh_listings(req: RefreshRequest):
+    """增量刷新已保存的房源：每条带上次的 etag / last_modified / content_hash 和当前字段，
+    每完成一条输出一行 NDJSON（完成顺序）：{ index, link, ok, status, check, etag, last_modified, content_hash, changes, result }，
+    失败时 status 为 error 并带 code / error。
+    未变化的房源只发一次条件请求；调用方保存返回的校验值和哈希，下次原样带回"""
+    if not req.items:
+        raise HTTPException(status_code=400, detail="房源列表不能为空")
+    if len(req.items) > SCRAPE_REFRESH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多 {SCRAPE_REFRESH_MAX_ITEMS} 个房源")
+
+    sem = asyncio.Semaphore(SCRAPE_REFRESH_CONCURRENCY)
+
+    async def refresh_one(index: int, item: RefreshItem) -> dict:
+        line: dict[str, Any] = {"index": index, "link": item.link}
+        try:
+            async with sem:
+                line.update(ok=True, **await _refresh_listing(item))
+        except HTTPException as e:
+            scrape_metrics.refresh("error", f"http_{e.status_code}")
+            line.update(ok=False, status="error", code=e.status_code, error=e.detail)
         except Exception as e:
-            await browser.close()
-            raise HTTPException(status_code=500, detail=f"抓取失败: {str(e)}")
+            scrape_metrics.refresh("error", "exception")
+            line.update(ok=False, status="error", code=500, error=f"刷新失败: {str(e)}")
+        return line
+
+    async def stream() -> AsyncIterator[str]:
+        tasks = [asyncio.create_task(refresh_one(i, item)) for i, item in enumerate(req.items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+class _ScrapeJob:
+    __slots__ = (
+        "id", "url", "force_refresh", "priority", "status", "result", "error",
+        "created_at", "started_at", "finished_at", "task", "done",
+    )
+
+    def __init__(self, url: str, force_refresh: bool, priority: int):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.force_refresh = force_refresh
+        self.priority = priority
+        self.status = "queued"  # queued | running | succeeded | failed | cancelled
+        self.result: Optional[ScrapeResponse] = None
+        self.error: Optional[dict] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.done = asyncio.Event()
+
+    def finish(self, status: str, result: Optional[ScrapeResponse] = None, error: Optional[dict] = None) -> None:
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self.done.set()
+
+    def to_response(self) -> "ScrapeJobResponse":
+        return ScrapeJobResponse(
+            job_id=self.id,
+            url=self.url,
+            priority=self.priority,
+            status=self.status,
+            result=self.result,
+            error=self.error,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+        )
+
+
+class ScrapeJobManager:
+    """异步抓取任务：提交后立即返回 job id，后台 worker 按优先级执行，结果保留一段时间后过期。
+    任务保存在进程内存中，多个 uvicorn worker 之间不共享。"""
+
+    def __init__(self, workers: int, max_queued: int, retention: float):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.retention = retention
+        self._jobs: dict[str, _ScrapeJob] = {}
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queued(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == "queued")
+
+    def submit(self, url: str, force_refresh: bool, priority: int) -> _ScrapeJob:
+        if self.queued() >= self.max_queued:
+            raise HTTPException(status_code=429, detail="排队任务过多，请稍后重试", headers={"Retry-After": "30"})
+        job = _ScrapeJob(url, force_refresh, priority)
+        self._jobs[job.id] = job
+        # 优先级数值越大越先执行；同优先级先进先出
+        self._seq += 1
+        self._queue.put_nowait((-priority, self._seq, job.id))
+        return job
+
+    def get(self, job_id: str) -> Optional[_ScrapeJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[_ScrapeJob]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status == "queued":
+            job.finish("cancelled")
+        elif job.status == "running" and job.task is not None:
+            job.task.cancel()
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            # 任务已由 SCRAPE_JOB_MAX_QUEUED 准入：同步请求占满排队名额时等待，而不是以 429 / 503 失败
+            job.task = asyncio.create_task(_get_listing(job.url, job.force_refresh, background=True))
+            try:
+                result, _, _ = await job.task
+                job.finish("succeeded", result=result)
+            except asyncio.CancelledError:
+                job.finish("cancelled")
+                # worker 自身被取消（服务关闭，取消会传给正在等待的 job.task）时退出循环；
+                # 只有任务被单独取消（DELETE）时继续处理下一个
+                if asyncio.current_task().cancelling():
+                    raise
+            except HTTPException as e:
+                job.finish("failed", error={"status": e.status_code, "detail": e.detail})
+            except Exception as e:
+                job.finish("failed", error={"status": 500, "detail": f"抓取失败: {str(e)}"})
+            finally:
+                job.task = None
+
+    async def _sweeper(self) -> None:
+        """定期清理超过保留时间的已结束任务"""
+        while True:
+            await asyncio.sleep(min(60.0, self.retention))
+            cutoff = time.time() - self.retention
+            expired = [jid for jid, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+            for jid in expired:
+                del self._jobs[jid]
+
+    def stats(self) -> dict:
+        counts: dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "jobs": counts}
+
+
+scrape_jobs = ScrapeJobManager(SCRAPE_JOB_WORKERS, SCRAPE_JOB_MAX_QUEUED, SCRAPE_JOB_RETENTION)
+
+
+@app.post("/api/scrape-jobs", response_model=ScrapeJobResponse, status_code=202)
+async def submit_scrape_job(req: ScrapeJobRequest):
+    """提交异步抓取任务，立即返回 job id；之后用 GET /api/scrape-jobs/{job_id} 查询结果"""
+    url = _validate_listing_url(req.url)
+    return scrape_jobs.submit(url, req.force_refresh, req.priority).to_response()
+
+
+@app.get("/api/scrape-jobs/{job_id}", response_model=ScrapeJobResponse)
+async def get_scrape_job(job_id: str, wait: float = 0):
+    """查询任务状态；wait > 0 时长轮询，最多等待 wait 秒（上限 30）直到任务结束"""
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    if wait > 0 and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=min(wait, 30.0))
+        except asyncio.TimeoutError:
+            pass
+    return job.to_response()
+
+
+@app.delete("/api/scrape-jobs/{job_id}", response_model=ScrapeJobResponse)
+async def cancel_scrape_job(job_id: str):
+    """取消排队中或执行中的任务"""
+    job = scrape_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_response()
+
+
+async def _fetch_site_plan(slug: str) -> tuple[Optional[str], bool]:
+    """打开 99.co 公寓页面抓取 site plan 图片地址，返回 (图片地址, 是否确定)，见 _find_site_plan"""
+    try:
+        async with browser_pool.context() as context:
+            page = await context.new_page()
+            return await _find_site_plan(page, slug, _budget_ms(30000))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _scrape_error(e, "抓取 site plan ")
 
 
 @app.post("/api/scrape-site-plan", response_model=SitePlanResponse)
-async def scrape_site_plan(req: SitePlanRequest):
-    """从 99.co 抓取公寓的 site plan 图片"""
+async def scrape_site_plan(req: SitePlanRequest, request: Request, response: Response):
+    """从 99.co 抓取公寓的 site plan 图片（受 SCRAPE_DEADLINE 限时，客户端断开时取消）"""
     apartment_name = req.apartment_name.strip()
     if not apartment_name:
         raise HTTPException(status_code=400, detail="公寓名称不能为空")
 
     slug = _apartment_name_to_slug(apartment_name)
-    url = f"https://www.99.co/singapore/condos-apartments/{slug}#site_plans"
+    cached = site_plan_cache.get(slug) if slug else None
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        site_plan_url = cached or None
+    else:
+        deadline = Deadline(SCRAPE_DEADLINE)
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        )
-        page = await context.new_page()
+        async def fetch() -> tuple[Optional[str], bool]:
+            _current_deadline.set(deadline)
+            async with scrape_scheduler.slot() as waited:
+                response.headers["X-Queue-Wait"] = f"{waited * 1000:.0f}"
+                return await _fetch_site_plan(slug)
 
         try:
-            await page.goto(url, wait_until="load", timeout=30000)
-            await page.wait_for_timeout(3000)
-
-            # 先滚动到 #site_plans 确保加载
-            await page.evaluate(
-                """() => {
-                const el = document.querySelector('#site_plans');
-                if (el) el.scrollIntoView({ behavior: 'smooth' });
-            }"""
+            site_plan_url, conclusive = await _until_disconnected(
+                request, asyncio.wait_for(fetch(), timeout=deadline.remaining())
             )
-            await page.wait_for_timeout(2000)
-
-            # 选择器：site_plans 区域内的 CarouselPhoto 图片
-            selectors = [
-                "#site_plans img.CarouselPhoto_image__06711",
-                "#site_plans .CarouselPhoto_imageContainer__WOp2O img",
-                "#site_plans img[src*='pic2.99.co']",
-                "#site_plans img",
-            ]
-            site_plan_url: Optional[str] = None
-            for sel in selectors:
-                try:
-                    if await page.locator(sel).count() > 0:
-                        img = page.locator(sel).first
-                        src = await img.get_attribute("src")
-                        if src and "pic2.99.co" in src:
-                            site_plan_url = src
-                            break
-                except Exception:
-                    pass
+        except asyncio.TimeoutError:
+            raise deadline.exceeded()
+        if not conclusive:
+            # 被 99.co 拦截或页面未渲染完成：不缓存，让调用方稍后重试
+            raise HTTPException(
+                status_code=503,
+                detail=f"暂时无法确认该公寓的 site plan（99.co 拦截或加载超时），请稍后重试：{apartment_name}",
+                headers={"Retry-After": "60"},
+            )
+        _remember_site_plan(slug, site_plan_url)
+        response.headers["X-Cache"] = "MISS"
 
-            await browser.close()
+    if not site_plan_url:
+        raise HTTPException(
+            status_code=404,
+            detail=f"未找到该公寓的 site plan，请确认 99.co 上存在：{apartment_name}",
+        )
+    return SitePlanResponse(site_plan_url=site_plan_url)
 
-            if not site_plan_url:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"未找到该公寓的 site plan，请确认 99.co 上存在：{apartment_name}",
-                )
 
-            return SitePlanResponse(site_plan_url=site_plan_url)
+@app.get("/api/health")
+async def health():
+    """健康检查：返回浏览器池状态，可作为 Render Health Check Path"""
+    return {
+        "status": "ok",
+        "browser_pool": browser_pool.stats(),
+        "scheduler": scrape_scheduler.stats(),
+        "cache": scrape_cache.stats(),
+        "site_plan_cache": site_plan_cache.stats(),
+        "single_flight": scrape_flights.stats(),
+        "jobs": scrape_jobs.stats(),
+        "http_fetcher": http_fetcher.stats(),
+        "selectors": selector_stats.stats(),
+        "resource_policy": resource_policy.stats(),
+        "disk_cache": await asyncio.to_thread(scrape_disk_cache.stats) if scrape_disk_cache else None,
+        "archive": page_archive.stats() if page_archive else None,
+    }
 
-        except HTTPException:
-            await browser.close()
-            raise
-        except Exception as e:
-            await browser.close()
-            raise HTTPException(status_code=500, detail=f"抓取 site plan 失败: {str(e)}")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式指标：阶段耗时、选择器命中、缓存命中率、队列、浏览器与内存"""
+    lines = scrape_metrics.render()
+
+    def family(name: str, help_text: str, samples: dict[str, Any], kind: str = "gauge") -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples.items():
+            if value is not None:
+                lines.append(f"{name}{labels} {value}")
+
+    caches: dict[str, tuple[int, int]] = {
+        "memory": (scrape_cache.hits, scrape_cache.misses),
+        "site_plan": (site_plan_cache.hits, site_plan_cache.misses),
+    }
+    if scrape_disk_cache is not None:
+        caches["disk"] = (scrape_disk_cache.hits, scrape_disk_cache.misses)
+    family("scrape_cache_hits_total", "Cache hits.", {f'{{cache="{c}"}}': h for c, (h, _) in caches.items()}, "counter")
+    family("scrape_cache_misses_total", "Cache misses.", {f'{{cache="{c}"}}': m for c, (_, m) in caches.items()}, "counter")
+    family(
+        "scrape_cache_hit_ratio",
+        "Cache hit ratio since start.",
+        {f'{{cache="{c}"}}': round(h / (h + m), 4) if h + m else 0 for c, (h, m) in caches.items()},
+    )
+    family("scrape_coalesced_total", "Requests that joined an in-flight scrape.", {"": scrape_flights.coalesced}, "counter")
+
+    sched = scrape_scheduler.stats()
+    family("scrape_queue_depth", "Scrapes waiting for an admission slot.", {"": sched["queue_depth"]})
+    family("scrape_in_flight", "Scrapes holding an admission slot.", {"": sched["in_flight"]})
+    family("scrape_rejected_total", "Scrapes rejected because the queue was full.", {"": sched["rejected"]}, "counter")
+    family("scrape_queue_timeouts_total", "Scrapes that timed out in the queue.", {"": sched["timed_out"]}, "counter")
+
+    pool = browser_pool.stats()
+    family("scrape_browsers_connected", "Connected Chromium browsers in the pool.", {"": pool["connected"]})
+    family("scrape_browser_contexts_active", "Browser contexts currently in use.", {"": pool["active_contexts"]})
+    family("scrape_browser_restarts_total", "Browsers replaced after a crash or failed probe.", {"": pool["restarts"]}, "counter")
+    family(
+        "scrape_browser_recycles_total",
+        "Browsers drained and restarted after too many pages or too much memory.",
+        {f'{{reason="{r}"}}': pool["recycled"].get(r, 0) for r in ("pages", "rss")},
+        "counter",
+    )
+
+    memory = await asyncio.to_thread(_process_memory)
+    family("process_resident_memory_bytes", "Resident memory of the API process.", {"": memory["rss_bytes"]})
+    family("scrape_chromium_processes", "Chromium processes started by this service.", {"": memory["chromium_processes"]})
+    family("scrape_chromium_resident_memory_bytes", "Resident memory of those Chromium processes.", {"": memory["chromium_rss_bytes"]})
+
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
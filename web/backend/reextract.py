@@ -0,0 +1,97 @@
+"""
+离线重新提取：对页面存档（SCRAPE_ARCHIVE_DIR）中保存的 HTML / 捕获 JSON 重新运行提取引擎，
+按 CPU 核数多进程并行，逐行输出 JSONL，不向 Property Guru 发出任何请求。提取规则修改后用它回填历史数据。
+
+用法（在 web/backend 目录下）：
+  python reextract.py --archive /data/property-archive --out records.jsonl
+  python reextract.py --archive /data/property-archive --all-versions --url-filter 24026893
+
+每行输出 { url, fetched_at, tier, html_sha256, result }，提取失败时 result 为 null 并带 error。
+site_plan_url 需在线查 99.co，离线重新提取不包含。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ARCHIVE_DIR = os.environ.get("SCRAPE_ARCHIVE_DIR", "")
+
+# 离线运行：不读写磁盘缓存、选择器统计，也不再往存档里写
+os.environ["SCRAPE_CACHE_DB"] = ""
+os.environ["SCRAPE_SELECTOR_STATS_PATH"] = ""
+os.environ["SCRAPE_ARCHIVE_DIR"] = ""
+
+import main  # noqa: E402
+
+_worker_archive: "main.PageArchive | None" = None
+
+
+def _init_worker(root: str) -> None:
+    global _worker_archive
+    _worker_archive = main.PageArchive(root)
+
+
+def reextract_entry(entry: dict) -> dict:
+    """子进程中执行：读出存档对象并重新提取一条记录"""
+    record = {
+        "url": entry["url"],
+        "fetched_at": entry.get("fetched_at"),
+        "tier": entry.get("tier"),
+        "html_sha256": entry["html"],
+    }
+    try:
+        html, captured = _worker_archive.load(entry)
+        result = main.extract_listing_from_html(html, entry["url"], captured)
+        record["result"] = result.model_dump(exclude={"site_plan_url", "tier"})
+    except Exception as e:
+        record["result"] = None
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def run(args: argparse.Namespace) -> int:
+    if not os.path.exists(os.path.join(args.archive, "index.jsonl")):
+        print(f"存档中没有 index.jsonl: {args.archive}", file=sys.stderr)
+        return 1
+    entries = main.PageArchive(args.archive).entries(latest_only=not args.all_versions)
+    if args.url_filter:
+        entries = [e for e in entries if args.url_filter in e["url"]]
+    workers = max(1, args.workers or os.cpu_count() or 1)
+    chunksize = max(1, len(entries) // (workers * 4))
+
+    started = time.perf_counter()
+    failed = 0
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(args.archive,)) as pool:
+            for record in pool.map(reextract_entry, entries, chunksize=chunksize):
+                failed += "error" in record
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"重新提取 {len(entries)} 条（失败 {failed}），{workers} 个进程，"
+        f"耗时 {elapsed:.1f}s（{len(entries) / elapsed if elapsed else 0:.0f} 页/秒）",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser(description="对页面存档离线重新提取，输出 JSONL")
+    parser.add_argument(
+        "--archive", default=ARCHIVE_DIR or None, required=not ARCHIVE_DIR, help="存档目录（默认取 SCRAPE_ARCHIVE_DIR）"
+    )
+    parser.add_argument("--out", default="-", help="输出 JSONL 路径，- 为标准输出")
+    parser.add_argument("--workers", type=int, default=0, help="进程数，默认 CPU 核数")
+    parser.add_argument("--all-versions", action="store_true", help="输出每次抓取的版本，而不只是每个链接最近一次")
+    parser.add_argument("--url-filter", default="", help="只处理链接中包含该字符串的记录")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    cli()
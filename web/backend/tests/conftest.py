@@ -0,0 +1,86 @@
+import os
+import sys
+
+# 测试不读写持久化的磁盘缓存、选择器统计与页面存档
+os.environ["SCRAPE_CACHE_DB"] = ""
+os.environ["SCRAPE_SELECTOR_STATS_PATH"] = ""
+os.environ["SCRAPE_ARCHIVE_DIR"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contextlib  # noqa: E402
+import types  # noqa: E402
+
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+
+
+class FakeListingPage:
+    """_scrape_listing_browser 用到的 Page 方法：goto 成功，early title 为 og:title，其余等待立即满足"""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.closed = False
+
+    async def route(self, *args, **kwargs) -> None:
+        pass
+
+    def on(self, event, handler) -> None:
+        pass
+
+    async def goto(self, url, **kwargs):
+        return types.SimpleNamespace(status=200)
+
+    async def evaluate(self, script, *args):
+        return self.title
+
+    async def wait_for_function(self, *args, **kwargs):
+        return True
+
+    async def content(self) -> str:
+        return f"<html><head><title>{self.title}</title></head></html>"
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeBrowser:
+    """替换 browser_pool.context：每个 context 记录打开的页面与是否已关闭"""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.contexts: list[types.SimpleNamespace] = []
+
+    @contextlib.asynccontextmanager
+    async def context(self):
+        pages: list[FakeListingPage] = []
+
+        async def new_page():
+            page = FakeListingPage(self.title)
+            pages.append(page)
+            return page
+
+        ctx = types.SimpleNamespace(new_page=new_page, pages=pages, closed=False)
+        self.contexts.append(ctx)
+        try:
+            yield ctx
+        finally:
+            ctx.closed = True
+
+
+def listing_fields(**values) -> dict:
+    """_extract_with_* 返回的房源字段（ScrapeResponse 去掉 link / site_plan_url / tier / debug）"""
+    fields = main.ScrapeResponse(title="Property", link="").model_dump(exclude={"link", "site_plan_url", "tier", "debug"})
+    fields.update(values)
+    return fields
+
+
+@pytest.fixture
+def fake_browser(monkeypatch):
+    browser = FakeBrowser("The Sail @ Marina Bay")
+    monkeypatch.setattr(main.browser_pool, "context", browser.context)
+    monkeypatch.setattr(main, "SCRAPE_EXTRACTION_MODE", "evaluate")
+    monkeypatch.setattr(main, "site_plan_cache", main.TTLCache(10, 60))
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+    return browser
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+
+import main
+import reextract
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures")
+SAIL_URL = "https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001"
+PARC_ESTA_URL = "https://www.propertyguru.com.sg/listing/for-sale-parc-esta-24000004"
+CAPTURED = [{"pageProps": {"listing": {"id": 24000001, "price": {"pretty": "S$ 1,790,000"}}}}]
+
+
+def _fixture(url: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", url.rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_archive_round_trip_and_deduplication(tmp_path):
+    archive = main.PageArchive(str(tmp_path))
+    html = _fixture(SAIL_URL)
+    first = archive.add(SAIL_URL, html, tier="http")
+    second = archive.add(SAIL_URL, html, CAPTURED, tier="browser")
+    archive.add(PARC_ESTA_URL, _fixture(PARC_ESTA_URL), tier="browser")
+
+    # 相同 HTML 只存一份
+    assert first["html"] == second["html"]
+    assert archive.stats()["stored"] == 3 and archive.stats()["deduplicated"] == 1
+    assert archive.load(first) == (html, None)
+    assert archive.load(second) == (html, CAPTURED)
+
+    assert len(archive.entries(latest_only=False)) == 3
+    latest = {e["url"]: e for e in archive.entries()}
+    assert latest[SAIL_URL]["tier"] == "browser"
+    assert latest[SAIL_URL]["json"] == second["json"]
+
+
+def test_entries_skip_truncated_lines(tmp_path):
+    archive = main.PageArchive(str(tmp_path))
+    archive.add(SAIL_URL, _fixture(SAIL_URL))
+    with open(archive.index_path, "a", encoding="utf-8") as f:
+        f.write('{"url": "https://www.propertyguru.com.sg/listing/x", "ht')
+    assert [e["url"] for e in archive.entries()] == [SAIL_URL]
+
+
+def _run(archive_dir, out, **kwargs) -> int:
+    args = argparse.Namespace(archive=str(archive_dir), out=str(out), workers=1, all_versions=False, url_filter="")
+    vars(args).update(kwargs)
+    return reextract.run(args)
+
+
+def _records(out) -> list[dict]:
+    with open(out, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_reextract_matches_online_extraction(tmp_path):
+    archive = main.PageArchive(str(tmp_path / "archive"))
+    html = _fixture(SAIL_URL)
+    archive.add(SAIL_URL, html, tier="http")
+    archive.add(SAIL_URL, html, CAPTURED, tier="browser")
+    archive.add(PARC_ESTA_URL, _fixture(PARC_ESTA_URL), tier="browser")
+    out = tmp_path / "records.jsonl"
+
+    assert _run(tmp_path / "archive", out) == 0
+    records = {r["url"]: r for r in _records(out)}
+    expected = main.extract_listing_from_html(html, SAIL_URL, CAPTURED).model_dump(exclude={"site_plan_url", "tier"})
+    assert records[SAIL_URL]["result"] == expected
+    assert records[SAIL_URL]["result"]["price"] == "S$ 1,790,000"
+    assert records[SAIL_URL]["tier"] == "browser"
+    assert records[PARC_ESTA_URL]["result"]["price"] == "S$ 1,620,000"
+
+    assert _run(tmp_path / "archive", out, all_versions=True, url_filter="24000001") == 0
+    assert [r["tier"] for r in _records(out)] == ["http", "browser"]
+
+
+def test_reextract_reports_missing_objects(tmp_path):
+    archive = main.PageArchive(str(tmp_path / "archive"))
+    entry = archive.add(SAIL_URL, _fixture(SAIL_URL))
+    os.remove(archive._object_path(entry["html"]))
+    out = tmp_path / "records.jsonl"
+
+    assert _run(tmp_path / "archive", out) == 1
+    (record,) = _records(out)
+    assert record["result"] is None
+    assert record["error"].startswith("FileNotFoundError")
+    assert _run(tmp_path / "missing", out) == 1
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import HTTPException
+
+import main
+
+SLOW = "https://www.propertyguru.com.sg/listing/for-sale-slow-1"
+FAST = "https://www.propertyguru.com.sg/listing/for-sale-fast-2"
+BLOCKED = "https://www.propertyguru.com.sg/listing/for-sale-blocked-3"
+
+
+async def _post(payload: dict) -> httpx.Response:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/api/scrape-properties", json=payload)
+
+
+async def test_batch_streams_in_completion_order_with_inline_errors(monkeypatch):
+    async def get_listing(url, force_refresh=False, *args, **kwargs):
+        if url == BLOCKED:
+            raise HTTPException(status_code=503, detail="抓取排队超时，请稍后重试")
+        await asyncio.sleep(0.1 if url == SLOW else 0)
+        return main.ScrapeResponse(title=url.rsplit("-", 2)[1], link=url), "MISS", 0.0
+
+    monkeypatch.setattr(main, "_get_listing", get_listing)
+    resp = await _post({"urls": [SLOW, "https://example.com/not-a-listing", FAST, BLOCKED]})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+
+    assert lines[-1]["index"] == 0  # 最慢的最后输出
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[0]["ok"] and by_index[0]["result"]["title"] == "slow"
+    assert by_index[2] == {"index": 2, "url": FAST, "ok": True, "cache": "MISS", "result": by_index[2]["result"]}
+    assert by_index[1]["ok"] is False and by_index[1]["status"] == 400
+    assert by_index[3] == {"index": 3, "url": BLOCKED, "ok": False, "status": 503, "error": "抓取排队超时，请稍后重试"}
+
+
+async def test_batch_respects_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(main, "SCRAPE_BATCH_CONCURRENCY", 2)
+    running = 0
+    peak = 0
+
+    async def get_listing(url, force_refresh=False, *args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return main.ScrapeResponse(title="T", link=url), "MISS", 0.0
+
+    monkeypatch.setattr(main, "_get_listing", get_listing)
+    urls = [f"https://www.propertyguru.com.sg/listing/for-sale-x-{i}" for i in range(6)]
+    resp = await _post({"urls": urls})
+    assert len(resp.text.splitlines()) == 6
+    assert peak == 2
+
+
+async def test_batch_rejects_empty_and_oversized_requests(monkeypatch):
+    monkeypatch.setattr(main, "SCRAPE_BATCH_MAX_URLS", 2)
+    assert (await _post({"urls": []})).status_code == 400
+    assert (await _post({"urls": [FAST, SLOW, BLOCKED]})).status_code == 400
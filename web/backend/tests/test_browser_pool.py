@@ -0,0 +1,142 @@
+import asyncio
+import types
+
+import main
+
+
+class _Context:
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler) -> None:
+        self.handlers[event] = handler
+
+    async def new_page(self):
+        page = object()
+        self.handlers["page"](page)
+        return page
+
+    async def close(self) -> None:
+        pass
+
+
+class _Browser:
+    def __init__(self, n: int, events: list):
+        self.n = n
+        self.events = events
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def new_context(self, **kwargs):
+        return _Context()
+
+    async def close(self) -> None:
+        self.connected = False
+        self.events.append(("close", self.n))
+
+
+class _Chromium:
+    """替换 playwright.chromium：记录每次启动与关闭的先后顺序"""
+
+    def __init__(self):
+        self.events: list[tuple[str, int]] = []
+        self.browsers: list[_Browser] = []
+
+    async def launch(self, **kwargs):
+        browser = _Browser(len(self.browsers) + 1, self.events)
+        self.browsers.append(browser)
+        self.events.append(("launch", browser.n))
+        return browser
+
+
+def _pool(**kwargs) -> tuple[main.BrowserPool, _Chromium]:
+    pool = main.BrowserPool(1, health_interval=3600, **kwargs)
+    chromium = _Chromium()
+    pool._playwright = types.SimpleNamespace(chromium=chromium)
+    return pool, chromium
+
+
+async def _open_pages(pool: main.BrowserPool, n: int) -> None:
+    async with pool.context() as context:
+        for _ in range(n):
+            await context.new_page()
+
+
+async def _drained(pool: main.BrowserPool) -> None:
+    await asyncio.wait_for(asyncio.gather(*pool._drain_tasks), 2)
+
+
+async def test_browser_is_recycled_after_max_pages():
+    pool, chromium = _pool(max_pages=3)
+    await _open_pages(pool, 2)
+    assert pool.stats()["pages"] == [2] and pool.recycled == {}
+
+    await _open_pages(pool, 1)
+    assert pool.recycled == {"pages": 1}
+    assert pool.stats()["draining"] == 1
+    await _drained(pool)
+    assert chromium.events == [("launch", 1), ("close", 1)]
+
+    # 下次使用时重新启动，页面计数从零开始
+    await _open_pages(pool, 1)
+    assert chromium.events[-1] == ("launch", 2)
+    assert pool.stats()["pages"] == [1]
+    assert pool.stats()["draining"] == 0
+
+
+async def test_recycling_waits_for_in_flight_contexts():
+    pool, chromium = _pool(max_pages=1)
+    release = asyncio.Event()
+    holding = asyncio.Event()
+
+    async def in_flight():
+        async with pool.context():
+            holding.set()
+            await release.wait()
+
+    task = asyncio.create_task(in_flight())
+    await holding.wait()
+    await _open_pages(pool, 1)
+    assert pool.recycled == {"pages": 1}
+
+    # 旧浏览器仍有在途抓取：不关闭，新请求也要等它关闭后才启动新浏览器
+    waiting = asyncio.create_task(_open_pages(pool, 1))
+    await asyncio.sleep(0.3)
+    assert chromium.events == [("launch", 1)]
+    assert not waiting.done()
+
+    release.set()
+    await task
+    await asyncio.wait_for(waiting, 2)
+    assert chromium.events[:3] == [("launch", 1), ("close", 1), ("launch", 2)]
+    await _drained(pool)
+
+
+async def test_drain_timeout_closes_stuck_browser():
+    pool, chromium = _pool(max_pages=1, drain_timeout=0.05)
+    release = asyncio.Event()
+    holding = asyncio.Event()
+
+    async def stuck():
+        async with pool.context():
+            holding.set()
+            await release.wait()
+
+    task = asyncio.create_task(stuck())
+    await holding.wait()
+    await _open_pages(pool, 1)
+    await _drained(pool)
+    assert chromium.events == [("launch", 1), ("close", 1)]
+    release.set()
+    await task
+
+
+async def test_no_recycling_without_max_pages():
+    pool, chromium = _pool(max_pages=0)
+    for _ in range(5):
+        await _open_pages(pool, 2)
+    assert pool.recycled == {}
+    assert pool.stats()["pages"] == [10]
+    assert chromium.events == [("launch", 1)]
@@ -0,0 +1,80 @@
+import main
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = main.TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    cache = main.TTLCache(max_size=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("neg", "", ttl=5)
+    now[0] += 10
+    assert cache.get("neg") is None
+    assert cache.get("a") == 1
+    now[0] += 60
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def _disk_cache(tmp_path, ttl=60.0, max_bytes=1 << 20) -> main.SqliteCache:
+    return main.SqliteCache(str(tmp_path / "cache.sqlite3"), ttl, max_bytes)
+
+
+def test_sqlite_cache_round_trip_and_expiry(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: now[0])
+    cache = _disk_cache(tmp_path)
+    cache.set("k", '{"a": 1}')
+    payload, ttl_left = cache.get("k")
+    assert payload == '{"a": 1}'
+    assert ttl_left == 60.0
+    now[0] += 61
+    assert cache.get("k") is None
+    # 过期条目在下次写入时清理
+    cache.set("other", "{}")
+    assert cache.stats()["entries"] == 1
+
+
+def test_sqlite_cache_prunes_least_recently_accessed(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: now[0])
+    cache = _disk_cache(tmp_path, max_bytes=250)
+    for key in ("a", "b"):
+        cache.set(key, "x" * 100)
+        now[0] += 1
+    assert cache.get("a") is not None  # a 变为最近访问
+    now[0] += 1
+    cache.set("c", "x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["bytes"] <= 250
+
+
+async def test_corrupt_disk_cache_row_is_dropped_as_miss(tmp_path, monkeypatch):
+    disk = _disk_cache(tmp_path)
+    monkeypatch.setattr(main, "scrape_disk_cache", disk)
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+    disk.set("https://www.propertyguru.com.sg/listing/x-1", '{"link": "no title"}')
+    disk.set("https://www.propertyguru.com.sg/listing/x-2", "not json")
+    for key in ("https://www.propertyguru.com.sg/listing/x-1", "https://www.propertyguru.com.sg/listing/x-2"):
+        assert await main._cache_get(key) is None
+        assert disk.get(key) is None
+    assert disk.stats()["entries"] == 0
+
+    good = main.ScrapeResponse(title="T", link="https://www.propertyguru.com.sg/listing/x-3", price="S$ 1")
+    await main._cache_set("k", good)
+    main.scrape_cache.clear()
+    assert await main._cache_get("k") == good
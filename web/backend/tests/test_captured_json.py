@@ -0,0 +1,117 @@
+import json
+import os
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures")
+SAIL_URL = "https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001"
+PARC_ESTA_URL = "https://www.propertyguru.com.sg/listing/for-sale-parc-esta-24000004"
+
+SIMILAR_LISTINGS = {
+    "data": {
+        "similarListings": [
+            {
+                "id": 25999999,
+                "price": 990000,
+                "floorArea": 505,
+                "images": ["https://cdn.example/other-listing/photo.jpg"],
+                "floorPlan": "https://cdn.example/other-listing/floorplan.jpg",
+                "agent": {"name": "Other Agent", "mobile": "+6580000000"},
+            }
+        ]
+    }
+}
+
+
+def _fixture(url: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", url.rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def _own_listing(listing_id) -> dict:
+    return {"pageProps": {"listing": {"id": listing_id, "price": {"pretty": "S$ 1,790,000"}, "tenure": "99-year"}}}
+
+
+def test_listing_id_from_url():
+    assert main._listing_id_from_url(SAIL_URL) == "24000001"
+    assert main._listing_id_from_url(SAIL_URL + "/") == "24000001"
+    assert main._listing_id_from_url("https://www.propertyguru.com.sg/property-for-sale") is None
+
+
+def test_other_listings_do_not_override_dom():
+    result = main.extract_listing_from_html(_fixture(SAIL_URL), SAIL_URL, [SIMILAR_LISTINGS])
+    assert result.price == "S$ 1,850,000"
+    assert result.size_sqft == "1,001 sqft"
+    assert result.listing_agent_phone == "+6591234567"
+    assert "other-listing" not in (result.main_image_url or "")
+    assert result.floor_plan_url == "https://sg1-cdn.pgimgs.com/listing/24000001/FLPL.1.V800/floorplan.jpg"
+
+
+def test_unscoped_json_only_fills_missing_fields():
+    result = main.extract_listing_from_html(_fixture(PARC_ESTA_URL), PARC_ESTA_URL, [SIMILAR_LISTINGS])
+    assert result.price == "S$ 1,620,000"
+    assert result.floor_plan_url == "https://cdn.example/other-listing/floorplan.jpg"
+
+
+def test_own_listing_json_overrides_dom():
+    for listing_id in (24000001, "24000001"):
+        result = main.extract_listing_from_html(_fixture(SAIL_URL), SAIL_URL, [SIMILAR_LISTINGS, _own_listing(listing_id)])
+        assert result.price == "S$ 1,790,000"
+        assert result.size_sqft == "1,001 sqft"
+
+
+def test_captured_fields_are_scoped_to_the_listing_node():
+    blob = {"user": {"id": 7}, "listing": {"id": 24000001, "price": 1790000}, "similar": SIMILAR_LISTINGS}
+    own, unscoped = main._captured_listing_fields([blob], SAIL_URL)
+    assert own == {"price": "S$ 1,790,000"}
+    assert unscoped == {}
+    own, unscoped = main._captured_listing_fields([_own_listing(24000002)], SAIL_URL)
+    assert own == {}
+    assert unscoped["price"] == "S$ 1,790,000"
+
+
+class _FakeResponse:
+    def __init__(self, url: str, body: dict, status: int = 200, content_type: str = "application/json"):
+        self.url = url
+        self.status = status
+        self.headers = {"content-type": content_type}
+        self._body = json.dumps(body).encode("utf-8")
+
+    async def body(self) -> bytes:
+        return self._body
+
+
+class _FakePage:
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+
+async def test_response_capture_records_matching_json_only():
+    page = _FakePage()
+    capture = main.ResponseCapture(page, ["/_next/data/"])
+    on_response = page.handlers["response"]
+    on_response(_FakeResponse("https://www.propertyguru.com.sg/api/similar-listings", SIMILAR_LISTINGS))
+    on_response(_FakeResponse("https://www.propertyguru.com.sg/_next/data/b1/listing/x.json", {}, status=404))
+    on_response(_FakeResponse("https://www.propertyguru.com.sg/_next/data/b1/x.html", {}, content_type="text/html"))
+    on_response(_FakeResponse("https://www.propertyguru.com.sg/_next/data/b1/listing/x.json", _own_listing(24000001)))
+    own, unscoped = await capture.fields(SAIL_URL)
+    assert len(capture.blobs) == 1
+    assert own == {"price": "S$ 1,790,000", "lease_tenure": "99年地契"}
+    assert unscoped == {}
+
+
+async def test_evaluate_mode_keeps_dom_values_over_other_listings():
+    data = main._snapshot_page_data(_fixture(SAIL_URL))
+
+    class Page:
+        async def evaluate(self, script, args):
+            return data
+
+    captured = main._captured_listing_fields([SIMILAR_LISTINGS], SAIL_URL)
+    fields = await main._extract_with_evaluate(Page(), SAIL_URL, captured=captured)
+    assert fields["price"] == "S$ 1,850,000"
+    assert fields["listing_agent_phone"] == "+6591234567"
+    assert "other-listing" not in fields["main_image_url"]
@@ -0,0 +1,128 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+
+LISTING_URL = "https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001"
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = main.ScrapeMetrics()
+    monkeypatch.setattr(main, "scrape_metrics", metrics)
+    return metrics
+
+
+@pytest.fixture
+def deadline():
+    """在当前上下文中设置请求截止时间，测试结束时恢复"""
+    tokens = []
+
+    def set_deadline(seconds: float) -> main.Deadline:
+        d = main.Deadline(seconds)
+        tokens.append(main._current_deadline.set(d))
+        return d
+
+    yield set_deadline
+    for token in reversed(tokens):
+        main._current_deadline.reset(token)
+
+
+def test_budget_is_capped_by_remaining_time(deadline):
+    assert main._budget(10) == 10
+    assert main._budget_ms(8000) == 8000
+    deadline(1)
+    assert 0.9 < main._budget(10) <= 1
+    assert main._budget(0.2) == 0.2
+    assert 0.4 < main._budget(10, reserve=0.5) <= 0.5
+    assert main._budget(10, reserve=5) == 0
+
+
+def test_budget_ms_never_returns_zero(deadline):
+    # Playwright 中 timeout=0 表示不限时
+    deadline(0)
+    assert main._budget(10) == 0
+    assert main._budget_ms(8000) == 1
+
+
+def test_optional_phase_is_skipped_near_deadline(monkeypatch, metrics, deadline):
+    monkeypatch.setattr(main, "SCRAPE_OPTIONAL_PHASE_MIN", 3)
+    assert main._optional_phase("site_plan")
+    deadline(10)
+    assert main._optional_phase("site_plan")
+    deadline(1)
+    assert not main._optional_phase("site_plan")
+    assert metrics.skipped == {"site_plan": 1}
+
+
+async def test_endpoint_returns_504_and_cancels_scrape_at_deadline(monkeypatch, metrics):
+    monkeypatch.setattr(main, "SCRAPE_DEADLINE", 0.05)
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+    scheduler = main.ScrapeScheduler(1, 1, 10)
+    monkeypatch.setattr(main, "scrape_scheduler", scheduler)
+    cancelled = asyncio.Event()
+
+    async def scrape_listing(url, on_progress=None, browser_only=False):
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(main, "_scrape_listing", scrape_listing)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/scrape-property", json={"url": LISTING_URL})
+
+    assert resp.status_code == 504
+    assert "0.05" in resp.json()["detail"]
+    assert metrics.aborted == {"deadline": 1}
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert scheduler.in_flight == 0
+
+
+class _Request:
+    """is_disconnected 在第 disconnect_after 次调用时返回 True"""
+
+    def __init__(self, disconnect_after: int):
+        self.disconnect_after = disconnect_after
+        self.polls = 0
+
+    async def is_disconnected(self) -> bool:
+        self.polls += 1
+        return self.polls >= self.disconnect_after
+
+
+async def test_client_disconnect_cancels_scrape_with_499(monkeypatch, metrics):
+    monkeypatch.setattr(main, "_DISCONNECT_POLL_INTERVAL", 0.01)
+    cleaned_up = False
+
+    async def scrape():
+        nonlocal cleaned_up
+        try:
+            await asyncio.sleep(3600)
+        finally:
+            cleaned_up = True
+
+    with pytest.raises(HTTPException) as exc:
+        await asyncio.wait_for(main._until_disconnected(_Request(disconnect_after=3), scrape()), 1)
+    assert exc.value.status_code == 499
+    # 返回前已等到取消完成（浏览器 context 关闭、排队名额归还）
+    assert cleaned_up
+    assert metrics.aborted == {"disconnect": 1}
+
+
+async def test_connected_client_gets_result(monkeypatch, metrics):
+    monkeypatch.setattr(main, "_DISCONNECT_POLL_INTERVAL", 0.01)
+
+    async def scrape():
+        await asyncio.sleep(0.03)
+        return "result"
+
+    request = _Request(disconnect_after=10**6)
+    assert await main._until_disconnected(request, scrape()) == "result"
+    assert request.polls >= 2
+    assert metrics.aborted == {}
@@ -0,0 +1,248 @@
+import json
+import os
+
+import pytest
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures")
+with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as f:
+    MANIFEST = json.load(f)
+
+DOC = main.HtmlSnapshot(
+    """<html><head>
+    <meta property="og:title" content="The Sail @ Marina Bay">
+    <script>var price = "S$ 9";</script>
+    </head><body>
+    <div id="main" class="listing card">
+      <span class="price-tag">S$ 1,850,000</span>
+      <p data-automation-id="listing-detail-price">Ask <b>S$ 1,850,000</b></p>
+      <ul class="facts"><li>1,001 sqft</li><li>2 Beds</li></ul>
+    </div>
+    <div class="agent-box"><span>Jane Tan</span><a href="tel:+6591234567">Call</a></div>
+    <img alt="Floor Plan" src="https://cdn.example/FLPL.jpg" width="800" height="600">
+    <img alt="photo" src="https://cdn.example/photo.webp">
+    </body></html>"""
+)
+
+
+def _tags(nodes) -> list[str]:
+    return [n.tag for n in nodes]
+
+
+@pytest.mark.parametrize(
+    "selector, expected",
+    [
+        ("li", ["li", "li"]),
+        ("#main", ["div"]),
+        (".facts li", ["li", "li"]),
+        ("div.listing.card", ["div"]),
+        ('[data-automation-id="listing-detail-price"]', ["p"]),
+        ('[class*="price"]', ["span"]),
+        ('a[href^="tel:"]', ["a"]),
+        ('img[src$=".webp"]', ["img"]),
+        ('[class~="card"]', ["div"]),
+        ('[alt*="floor" i]', ["img"]),
+        ('[alt*="floor"]', []),
+        ("#main b", ["b"]),
+    ],
+)
+def test_selector_subset(selector, expected):
+    assert _tags(DOC.select_all(selector)) == expected
+
+
+def test_selector_lists_are_deduplicated_in_document_order():
+    nodes = DOC.select_all('img[src*="FLPL"], [alt*="floor" i], span.price-tag')
+    assert _tags(nodes) == ["span", "img"]
+    assert len(DOC.select_all("li, span", limit=2)) == 2
+
+
+def test_has_text_matches_on_text_content():
+    node = DOC.first_match('p:has-text("S$")')
+    assert node.tag == "p"
+    assert DOC.text_content(node) == "Ask S$ 1,850,000"
+    assert DOC.first_match('span:has-text("HDB")') is None
+
+
+def test_text_regex_skips_script_text():
+    assert DOC.first_match("text=/\\d+\\s*sqft/i").tag == "li"
+    # 脚本中的 "S$ 9" 不算页面文字
+    assert DOC.first_match("text=/S\\$ 9/") is None
+
+
+def test_closest_meta_and_attributes():
+    tel = DOC.first_match('a[href^="tel:"]')
+    box = DOC.closest(tel.parent, '[class*="agent"], [class*="contact"]')
+    assert "Jane Tan" in DOC.text_content(box)
+    assert DOC.closest(tel, "table") is None
+    assert DOC.meta_property("og:title") == "The Sail @ Marina Bay"
+    assert DOC.meta_property("og:image") == ""
+    img = DOC.first_match('[alt*="floor" i]')
+    assert main._attr_box(img) == {"width": 800.0, "height": 600.0}
+    assert main._attr_box(DOC.first_match('img[alt="photo"]')) is None
+
+
+@pytest.mark.parametrize("listing", MANIFEST["listings"], ids=lambda l: l["name"])
+def test_extract_listing_from_fixture(listing):
+    slug = listing["url"].rsplit("/", 1)[1]
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", f"{slug}.html"), encoding="utf-8") as f:
+        result = main.extract_listing_from_html(f.read(), listing["url"])
+    assert result.link == listing["url"]
+    assert result.title != "Property"
+    # site plan 需要在线查询 99.co，离线提取不包含
+    expect = {k: v for k, v in listing["expect"].items() if k != "site_plan_url"}
+    assert {k: getattr(result, k) for k in expect} == expect
+
+
+@pytest.mark.parametrize("case", MANIFEST["site_plans"], ids=lambda c: c["apartment_name"])
+async def test_find_site_plan_http_on_fixture(case, monkeypatch):
+    async def get_html(url):
+        slug = url.rstrip("/").rsplit("/", 1)[1]
+        path = os.path.join(FIXTURES_DIR, "99co", f"{slug}.html")
+        if not os.path.exists(path):
+            return None, 404
+        with open(path, encoding="utf-8") as f:
+            return f.read(), 200
+
+    monkeypatch.setattr(main.http_fetcher, "get_html", get_html)
+    slug = main._apartment_name_to_slug(main._extract_apartment_name(case["apartment_name"]))
+    site_plan_url, conclusive = await main._find_site_plan_http(slug)
+    assert site_plan_url == case["expect"]
+    if site_plan_url:
+        assert conclusive
+
+
+async def test_evaluate_mode_keeps_static_selector_precedence(monkeypatch):
+    stats = main.SelectorStats("", enabled=True, explore=0.0, decay=1.0, min_samples=1, skip_below=0.2)
+    first, second = main.PRICE_SELECTORS[0], main.PRICE_SELECTORS[1]
+    # 统计显示首选选择器持续未命中：locator 模式会把它排到后面甚至跳过
+    for _ in range(20):
+        stats.record("price", first, False)
+        stats.record("price", second, True)
+    monkeypatch.setattr(main, "selector_stats", stats)
+    assert stats.order("price", main.PRICE_SELECTORS)[0] != first
+
+    texts = {first: "S$ 1,850,000", second: "S$ 9"}
+
+    class FakePage:
+        async def evaluate(self, script, args):
+            assert args["price"] == main.PRICE_SELECTORS
+            return {
+                "prices": [{"selector": s, "text": texts.get(s)} for s in args["price"]],
+                "floor_plans": [{"selector": args["floorPlan"][0], "src": "https://cdn.example/FLPL.jpg"}],
+            }
+
+    fields = await main._extract_with_evaluate(FakePage(), "https://www.propertyguru.com.sg/listing/x-1")
+    assert fields["price"] == "S$ 1,850,000"
+    # 命中之后的候选也照常计入统计
+    counts = stats._stats[stats._key("price")]
+    assert counts[first] == [1.0, 20.0]
+    assert counts[second] == [21.0, 0.0]
+
+
+def test_snapshot_extraction_does_not_feed_selector_stats(monkeypatch):
+    stats = main.SelectorStats("", enabled=True, explore=0.0, decay=1.0, min_samples=1, skip_below=0.2)
+    metrics = main.ScrapeMetrics()
+    monkeypatch.setattr(main, "selector_stats", stats)
+    monkeypatch.setattr(main, "scrape_metrics", metrics)
+    listing = MANIFEST["listings"][0]
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", listing["url"].rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        html = f.read()
+    trace = main.ScrapeTrace()
+    token = main._current_trace.set(trace)
+    try:
+        main.extract_listing_from_html(html, listing["url"])
+    finally:
+        main._current_trace.reset(token)
+    assert stats._stats == {}
+    assert metrics.selectors == {}
+    # 字段来源仍照常记录
+    assert trace.sources["price"].startswith("selector:")
+
+
+async def test_process_pool_extraction_keeps_debug_sources(monkeypatch):
+    listing = MANIFEST["listings"][0]
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", listing["url"].rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        html = f.read()
+    monkeypatch.setattr(main, "SCRAPE_EXTRACTION_WORKERS", 1)
+    monkeypatch.setattr(main, "_extraction_executor", None)
+    trace = main.ScrapeTrace()
+    token = main._current_trace.set(trace)
+    try:
+        result = await main._extract_html_off_loop(html, listing["url"])
+    finally:
+        main._current_trace.reset(token)
+        if main._extraction_executor is not None:
+            main._extraction_executor.shutdown()
+    assert result.price == listing["expect"]["price"]
+    assert trace.sources["price"].startswith("selector:")
+    assert trace.sources["title"] == "og:title"
+
+
+class _EvaluatePage:
+    """记录 page.evaluate 调用；floorPlanOnly 时返回画廊打开后的户型图候选"""
+
+    def __init__(self, data: dict, floor_plan_after_click=None):
+        self.data = data
+        self.floor_plan_after_click = floor_plan_after_click
+        self.evaluate_args: list[dict] = []
+        self.clicked = False
+
+    async def evaluate(self, script, args):
+        assert script is main._PAGE_DATA_JS
+        self.evaluate_args.append(args)
+        if args["floorPlanOnly"]:
+            src = self.floor_plan_after_click if self.clicked else None
+            return {"floor_plans": [{"selector": args["floorPlan"][0], "src": src}]}
+        return self.data
+
+    def locator(self, selector):
+        page = self
+
+        class Locator:
+            first = None
+
+            async def count(self):
+                return 1
+
+            async def click(self, **kwargs):
+                page.clicked = True
+
+        loc = Locator()
+        loc.first = loc
+        return loc
+
+    async def wait_for_function(self, *args, **kwargs):
+        return True
+
+
+def _fixture_data(listing: dict) -> dict:
+    slug = listing["url"].rsplit("/", 1)[1]
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", f"{slug}.html"), encoding="utf-8") as f:
+        return main._snapshot_page_data(f.read())
+
+
+async def test_evaluate_extraction_is_one_round_trip():
+    listing = MANIFEST["listings"][0]
+    page = _EvaluatePage(_fixture_data(listing))
+    fields = await main._extract_with_evaluate(page, listing["url"])
+    assert len(page.evaluate_args) == 1
+    assert not page.clicked
+    for key in ("price", "size_sqft", "floor_plan_url", "listing_agent_phone"):
+        assert fields[key] == listing["expect"][key]
+
+
+async def test_evaluate_opens_gallery_only_for_missing_floor_plan():
+    listing = MANIFEST["listings"][0]
+    data = _fixture_data(listing)
+    data["floor_plans"] = [{"selector": c["selector"], "src": None} for c in data["floor_plans"]]
+    data["floor_images"] = []
+    page = _EvaluatePage(data, floor_plan_after_click="https://cdn.example/modal/floorplan.jpg")
+    progress = []
+    fields = await main._extract_with_evaluate(page, listing["url"], lambda group, f: progress.append(group))
+    # 第二次 evaluate 只重新收集户型图候选；点开画廊前已先推送其余字段
+    assert [args["floorPlanOnly"] for args in page.evaluate_args] == [False, True]
+    assert page.clicked
+    assert progress == ["core", "images", "agent"]
+    assert fields["floor_plan_url"] == "https://cdn.example/modal/floorplan.jpg"
+    assert fields["price"] == listing["expect"]["price"]
@@ -0,0 +1,135 @@
+import contextlib
+import os
+
+import pytest
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures")
+MISSING_FLOOR_PLAN_URL = "https://www.propertyguru.com.sg/listing/for-sale-parc-esta-24000004"
+SAIL_URL = "https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001"
+
+
+def _fixture(url: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", url.rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def site_plan_cache(monkeypatch):
+    cache = main.TTLCache(10, 60)
+    monkeypatch.setattr(main, "site_plan_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def browser_calls(monkeypatch):
+    """记录浏览器层调用：整页抓取与 site plan 查询"""
+    calls = []
+
+    async def scrape_browser(url, on_progress=None):
+        calls.append(("listing", url))
+        return main.ScrapeResponse(title="Parc Esta", link=url, floor_plan_url="https://cdn.example/fp.jpg", tier="browser")
+
+    @contextlib.asynccontextmanager
+    async def context():
+        yield object()
+
+    async def lookup_site_plan(context, title):
+        calls.append(("site_plan", title))
+        return "https://pic2.99.co/v3/rendered/site-plan.jpg"
+
+    monkeypatch.setattr(main, "_scrape_listing_browser", scrape_browser)
+    monkeypatch.setattr(main.browser_pool, "context", context)
+    monkeypatch.setattr(main, "_lookup_site_plan", lookup_site_plan)
+    return calls
+
+
+async def test_missing_floor_plan_falls_back_to_browser(monkeypatch, browser_calls):
+    async def get_html(url):
+        return _fixture(MISSING_FLOOR_PLAN_URL), 200
+
+    monkeypatch.setattr(main.http_fetcher, "get_html", get_html)
+    monkeypatch.setattr(main.http_fetcher, "enabled", True)
+    assert "floor_plan_url" in main.SCRAPE_HTTP_REQUIRED_FIELDS
+    result = await main._scrape_listing(MISSING_FLOOR_PLAN_URL)
+    assert result.tier == "browser"
+    assert browser_calls == [("listing", MISSING_FLOOR_PLAN_URL)]
+
+
+async def test_http_tier_serves_complete_listing(monkeypatch, browser_calls, site_plan_cache):
+    async def get_html(url):
+        return (_fixture(SAIL_URL), 200) if "propertyguru" in url else (None, 404)
+
+    monkeypatch.setattr(main.http_fetcher, "get_html", get_html)
+    result = await main._scrape_listing_http(SAIL_URL)
+    assert result is not None and result.tier == "http"
+    assert result.floor_plan_url and result.listing_agent_phone
+    # 99.co 页面不存在是确定的结果，不再打开浏览器
+    assert browser_calls == []
+    assert site_plan_cache.get("the-sail-marina-bay") == ""
+
+
+@pytest.mark.parametrize("conclusive", [True, False])
+async def test_inconclusive_http_site_plan_miss_tries_browser(monkeypatch, browser_calls, site_plan_cache, conclusive):
+    async def find_http(slug):
+        return None, conclusive
+
+    monkeypatch.setattr(main, "_find_site_plan_http", find_http)
+    site_plan_url = await main._lookup_site_plan_http("Parc Esta")
+    if conclusive:
+        assert site_plan_url is None
+        assert browser_calls == []
+        assert site_plan_cache.get("parc-esta") == ""
+    else:
+        assert site_plan_url == "https://pic2.99.co/v3/rendered/site-plan.jpg"
+        assert browser_calls == [("site_plan", "Parc Esta")]
+
+
+async def test_http_site_plan_error_tries_browser(monkeypatch, browser_calls, site_plan_cache):
+    async def find_http(slug):
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(main, "_find_site_plan_http", find_http)
+    assert await main._lookup_site_plan_http("Parc Esta") == "https://pic2.99.co/v3/rendered/site-plan.jpg"
+
+
+EMBEDDED_FLOOR_PLAN = "https://sg1-cdn.pgimgs.com/listing/24000004/FLPL.1.V800/floorplan.jpg"
+
+
+def _with_embedded_json(html: str) -> str:
+    """在页面中加入 JSON-LD 与 __NEXT_DATA__：价格与 DOM 不同，户型图为 DOM 中没有的字段"""
+    scripts = (
+        '<script type="application/ld+json">{"@type": "Residence", "offers": {"price": 999000}}</script>'
+        '<script type="application/ld+json">{not json</script>'
+        '<script id="__NEXT_DATA__" type="application/json">'
+        f'{{"props": {{"pageProps": {{"listing": {{"media": {{"floorPlans": ["{EMBEDDED_FLOOR_PLAN}"]}}}}}}}}}}'
+        "</script>"
+    )
+    return html.replace("</head>", scripts + "</head>", 1)
+
+
+def test_embedded_json_fills_missing_fields_without_overriding_dom():
+    trace = main.ScrapeTrace()
+    token = main._current_trace.set(trace)
+    try:
+        result = main.extract_listing_from_html(_with_embedded_json(_fixture(MISSING_FLOOR_PLAN_URL)), MISSING_FLOOR_PLAN_URL)
+    finally:
+        main._current_trace.reset(token)
+    assert result.price == "S$ 1,620,000"
+    assert result.floor_plan_url == EMBEDDED_FLOOR_PLAN
+    assert result.image_urls == [result.main_image_url, EMBEDDED_FLOOR_PLAN]
+    assert trace.sources["floor_plan_url"] == "json:embedded"
+    assert trace.sources["price"].startswith("selector:")
+
+
+async def test_embedded_floor_plan_keeps_listing_on_http_tier(monkeypatch, browser_calls, site_plan_cache):
+    async def get_html(url):
+        return (_with_embedded_json(_fixture(MISSING_FLOOR_PLAN_URL)), 200) if "propertyguru" in url else (None, 404)
+
+    monkeypatch.setattr(main.http_fetcher, "get_html", get_html)
+    monkeypatch.setattr(main.http_fetcher, "enabled", True)
+    result = await main._scrape_listing(MISSING_FLOOR_PLAN_URL)
+    assert result.tier == "http"
+    assert result.floor_plan_url == EMBEDDED_FLOOR_PLAN
+    assert browser_calls == []
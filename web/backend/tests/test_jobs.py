@@ -0,0 +1,104 @@
+import asyncio
+
+import main
+
+
+async def _wait_status(job, status: str) -> None:
+    for _ in range(200):
+        if job.status == status:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job stayed {job.status}, expected {status}")
+
+
+def _slow_listing(started: asyncio.Event):
+    async def get_listing(url, force_refresh=False, *args, **kwargs):
+        started.set()
+        if "slow" in url:
+            await asyncio.sleep(3600)
+        return main.ScrapeResponse(title="T", link=url), "MISS", 0.0
+
+    return get_listing
+
+
+async def test_stop_finishes_while_job_is_running(monkeypatch):
+    started = asyncio.Event()
+    monkeypatch.setattr(main, "_get_listing", _slow_listing(started))
+    manager = main.ScrapeJobManager(workers=1, max_queued=10, retention=60)
+    manager.start()
+    job = manager.submit("https://www.propertyguru.com.sg/listing/slow-1", False, 0)
+    await asyncio.wait_for(started.wait(), 1)
+
+    await asyncio.wait_for(manager.stop(), 2)
+    assert job.status == "cancelled"
+    assert manager._tasks == []
+
+
+async def test_cancelled_job_does_not_stop_worker(monkeypatch):
+    started = asyncio.Event()
+    monkeypatch.setattr(main, "_get_listing", _slow_listing(started))
+    manager = main.ScrapeJobManager(workers=1, max_queued=10, retention=60)
+    manager.start()
+    try:
+        slow = manager.submit("https://www.propertyguru.com.sg/listing/slow-1", False, 0)
+        await asyncio.wait_for(started.wait(), 1)
+        manager.cancel(slow.id)
+        await _wait_status(slow, "cancelled")
+
+        fast = manager.submit("https://www.propertyguru.com.sg/listing/fast-2", False, 0)
+        await asyncio.wait_for(fast.done.wait(), 1)
+        assert fast.status == "succeeded"
+    finally:
+        await asyncio.wait_for(manager.stop(), 2)
+
+
+async def test_higher_priority_runs_first(monkeypatch):
+    order = []
+
+    async def get_listing(url, force_refresh=False, *args, **kwargs):
+        order.append(url)
+        return main.ScrapeResponse(title="T", link=url), "MISS", 0.0
+
+    monkeypatch.setattr(main, "_get_listing", get_listing)
+    manager = main.ScrapeJobManager(workers=1, max_queued=10, retention=60)
+    low = manager.submit("https://www.propertyguru.com.sg/listing/low-1", False, 0)
+    high = manager.submit("https://www.propertyguru.com.sg/listing/high-2", False, 5)
+    manager.start()
+    try:
+        await asyncio.wait_for(asyncio.gather(low.done.wait(), high.done.wait()), 1)
+    finally:
+        await manager.stop()
+    assert order == [high.url, low.url]
+
+
+async def test_job_waits_for_slot_when_sync_queue_is_full(monkeypatch):
+    scheduler = main.ScrapeScheduler(max_concurrency=1, max_queue=0, max_wait=0.01)
+    monkeypatch.setattr(main, "scrape_scheduler", scheduler)
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+
+    async def scrape_listing(url, on_progress=None, browser_only=False):
+        return main.ScrapeResponse(title="T", link=url)
+
+    monkeypatch.setattr(main, "_scrape_listing", scrape_listing)
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with scheduler.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    manager = main.ScrapeJobManager(workers=1, max_queued=10, retention=60)
+    manager.start()
+    try:
+        job = manager.submit("https://www.propertyguru.com.sg/listing/queued-1", True, 0)
+        await _wait_status(job, "running")
+        await asyncio.sleep(0.05)
+        assert job.status == "running"
+        release.set()
+        await asyncio.wait_for(job.done.wait(), 1)
+        assert job.status == "succeeded"
+    finally:
+        release.set()
+        await holder
+        await asyncio.wait_for(manager.stop(), 2)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+import types
+
+import main
+
+
+class _ReadyPage:
+    """wait_for_function 在 ready_after 秒后满足（site plan 图片用 image_ready_after），为 None 时一直不满足、按 timeout 超时"""
+
+    def __init__(self, ready_after=None, image_ready_after=None):
+        self.ready_after = ready_after
+        self.image_ready_after = image_ready_after
+        self.waits: list[tuple[list[str], int]] = []
+
+    async def wait_for_function(self, expression, arg=None, timeout=None):
+        self.waits.append((arg, timeout))
+        ready_after = self.image_ready_after if any("pic2.99.co" in s for s in arg) else self.ready_after
+        if ready_after is None or ready_after * 1000 > timeout:
+            await asyncio.sleep(timeout / 1000)
+            raise TimeoutError(f"Timeout {timeout}ms exceeded")
+        await asyncio.sleep(ready_after)
+
+    # _find_site_plan 用到的其余 Page 方法
+    async def route(self, *args, **kwargs) -> None:
+        pass
+
+    async def goto(self, url, **kwargs):
+        return types.SimpleNamespace(status=200)
+
+    async def evaluate(self, *args, **kwargs):
+        return True
+
+    def locator(self, selector):
+        async def count():
+            return 0
+
+        return types.SimpleNamespace(count=count)
+
+
+async def test_wait_ready_returns_as_soon_as_selectors_appear():
+    page = _ReadyPage(ready_after=0.01)
+    started = time.monotonic()
+    assert await main._wait_ready(page, main.LISTING_READY_SELECTORS, 5000)
+    assert time.monotonic() - started < 1
+    assert page.waits == [(main.LISTING_READY_SELECTORS, 5000)]
+
+
+async def test_wait_ready_gives_up_at_budget_without_raising():
+    page = _ReadyPage()
+    started = time.monotonic()
+    assert not await main._wait_ready(page, ["#never"], 50)
+    assert 0.04 <= time.monotonic() - started < 1
+
+
+async def test_wait_ready_skips_exhausted_budget():
+    page = _ReadyPage(ready_after=0)
+    assert not await main._wait_ready(page, ["#main"], 0)
+    assert page.waits == []
+
+
+async def test_site_plan_waits_share_one_budget(monkeypatch):
+    monkeypatch.setattr(main, "READY_TIMEOUT_SITE_PLAN", 200)
+    page = _ReadyPage(ready_after=0.05)
+    started = time.monotonic()
+    assert await main._find_site_plan(page, "parc-esta", 1000) == (None, False)
+    # #site_plans 用去约 50ms，图片等待只拿到剩余部分，两次等待合计不超过 READY_TIMEOUT_SITE_PLAN
+    (_, first), (_, second) = page.waits
+    assert first == 200
+    assert second <= 160
+    assert time.monotonic() - started < 0.5
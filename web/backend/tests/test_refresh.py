@@ -0,0 +1,132 @@
+import json
+import os
+
+import httpx
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures")
+LISTING_URL = "https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001"
+PAGE = """<html><head>
+<script nonce="abc">window.build = 1;</script><style>.a{color:red}</style>
+<link rel="preload" href="/app.1.js">
+</head><body><!-- rendered 10:00 --><h1>The Sail</h1><span>S$ 1,850,000</span></body></html>"""
+
+
+def test_content_hash_ignores_volatile_markup():
+    volatile = (
+        PAGE.replace("window.build = 1", "window.build = 2")
+        .replace("color:red", "color:blue")
+        .replace("app.1.js", "app.2.js")
+        .replace("10:00", "10:05")
+        .replace("\n", "\n    ")
+    )
+    assert main._listing_content_hash(volatile) == main._listing_content_hash(PAGE)
+
+
+def test_content_hash_changes_with_listing_text():
+    assert main._listing_content_hash(PAGE.replace("1,850,000", "1,790,000")) != main._listing_content_hash(PAGE)
+
+
+def test_listing_changes_compares_only_previous_fields():
+    current = {"title": "The Sail", "price": "S$ 1,790,000", "bedrooms": "2 房", "site_plan_url": "x"}
+    changes = main._listing_changes({"price": "S$ 1,850,000", "site_plan_url": None}, current)
+    assert changes == {"price": {"old": "S$ 1,850,000", "new": "S$ 1,790,000"}}
+    assert main._listing_changes(None, current) == {}
+
+
+def test_listing_changes_skips_title_and_missing_fields():
+    previous = {
+        "title": "The Sail @ Marina Bay (agent edit)",
+        "floor_plan_url": "https://x/fp.jpg",
+        "listing_agent_name": "Jane Tan",
+        "price": "S$ 1,850,000",
+    }
+    current = {"title": "The Sail @ Marina Bay", "floor_plan_url": None, "listing_agent_name": None, "price": "S$ 1,850,000"}
+    assert main._listing_changes(previous, current) == {}
+
+
+def test_listing_changes_treats_empty_and_null_alike():
+    previous = {"floor_plan_url": "", "listing_agent_name": None, "image_urls": []}
+    current = {"floor_plan_url": None, "listing_agent_name": "", "image_urls": None}
+    assert main._listing_changes(previous, current) == {}
+    assert main._listing_changes({"listing_agent_name": ""}, {"listing_agent_name": "Jane Tan"}) == {
+        "listing_agent_name": {"old": None, "new": "Jane Tan"}
+    }
+
+
+async def test_refresh_endpoint_reports_field_changes(monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", LISTING_URL.rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        html = f.read()
+
+    async def get_conditional(url, etag=None, last_modified=None):
+        if etag == "v2":
+            return None, 304, {"etag": "v2", "last_modified": None}
+        return html, 200, {"etag": "v2", "last_modified": None}
+
+    monkeypatch.setattr(main.http_fetcher, "get_conditional", get_conditional)
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+    previous = {
+        "title": "Agent-edited title",
+        "price": "S$ 1,900,000",
+        "lease_tenure": "99年地契",
+        "site_plan_url": "https://pic2.99.co/x.jpg",
+    }
+    items = [
+        {"link": LISTING_URL, "etag": "v1", "previous": previous},
+        {"link": LISTING_URL, "etag": "v2"},
+        {"link": LISTING_URL, "content_hash": main._listing_content_hash(html)},
+    ]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/refresh-listings", json={"items": items})
+    lines = {line["index"]: line for line in map(json.loads, resp.text.splitlines())}
+
+    assert lines[0]["status"] == "changed" and lines[0]["check"] == "html"
+    assert lines[0]["changes"] == {"price": {"old": "S$ 1,900,000", "new": "S$ 1,850,000"}}
+    assert lines[0]["etag"] == "v2"
+    assert (lines[1]["status"], lines[1]["check"]) == ("unchanged", "not_modified")
+    assert (lines[2]["status"], lines[2]["check"]) == ("unchanged", "hash")
+
+
+async def test_refresh_without_field_changes_is_unchanged(monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, "propertyguru", LISTING_URL.rsplit("/", 1)[1] + ".html"), encoding="utf-8") as f:
+        html = f.read()
+
+    async def get_conditional(url, etag=None, last_modified=None):
+        return html, 200, {"etag": None, "last_modified": None}
+
+    monkeypatch.setattr(main.http_fetcher, "get_conditional", get_conditional)
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+    item = main.RefreshItem(
+        link=LISTING_URL,
+        content_hash="stale",
+        previous={"title": "Agent-edited title", "price": "S$ 1,850,000", "site_plan_url": "https://pic2.99.co/x.jpg"},
+    )
+    line = await main._refresh_listing(item)
+    assert (line["status"], line["check"]) == ("unchanged", "html")
+    assert "changes" not in line
+
+
+async def test_refresh_falls_back_to_browser_without_refetching(monkeypatch):
+    calls = []
+
+    async def get_conditional(url, etag=None, last_modified=None):
+        return "<html><body><h1>Blocked?</h1></body></html>", 200, {"etag": "v2", "last_modified": None}
+
+    async def get_html(url):
+        calls.append("http")
+        return None, 503
+
+    async def scrape_browser(url, on_progress=None):
+        calls.append("browser")
+        return main.ScrapeResponse(title="The Sail", link=url, price="S$ 1,790,000", tier="browser")
+
+    monkeypatch.setattr(main.http_fetcher, "get_conditional", get_conditional)
+    monkeypatch.setattr(main.http_fetcher, "get_html", get_html)
+    monkeypatch.setattr(main, "_scrape_listing_browser", scrape_browser)
+    monkeypatch.setattr(main, "scrape_cache", main.TTLCache(10, 60))
+    line = await main._refresh_listing(main.RefreshItem(link=LISTING_URL, previous={"price": "S$ 1,850,000"}))
+    assert calls == ["browser"]
+    assert (line["status"], line["check"]) == ("changed", "full")
+    assert line["changes"] == {"price": {"old": "S$ 1,850,000", "new": "S$ 1,790,000"}}
@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+import main
+
+
+def _policy(enabled: bool = True) -> main.ResourcePolicy:
+    return main.ResourcePolicy(enabled, {"image", "media", "font"}, main.TRACKER_HOSTS, main.RESOURCE_ALLOW_LISTS)
+
+
+@pytest.mark.parametrize(
+    "site, url, resource_type, blocked",
+    [
+        # 提取只需要 src 属性，但白名单中的图库图片照常加载（懒加载的 src 依赖它）
+        ("propertyguru", "https://sg1-cdn.pgimgs.com/listing/1/PHO.1.jpg", "image", False),
+        ("propertyguru", "https://cdn.example/banner.jpg", "image", True),
+        ("propertyguru", "https://www.propertyguru.com.sg/fonts/a.woff2", "font", True),
+        ("propertyguru", "https://cdn.example/tour.mp4", "media", True),
+        ("propertyguru", "https://www.propertyguru.com.sg/_next/static/app.js", "script", False),
+        ("propertyguru", "https://www.propertyguru.com.sg/_next/data/b1/listing/x.json", "fetch", False),
+        # 跟踪域名按主域匹配，子域同样屏蔽，但不误伤名字相近的域名
+        ("propertyguru", "https://www.google-analytics.com/g/collect", "xhr", True),
+        ("propertyguru", "https://connect.facebook.net/en_US/fbevents.js", "script", True),
+        ("propertyguru", "https://notfacebook.net/app.js", "script", False),
+        # 白名单按站点区分
+        ("99co", "https://pic2.99.co/v3/x/site-plan.jpg", "image", False),
+        ("99co", "https://sg1-cdn.pgimgs.com/listing/1/PHO.1.jpg", "image", True),
+    ],
+)
+def test_should_block(site, url, resource_type, blocked):
+    assert _policy().should_block(site, url, resource_type) is blocked
+
+
+class _Route:
+    def __init__(self, url: str, resource_type: str):
+        self.request = types.SimpleNamespace(url=url, resource_type=resource_type)
+        self.outcome = None
+
+    async def abort(self) -> None:
+        self.outcome = "abort"
+
+    async def continue_(self) -> None:
+        self.outcome = "continue"
+
+
+class _Page:
+    def __init__(self):
+        self.handler = None
+
+    async def route(self, pattern, handler) -> None:
+        self.handler = handler
+
+
+async def test_apply_aborts_blocked_requests_and_counts(monkeypatch):
+    monkeypatch.setattr(main, "SCRAPE_UPSTREAM_OVERRIDES", {})
+    policy = _policy()
+    page = _Page()
+    await policy.apply(page, "propertyguru")
+    routes = [
+        _Route("https://sg1-cdn.pgimgs.com/listing/1/PHO.1.jpg", "image"),
+        _Route("https://cdn.example/banner.jpg", "image"),
+        _Route("https://www.googletagmanager.com/gtm.js", "script"),
+        _Route("https://www.propertyguru.com.sg/listing/x", "document"),
+    ]
+    for route in routes:
+        await page.handler(route)
+    assert [r.outcome for r in routes] == ["continue", "abort", "abort", "continue"]
+    assert policy.stats() == {"enabled": True, "blocked": 2, "allowed": 2}
+
+
+async def test_disabled_policy_installs_no_route(monkeypatch):
+    monkeypatch.setattr(main, "SCRAPE_UPSTREAM_OVERRIDES", {})
+    page = _Page()
+    await _policy(enabled=False).apply(page, "propertyguru")
+    assert page.handler is None
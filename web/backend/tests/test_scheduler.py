@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+async def _hold(scheduler: main.ScrapeScheduler, release: asyncio.Event) -> None:
+    async with scheduler.slot():
+        await release.wait()
+
+
+async def test_slot_without_contention_does_not_wait():
+    scheduler = main.ScrapeScheduler(max_concurrency=2, max_queue=0, max_wait=1)
+    async with scheduler.slot() as waited:
+        assert waited < 0.05
+        assert scheduler.stats()["in_flight"] == 1
+    assert scheduler.stats()["in_flight"] == 0
+
+
+async def test_full_queue_rejects_with_429_and_retry_after():
+    scheduler = main.ScrapeScheduler(max_concurrency=1, max_queue=1, max_wait=5)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, release))
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(_hold(scheduler, release))
+    await asyncio.sleep(0)
+    assert scheduler.stats()["queue_depth"] == 1
+
+    with pytest.raises(HTTPException) as exc:
+        async with scheduler.slot():
+            pass
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    assert scheduler.rejected == 1
+
+    release.set()
+    await asyncio.gather(holder, queued)
+    assert scheduler.stats()["in_flight"] == 0
+
+
+async def test_queue_timeout_returns_503_and_frees_queue_slot():
+    scheduler = main.ScrapeScheduler(max_concurrency=1, max_queue=4, max_wait=0.05)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        async with scheduler.slot():
+            pass
+    assert exc.value.status_code == 503
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    assert scheduler.timed_out == 1
+    assert scheduler.stats()["queue_depth"] == 0
+
+    release.set()
+    await holder
+
+
+async def test_retry_after_scales_with_recent_durations():
+    scheduler = main.ScrapeScheduler(max_concurrency=2, max_queue=10, max_wait=1)
+    scheduler._recent_durations.extend([4.0, 6.0])
+    scheduler.waiting = 3
+    # (3 + 1) / 2 轮 × 平均 5 秒
+    assert scheduler._retry_after() == 10
+
+
+async def test_endpoint_returns_429_with_retry_after(monkeypatch):
+    scheduler = main.ScrapeScheduler(max_concurrency=1, max_queue=0, max_wait=1)
+    monkeypatch.setattr(main, "scrape_scheduler", scheduler)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, release))
+    await asyncio.sleep(0)
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post(
+                "/api/scrape-property",
+                json={"url": "https://www.propertyguru.com.sg/listing/for-sale-test-1", "force_refresh": True},
+            )
+    finally:
+        release.set()
+        await holder
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+
+
+async def test_background_slot_waits_past_full_queue_and_timeout():
+    scheduler = main.ScrapeScheduler(max_concurrency=1, max_queue=0, max_wait=0.01)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, release))
+    await asyncio.sleep(0)
+
+    async def background() -> float:
+        async with scheduler.slot(background=True) as waited:
+            return waited
+
+    job = asyncio.create_task(background())
+    await asyncio.sleep(0.05)
+    assert not job.done()
+    assert scheduler.stats()["background_waiting"] == 1
+    # 后台任务不占同步请求的排队名额：同步请求照常按队列上限拒绝
+    with pytest.raises(HTTPException) as exc:
+        async with scheduler.slot():
+            pass
+    assert exc.value.status_code == 429
+
+    release.set()
+    assert await asyncio.wait_for(job, 1) >= 0.05
+    await holder
+    assert scheduler.stats()["background_waiting"] == 0
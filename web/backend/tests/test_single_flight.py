@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+class _Call:
+    """可控的被合并调用：记录调用次数，等待 release 后返回，被取消时记录"""
+
+    def __init__(self, result="ok"):
+        self.result = result
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+async def test_concurrent_calls_share_one_execution():
+    flights = main.SingleFlight()
+    call = _Call()
+    leader = asyncio.create_task(flights.do("k", call))
+    follower = asyncio.create_task(flights.do("k", call))
+    await asyncio.sleep(0)
+    call.release.set()
+    assert await leader == ("ok", False)
+    assert await follower == ("ok", True)
+    assert call.calls == 1
+    assert flights.stats() == {"in_flight": 0, "coalesced": 1, "abandoned": 0}
+
+
+async def test_leader_leaving_does_not_cancel_for_remaining_waiters():
+    flights = main.SingleFlight()
+    call = _Call()
+    leader = asyncio.create_task(flights.do("k", call))
+    follower = asyncio.create_task(flights.do("k", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    call.release.set()
+    assert await follower == ("ok", True)
+    assert not call.cancelled
+    assert flights.abandoned == 0
+
+
+async def test_call_is_cancelled_when_all_waiters_leave():
+    flights = main.SingleFlight()
+    call = _Call()
+    waiters = [asyncio.create_task(flights.do("k", call)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert call.cancelled
+    assert flights.stats()["in_flight"] == 0
+    assert flights.abandoned == 1
+
+    # 之后的调用重新执行
+    again = _Call("fresh")
+    again.release.set()
+    assert await flights.do("k", again) == ("fresh", False)
+
+
+async def test_errors_reach_every_waiter():
+    flights = main.SingleFlight()
+    call = _Call(RuntimeError("boom"))
+    waiters = [asyncio.create_task(flights.do("k", call)) for _ in range(2)]
+    await asyncio.sleep(0)
+    call.release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert call.calls == 1
+    assert flights.stats()["in_flight"] == 0
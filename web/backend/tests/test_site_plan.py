@@ -0,0 +1,132 @@
+import asyncio
+import time
+import types
+
+import httpx
+import pytest
+
+import main
+from conftest import listing_fields
+
+
+class _FakePage:
+    """只实现 _find_site_plan 用到的 Page 方法：goto 返回给定状态码，#site_plans 等待超时"""
+
+    def __init__(self, status: int, rendered: bool = True):
+        self.status = status
+        self.rendered = rendered
+
+    async def route(self, *args, **kwargs) -> None:
+        pass
+
+    async def goto(self, url, **kwargs):
+        return types.SimpleNamespace(status=self.status)
+
+    async def wait_for_function(self, *args, **kwargs):
+        raise TimeoutError("timeout")
+
+    async def evaluate(self, *args, **kwargs):
+        return self.rendered
+
+
+@pytest.mark.parametrize(
+    "status, rendered, conclusive",
+    [
+        (404, True, True),
+        (410, True, True),
+        (403, True, False),
+        (429, True, False),
+        (503, True, False),
+        (200, True, True),  # 页面已渲染但没有 #site_plans
+        (200, False, False),  # 渲染超时 / 挑战页
+    ],
+)
+async def test_find_site_plan_only_conclusive_on_real_misses(status, rendered, conclusive):
+    assert await main._find_site_plan(_FakePage(status, rendered), "x", 1000) == (None, conclusive)
+
+
+@pytest.mark.parametrize("conclusive, status_code", [(True, 404), (False, 503)])
+async def test_site_plan_endpoint_caches_only_conclusive_misses(monkeypatch, conclusive, status_code):
+    cache = main.TTLCache(10, 60)
+    monkeypatch.setattr(main, "site_plan_cache", cache)
+
+    async def fetch(slug):
+        return None, conclusive
+
+    monkeypatch.setattr(main, "_fetch_site_plan", fetch)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/scrape-site-plan", json={"apartment_name": "Parc Esta"})
+    assert resp.status_code == status_code
+    assert (cache.get("parc-esta") == "") is conclusive
+
+
+async def test_http_site_plan_lookup_does_not_feed_selector_stats(monkeypatch):
+    stats = main.SelectorStats("", enabled=True, explore=0.0, decay=1.0, min_samples=1, skip_below=0.2)
+    monkeypatch.setattr(main, "selector_stats", stats)
+
+    async def get_html(url):
+        return '<div id="site_plans"><img src="https://pic2.99.co/v3/x/site-plan.jpg"></div>', 200
+
+    monkeypatch.setattr(main.http_fetcher, "get_html", get_html)
+    assert await main._find_site_plan_http("x") == ("https://pic2.99.co/v3/x/site-plan.jpg", True)
+    assert stats._stats == {}
+
+
+async def test_site_plan_lookup_runs_alongside_extraction(monkeypatch, fake_browser):
+    events = []
+
+    async def lookup_site_plan(context, title):
+        events.append(("site_plan_start", title))
+        await asyncio.sleep(0.2)
+        events.append(("site_plan_done", title))
+        return "https://pic2.99.co/v3/the-sail-marina-bay/site-plan.jpg"
+
+    async def extract(page, url, on_progress=None, captured=None):
+        events.append(("extract_start", None))
+        await asyncio.sleep(0.2)
+        events.append(("extract_done", None))
+        return listing_fields(title="The Sail @ Marina Bay", price="S$ 1,850,000")
+
+    monkeypatch.setattr(main, "_lookup_site_plan", lookup_site_plan)
+    monkeypatch.setattr(main, "_extract_with_evaluate", extract)
+    started = time.monotonic()
+    result = await main._scrape_listing_browser("https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001")
+    elapsed = time.monotonic() - started
+    # site plan 用 og:title 在提取完成前就已启动，两者重叠而不是相加
+    assert events.index(("site_plan_start", "The Sail @ Marina Bay")) < events.index(("extract_done", None))
+    assert events.index(("extract_start", None)) < events.index(("site_plan_done", "The Sail @ Marina Bay"))
+    assert elapsed < 0.35
+    assert result.site_plan_url == "https://pic2.99.co/v3/the-sail-marina-bay/site-plan.jpg"
+
+
+async def test_site_plan_lookup_is_bounded_by_its_budget(monkeypatch, fake_browser):
+    async def find_site_plan(page, slug, goto_timeout):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(main, "_find_site_plan", find_site_plan)
+    monkeypatch.setattr(main, "SCRAPE_SITE_PLAN_BUDGET", 0.1)
+    async with fake_browser.context() as context:
+        started = time.monotonic()
+        assert await main._lookup_site_plan(context, "The Sail @ Marina Bay") is None
+        assert time.monotonic() - started < 1
+        # 超时不做负缓存，查询页面已关闭
+        assert main.site_plan_cache.get("the-sail-marina-bay") is None
+        assert context.pages[0].closed
+
+
+async def test_site_plan_lookup_falls_back_to_extracted_title(monkeypatch, fake_browser):
+    fake_browser.title = ""
+    titles = []
+
+    async def lookup_site_plan(context, title):
+        titles.append(title)
+        return None
+
+    async def extract(page, url, on_progress=None, captured=None):
+        return listing_fields(title="Leedon Residence")
+
+    monkeypatch.setattr(main, "_lookup_site_plan", lookup_site_plan)
+    monkeypatch.setattr(main, "_extract_with_evaluate", extract)
+    await main._scrape_listing_browser("https://www.propertyguru.com.sg/listing/for-sale-leedon-residence-24000002")
+    assert titles == ["Leedon Residence"]
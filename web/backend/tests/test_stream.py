@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import HTTPException
+
+import main
+
+LISTING_URL = "https://www.propertyguru.com.sg/listing/for-sale-the-sail-marina-bay-24000001"
+
+
+async def _stream(**params) -> list[tuple[str, dict]]:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.get("/api/scrape-property/stream", params={"url": LISTING_URL, **params})
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in resp.text.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def _result(**values) -> main.ScrapeResponse:
+    return main.ScrapeResponse(title="The Sail", link=LISTING_URL, price="S$ 1,850,000", **values)
+
+
+async def test_stream_emits_groups_as_they_resolve_then_complete(monkeypatch):
+    async def get_listing(url, force_refresh=False, on_progress=None, *args, **kwargs):
+        on_progress("core", {"title": "The Sail", "price": "S$ 1,850,000"})
+        await asyncio.sleep(0.01)
+        on_progress("agent", {"listing_agent_name": "Jane Tan", "listing_agent_phone": "+6591234567"})
+        await asyncio.sleep(0.01)
+        on_progress("images", {"main_image_url": "https://x/1.jpg", "image_urls": ["https://x/1.jpg"]})
+        return _result(listing_agent_name="Jane Tan", main_image_url="https://x/1.jpg"), "MISS", 0.0
+
+    monkeypatch.setattr(main, "_get_listing", get_listing)
+    events = await _stream()
+
+    # 已推送的分组按实际完成顺序输出，未推送的分组在 complete 前按 FIELD_GROUPS 顺序补齐
+    assert [name for name, _ in events] == ["core", "agent", "images", "floor_plan", "site_plan", "complete"]
+    assert events[1][1] == {"listing_agent_name": "Jane Tan", "listing_agent_phone": "+6591234567"}
+    assert events[3][1] == {"floor_plan_url": None, "image_urls": None}
+    complete = events[-1][1]
+    assert complete["cache"] == "MISS"
+    assert complete["result"]["price"] == "S$ 1,850,000"
+    assert "debug" not in complete
+
+
+async def test_stream_cache_hit_emits_every_group(monkeypatch):
+    async def get_listing(url, force_refresh=False, on_progress=None, *args, **kwargs):
+        return _result(lease_tenure="99年地契"), "HIT", 0.0
+
+    monkeypatch.setattr(main, "_get_listing", get_listing)
+    events = await _stream(debug="true")
+
+    assert [name for name, _ in events] == [*main.FIELD_GROUPS, "complete"]
+    assert events[0][1]["lease_tenure"] == "99年地契"
+    assert events[-1][1]["cache"] == "HIT"
+    assert events[-1][1]["debug"]["cache"] == "HIT"
+
+
+async def test_stream_reports_errors_as_final_event(monkeypatch):
+    async def get_listing(url, force_refresh=False, on_progress=None, *args, **kwargs):
+        on_progress("core", {"title": "The Sail"})
+        raise HTTPException(status_code=504, detail="抓取超时")
+
+    monkeypatch.setattr(main, "_get_listing", get_listing)
+    events = await _stream()
+
+    assert events == [("core", {"title": "The Sail"}), ("error", {"status": 504, "detail": "抓取超时"})]
@@ -19,13 +19,25 @@ export type ScrapeResult = {
   listing_type?: 'sale' | 'rent'  // 出售 vs 出租（爬虫识别）
   lease_tenure?: string  // 地契：99年地契、999年地契、永久地契（买卖时展示）
   site_plan_url?: string  // 公寓小区平面图，从 99.co 抓取
+  tier?: 'http' | 'browser'  // 抓取方式：HTTP 直取 / 浏览器
+  debug?: {  // 请求 debug 时返回：阶段耗时与字段来源
+    cache: 'HIT' | 'MISS' | 'COALESCED'
+    tier?: 'http' | 'browser'
+    total_ms: number
+    queue_wait_ms: number
+    phases: { name: string; ms: number }[]
+    sources: Record<string, string>
+  }
 }
 
-export async function scrapeProperty(url: string): Promise<ScrapeResult> {
+export async function scrapeProperty(
+  url: string,
+  options: { forceRefresh?: boolean; debug?: boolean } = {}
+): Promise<ScrapeResult> {
   const res = await fetch(`${SCRAPE_API_URL}/api/scrape-property`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ url: url.trim() }),
+    body: JSON.stringify({ url: url.trim(), force_refresh: options.forceRefresh ?? false, debug: options.debug ?? false }),
   })
   if (!res.ok) {
     const err = await res.json().catch(() => ({ detail: res.statusText }))
@@ -34,3 +46,73 @@ export async function scrapeProperty(url: string): Promise<ScrapeResult> {
   return res.json()
 }
 
+export type ScrapeFieldGroup = 'core' | 'images' | 'floor_plan' | 'agent' | 'site_plan'
+
+/**
+ * 渐进式抓取（SSE）：各组字段确定后立即回调 onPartial，最终 resolve 完整结果。
+ * 同一组可能推送多次，以最后一次为准。
+ */
+export function scrapePropertyStream(
+  url: string,
+  onPartial: (group: ScrapeFieldGroup, fields: Partial<ScrapeResult>) => void,
+  options: { forceRefresh?: boolean } = {}
+): Promise<ScrapeResult> {
+  const params = new URLSearchParams({ url: url.trim(), force_refresh: String(options.forceRefresh ?? false) })
+  const source = new EventSource(`${SCRAPE_API_URL}/api/scrape-property/stream?${params}`)
+  const groups: ScrapeFieldGroup[] = ['core', 'images', 'floor_plan', 'agent', 'site_plan']
+  return new Promise((resolve, reject) => {
+    for (const group of groups) {
+      source.addEventListener(group, (e) => onPartial(group, JSON.parse((e as MessageEvent).data)))
+    }
+    source.addEventListener('complete', (e) => {
+      source.close()
+      resolve(JSON.parse((e as MessageEvent).data).result)
+    })
+    source.addEventListener('error', (e) => {
+      source.close()
+      // 服务端推送的 error 事件带 detail；连接失败（如 400）则没有 data
+      const data = (e as MessageEvent).data
+      reject(new Error((data && JSON.parse(data).detail) || '抓取失败'))
+    })
+  })
+}
+
+export type BatchScrapeItem =
+  | { index: number; url: string; ok: true; cache: 'HIT' | 'MISS' | 'COALESCED'; result: ScrapeResult }
+  | { index: number; url: string; ok: false; status: number; error: string }
+
+/**
+ * 批量抓取：后端按并发上限抓取，每完成一个房源推送一行 NDJSON。
+ * onItem 按完成顺序回调（index 对应 urls 中的位置），单个失败不影响其他。
+ */
+export async function scrapeProperties(
+  urls: string[],
+  onItem: (item: BatchScrapeItem) => void,
+  options: { forceRefresh?: boolean } = {}
+): Promise<void> {
+  const res = await fetch(`${SCRAPE_API_URL}/api/scrape-properties`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ urls: urls.map((u) => u.trim()), force_refresh: options.forceRefresh ?? false }),
+  })
+  if (!res.ok || !res.body) {
+    const err = await res.json().catch(() => ({ detail: res.statusText }))
+    throw new Error(err.detail || '批量抓取失败')
+  }
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (value) buffer += decoder.decode(value, { stream: !done })
+    let newline = buffer.indexOf('\n')
+    while (newline >= 0) {
+      const line = buffer.slice(0, newline).trim()
+      buffer = buffer.slice(newline + 1)
+      if (line) onItem(JSON.parse(line))
+      newline = buffer.indexOf('\n')
+    }
+    if (done) break
+  }
+  if (buffer.trim()) onItem(JSON.parse(buffer))
+}
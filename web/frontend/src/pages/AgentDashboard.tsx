@@ -6,7 +6,7 @@ import { useAppointments } from '@/hooks/useAppointments'
 import { usePendingAppointments } from '@/hooks/usePendingAppointments'
 import { useRealtimeAppointments } from '@/hooks/useRealtimeAppointments'
 import { checkAppointmentConflict } from '@/lib/conflictCheck'
-import { scrapeProperty } from '@/lib/scrapeApi'
+import { scrapeProperty, scrapePropertyStream, type ScrapeResult } from '@/lib/scrapeApi'
 import { getWhatsAppChatUrl } from '@/lib/whatsapp'
 import { AgentFeedbackSection } from '@/pages/AgentFeedback'
 import type { CustomerGroup, PartyRole, Property, Appointment, PendingAppointment, PendingAppointmentStatus } from '@/types'
@@ -765,6 +765,7 @@ function AppointmentsSection({
   const [scrapeLoading, setScrapeLoading] = useState(false)
   const [scrapeError, setScrapeError] = useState<string | null>(null)
   const [scrapeSuccess, setScrapeSuccess] = useState(false)
+  const [scrapePreview, setScrapePreview] = useState<Partial<ScrapeResult>>({})
   const [editingAppointment, setEditingAppointment] = useState<Appointment | null>(null)
   const [editStartTime, setEditStartTime] = useState('')
   const [editNotes, setEditNotes] = useState('')
@@ -822,8 +823,11 @@ function AppointmentsSection({
       return
     }
     setScrapeLoading(true)
+    setScrapePreview({})
     try {
-      const scraped = await scrapeProperty(sourceUrl)
+      const scraped = await scrapePropertyStream(sourceUrl, (_group, fields) =>
+        setScrapePreview((prev) => ({ ...prev, ...fields }))
+      )
       const existing = await properties.findBySourceUrl(sourceUrl)
       if (existing) {
         await properties.update.mutateAsync({
@@ -1167,6 +1171,11 @@ function AppointmentsSection({
                     )}
                     抓取并添加
                   </button>
+                  {scrapeLoading && scrapePreview.title && (
+                    <span className="text-xs text-stone-500 truncate">
+                      {scrapePreview.title}{scrapePreview.price ? ` - ${scrapePreview.price}` : ''}
+                    </span>
+                  )}
                   {scrapeSuccess && !scrapeLoading && (
                     <span className="text-green-600" title="添加成功">
                       <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor" className="w-5 h-5">
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+增量刷新已保存的房源：把 properties 中的 link 分批发给抓取服务的 /api/refresh-listings，
+带上次的 ETag / Last-Modified / 内容哈希，未变化的房源只花一次条件请求；有变化的更新房源字段，
+并把逐字段变化（如价格调整）写入 property_changes、逐行输出 JSON 到标准输出。
+标题不刷新（中介可能在后台修改过）。
+适合每晚由 cron / Render Cron Job 执行（需先执行 021 迁移：python3 run-021.py）。
+
+用法:
+  python3 refresh-listings.py                        # 刷新全部在架房源
+  python3 refresh-listings.py --dry-run --limit 20   # 只输出变化，不写数据库
+  SCRAPE_API_URL=https://xxx.onrender.com python3 refresh-listings.py
+
+数据库连接同 run-*.py（SUPABASE_PROJECT_REF、SUPABASE_DB_PASSWORD，可放在 .env）。
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+# 与抓取接口 ScrapeResponse 同名的房源字段（标题不刷新：中介会在后台改写）
+FIELDS = [
+    'price', 'size_sqft', 'bedrooms', 'bathrooms', 'main_image_url', 'image_urls',
+    'floor_plan_url', 'basic_info', 'listing_agent_name', 'listing_agent_phone', 'listing_type',
+    'lease_tenure', 'site_plan_url',
+]
+
+
+def load_env():
+    script_dir = Path(__file__).resolve().parent
+    try:
+        from dotenv import load_dotenv
+        for p in [script_dir.parent / '.env', script_dir / '.env']:
+            if p.exists():
+                load_dotenv(p)
+                break
+    except ImportError:
+        pass
+
+load_env()
+
+
+def connect():
+    password = os.environ.get('SUPABASE_DB_PASSWORD')
+    if not password:
+        print('请设置 SUPABASE_DB_PASSWORD（在 .env 或环境变量）', file=sys.stderr)
+        sys.exit(1)
+    project_ref = os.environ.get('SUPABASE_PROJECT_REF')
+    if not project_ref:
+        print('请设置 SUPABASE_PROJECT_REF', file=sys.stderr)
+        sys.exit(1)
+    from urllib.parse import quote
+    conn_str = f'postgresql://postgres:{quote(password, safe="")}@db.{project_ref}.supabase.co:5432/postgres'
+    try:
+        import psycopg2
+    except ImportError:
+        print('请先安装: pip install psycopg2-binary', file=sys.stderr)
+        sys.exit(1)
+    return psycopg2.connect(conn_str)
+
+
+def post_refresh(api_url, items, timeout):
+    """调用 /api/refresh-listings，逐行返回 NDJSON 结果（完成顺序）"""
+    req = urllib.request.Request(
+        f'{api_url.rstrip("/")}/api/refresh-listings',
+        data=json.dumps({'items': items}, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        for raw in resp:
+            if raw.strip():
+                yield json.loads(raw)
+
+
+def apply_line(cur, row, line):
+    """把一条刷新结果写回数据库，返回要输出的变化列表"""
+    from psycopg2.extras import Json
+
+    diffs = []
+    if line['status'] == 'gone':
+        cur.execute(
+            "update public.properties set listing_status = 'removed', refreshed_at = now() where id = %s",
+            (row['id'],),
+        )
+        diffs.append({'field': 'listing_status', 'old': 'active', 'new': 'removed'})
+    else:
+        updates = {
+            'refresh_etag': line.get('etag'),
+            'refresh_last_modified': line.get('last_modified'),
+            'content_hash': line.get('content_hash'),
+        }
+        # 服务端只返回取到新值的字段：本次没取到的字段保留已保存的值（与前端添加房源时一致）
+        for field, change in (line.get('changes') or {}).items():
+            diffs.append({'field': field, 'old': change['old'], 'new': change['new']})
+            updates[field] = Json(change['new']) if field == 'image_urls' else change['new']
+        assignments = ', '.join(f'{col} = %s' for col in updates)
+        cur.execute(
+            f'update public.properties set {assignments}, refreshed_at = now() where id = %s',
+            (*updates.values(), row['id']),
+        )
+    for diff in diffs:
+        cur.execute(
+            'insert into public.property_changes (property_id, field, old_value, new_value) values (%s, %s, %s, %s)',
+            (row['id'], diff['field'], Json(diff['old']), Json(diff['new'])),
+        )
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量刷新已保存房源，输出并记录字段变化')
+    parser.add_argument('--api-url', default=os.environ.get('SCRAPE_API_URL', 'http://localhost:8000'))
+    parser.add_argument('--batch-size', type=int, default=100, help='每次请求的房源数（不超过服务端 SCRAPE_REFRESH_MAX_ITEMS）')
+    parser.add_argument('--limit', type=int, default=0, help='最多刷新多少条（最久未刷新的优先），0 为全部')
+    parser.add_argument('--timeout', type=float, default=600, help='单批请求超时（秒）')
+    parser.add_argument('--dry-run', action='store_true', help='只输出变化，不写数据库')
+    args = parser.parse_args()
+
+    from psycopg2.extras import RealDictCursor
+
+    conn = connect()
+    outcomes = Counter()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"""select id, link, refresh_etag, refresh_last_modified, content_hash, {', '.join(FIELDS)}
+                from public.properties
+                where link is not null and link <> '' and listing_status = 'active'
+                order by refreshed_at nulls first"""
+                + (' limit %d' % args.limit if args.limit else '')
+            )
+            rows = cur.fetchall()
+        print(f'待刷新 {len(rows)} 条房源', file=sys.stderr)
+
+        for start in range(0, len(rows), args.batch_size):
+            batch = rows[start:start + args.batch_size]
+            items = [
+                {
+                    'link': row['link'],
+                    'etag': row['refresh_etag'],
+                    'last_modified': row['refresh_last_modified'],
+                    'content_hash': row['content_hash'],
+                    'previous': {f: row[f] for f in FIELDS},
+                }
+                for row in batch
+            ]
+            with conn.cursor() as cur:
+                for line in post_refresh(args.api_url, items, args.timeout):
+                    row = batch[line['index']]
+                    if not line.get('ok'):
+                        outcomes['error'] += 1
+                        print(f"刷新失败 {row['link']}: {line.get('code')} {line.get('error')}", file=sys.stderr)
+                        continue
+                    outcomes[f"{line['status']}:{line['check']}"] += 1
+                    if args.dry_run:
+                        diffs = [{'field': f, **c} for f, c in (line.get('changes') or {}).items()]
+                        if line['status'] == 'gone':
+                            diffs.append({'field': 'listing_status', 'old': 'active', 'new': 'removed'})
+                    else:
+                        diffs = apply_line(cur, row, line)
+                    for diff in diffs:
+                        print(json.dumps({'property_id': str(row['id']), 'link': row['link'], **diff}, ensure_ascii=False))
+            if not args.dry_run:
+                conn.commit()
+    finally:
+        conn.close()
+    print('完成: ' + ', '.join(f'{k}={v}' for k, v in sorted(outcomes.items())), file=sys.stderr)
+    sys.exit(1 if outcomes['error'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+-- 房源增量刷新：定时重新检查 link，记录条件请求校验值、内容哈希与字段变化（web/refresh-listings.py 写入）
+
+alter table public.properties add column if not exists refresh_etag text;
+alter table public.properties add column if not exists refresh_last_modified text;
+alter table public.properties add column if not exists content_hash text;
+alter table public.properties add column if not exists refreshed_at timestamptz;
+alter table public.properties add column if not exists listing_status text not null default 'active'
+  check (listing_status in ('active', 'removed'));
+
+comment on column public.properties.refresh_etag is '上次刷新时 Property Guru 返回的 ETag，下次作为 If-None-Match 发送';
+comment on column public.properties.refresh_last_modified is '上次刷新时返回的 Last-Modified，下次作为 If-Modified-Since 发送';
+comment on column public.properties.content_hash is '房源页面内容哈希（去掉脚本等易变部分），未变化时跳过提取';
+comment on column public.properties.listing_status is 'active 在架；removed 原链接已下架（404/410 或被重定向）';
+
+create index if not exists idx_properties_refreshed_at
+  on public.properties(refreshed_at nulls first)
+  where link is not null;
+
+-- 字段变化记录（如价格调整）
+create table if not exists public.property_changes (
+  id uuid primary key default gen_random_uuid(),
+  property_id uuid not null references public.properties(id) on delete cascade,
+  field text not null,
+  old_value jsonb,
+  new_value jsonb,
+  detected_at timestamptz not null default now()
+);
+
+create index if not exists idx_property_changes_property
+  on public.property_changes(property_id, detected_at desc);
+
+alter table public.property_changes enable row level security;
+
+-- 中介只能查看自己房源的变化（由刷新脚本通过数据库连接写入）
+drop policy if exists "Agents can read own property changes" on public.property_changes;
+create policy "Agents can read own property changes" on public.property_changes
+  for select using (
+    exists (
+      select 1 from public.properties p
+      where p.id = property_changes.property_id and p.agent_id = auth.uid()
+    )
+  );